@@ -0,0 +1,35 @@
+"""
+Tilly Benchmarks
+
+Benchmarks of the training and prediction pipeline on synthetic rooms, run
+from the `ai` directory as modules:
+
+```bash
+python -m benchmarks.run --rooms 50 --days 90 --output base.json
+python -m benchmarks.compare base.json new.json
+python -m benchmarks.gap_filling --rooms 20 --days 365
+python -m benchmarks.dtypes --rooms 100 --days 90
+```
+
+Modules:
+    - synthetic: Generators of synthetic `TrainingTimeslots` data.
+    - run: Times and measures the peak memory of each pipeline stage.
+    - compare: Compares the results of two benchmark runs.
+    - gap_filling: Compares the two implementations of gap filling.
+    - dtypes: Compares the memory of raw and compact room frames.
+"""
+
+import os
+
+# the settings required to import tilly, so the benchmarks also run
+# without the .env file of the app
+for name, value in {
+    "SECRET": "benchmark",
+    "USERS": "[]",
+    "DATABASE_URL": "sqlite:///:memory:",
+    "TRAINING_TABLE": "TRAINING",
+    "PREDICT_TABLE": "PREDICT",
+    "SCORED_TABLE": "SCORED",
+    "SNOWFLAKE_CREDENTIALS": "{}",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,81 @@
+"""
+Benchmark Comparison
+
+Compares the results of two runs of `benchmarks.run`, e.g. before and after
+a change or a dependency upgrade, stage by stage. Stages that got slower
+by more than `--threshold` are flagged, and the exit code is 1 if there
+are any, so the comparison can gate a CI job.
+
+Usage:
+    ```bash
+    cd ai
+    python -m benchmarks.compare base.json new.json --threshold 0.1
+    ```
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def compare(base: dict, new: dict, threshold: float = 0.1) -> list[str]:
+    """Print the change of each stage between two benchmark results.
+
+    Args:
+        base (dict): The results to compare against.
+        new (dict): The new results.
+        threshold (float, optional): Relative slowdown that counts as a
+            regression. Defaults to 0.1.
+
+    Returns:
+        list[str]: The stages that regressed.
+    """
+    if base["meta"]["params"] != new["meta"]["params"]:
+        print("WARNING: the runs used different parameters:")
+        print(f"  base: {base['meta']['params']}")
+        print(f"  new:  {new['meta']['params']}")
+
+    print(
+        f"{'stage':<40} {'base':>9} {'new':>9} {'change':>8}"
+        + f" {'base MiB':>9} {'new MiB':>9}"
+    )
+    regressions = []
+    stages = list(base["stages"]) + [
+        s for s in new["stages"] if s not in base["stages"]
+    ]
+    for stage in stages:
+        before, after = base["stages"].get(stage), new["stages"].get(stage)
+        if before is None or after is None:
+            print(f"{stage:<40} {'only in ' + ('new' if before is None else 'base')}")
+            continue
+
+        change = after["seconds"] / before["seconds"] - 1 if before["seconds"] else 0
+        flag = ""
+        if change > threshold:
+            regressions.append(stage)
+            flag = "  <- slower"
+        print(
+            f"{stage:<40} {before['seconds']:>8.3f}s {after['seconds']:>8.3f}s"
+            + f" {change:>+8.1%} {before.get('peak_mb', float('nan')):>9.1f}"
+            + f" {after.get('peak_mb', float('nan')):>9.1f}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("base", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    base, new = (json.loads(path.read_text()) for path in (args.base, args.new))
+    print(f"base: {base['meta']['commit']} | new: {new['meta']['commit']}")
+    if regressions := compare(base, new, args.threshold):
+        print(f"{len(regressions)} stage(s) slower by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
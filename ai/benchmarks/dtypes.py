@@ -0,0 +1,65 @@
+"""
+Compact Dtypes Benchmark
+
+Compares the memory and featurization time of room frames as returned by
+Snowpark (object strings, float64 sensors, object flags) with the compact
+dtypes of `tilly.database.data.schema`, on synthetic rooms.
+
+Usage:
+    ```bash
+    cd ai
+    python -m benchmarks.dtypes --rooms 100 --days 90
+    ```
+"""
+
+import argparse
+import time
+
+from benchmarks.synthetic import make_timeslots, split_rooms
+from tilly.database.data.schema import compact_rooms
+from tilly.services.ml.transformations import Transformer as T
+
+
+def size_mb(rooms: dict) -> float:
+    return sum(room.memory_usage(deep=True).sum() for room in rooms.values()) / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args()
+
+    raw = {
+        name: room.reset_index(drop=True)
+        for name, room in split_rooms(make_timeslots(args.rooms, args.days)).items()
+    }
+    start = time.perf_counter()
+    compact = compact_rooms(raw)
+    convert = time.perf_counter() - start
+    print(f"{args.rooms} rooms x {args.days} days | compacted in {convert:.3f}s")
+
+    print(f"{'':<12} {'raw':>10} {'compact':>10} {'ratio':>7}")
+    print(
+        f"{'loaded':<12} {size_mb(raw):>8.1f}MB {size_mb(compact):>8.1f}MB "
+        + f"{size_mb(raw) / size_mb(compact):>6.1f}x"
+    )
+
+    featurized, timings = {}, {}
+    for name, rooms in (("raw", raw), ("compact", compact)):
+        start = time.perf_counter()
+        featurized[name] = T.featurize_rooms(rooms)
+        timings[name] = time.perf_counter() - start
+    print(
+        f"{'featurized':<12} {size_mb(featurized['raw']):>8.1f}MB "
+        + f"{size_mb(featurized['compact']):>8.1f}MB "
+        + f"{size_mb(featurized['raw']) / size_mb(featurized['compact']):>6.1f}x"
+    )
+    print(
+        f"{'featurize':<12} {timings['raw']:>9.3f}s {timings['compact']:>9.3f}s "
+        + f"{timings['raw'] / timings['compact']:>6.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
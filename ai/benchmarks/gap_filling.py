@@ -0,0 +1,72 @@
+"""
+Gap Filling Benchmark
+
+Compares the reindex-based `Preprocessor.add_missing_timeslots` with the
+merge-based implementation it replaced (`_merge_missing_timeslots`), on
+synthetic rooms with a year of 15-minute timeslots and random gaps.
+
+Usage:
+    ```bash
+    cd ai
+    python -m benchmarks.gap_filling --rooms 20 --days 365
+    ```
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_timeslots, split_rooms
+from tilly.services.ml.transformations import Transformer as T
+
+
+def best_of(func, repeat: int) -> float:
+    """The fastest of `repeat` runs, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--gap-rate", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    timeslots = make_timeslots(args.rooms, args.days, args.gap_rate)
+    frames = [
+        T.merge_dt(room, date="DATE", time="TIME", name="DATETIME")
+        for room in split_rooms(timeslots).values()
+    ]
+    rooms = pd.concat(frames, ignore_index=True)
+    print(f"{args.rooms} rooms x {args.days} days | {len(rooms):,} rows")
+
+    # the same output, per room and for all rooms at once
+    for frame in frames[:3]:
+        pd.testing.assert_frame_equal(
+            T._merge_missing_timeslots(frame), T.add_missing_timeslots(frame)
+        )
+    pd.testing.assert_frame_equal(
+        T._merge_missing_timeslots(rooms, by="SKOLE_ID"),
+        T.add_missing_timeslots(rooms, by="SKOLE_ID"),
+    )
+
+    cases = {
+        "per room": lambda fill: [fill(frame) for frame in frames],
+        "all rooms": lambda fill: fill(rooms, by="SKOLE_ID"),
+    }
+    print(f"{'case':<10} {'merge':>9} {'reindex':>9} {'speedup':>8}")
+    for case, run in cases.items():
+        merge = best_of(lambda: run(T._merge_missing_timeslots), args.repeat)
+        reindex = best_of(lambda: run(T.add_missing_timeslots), args.repeat)
+        print(f"{case:<10} {merge:>8.3f}s {reindex:>8.3f}s {merge / reindex:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
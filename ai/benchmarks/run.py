@@ -0,0 +1,346 @@
+"""
+Pipeline Benchmark
+
+Times each stage of the training and prediction pipeline on synthetic rooms
+(see `benchmarks.synthetic`), and measures the peak memory allocated by it:
+
+- every step of `Preprocessor.featurize`, on all rooms at once,
+- `Model.fit`, `Model.score`, `Model.predict` and `Model.score_and_predict`,
+  summed over all rooms,
+- `Postprocessor.heuristics_rooms` and `Postprocessor.combine_frames`,
+- `update_dashboard`, on a few rooms, writing to a temporary directory, with
+  and without rendering their plots, and again with all rooms up to date,
+- `room_spec`, rendering the plots of those rooms on demand, and again from
+  the cache.
+
+Each stage is timed `--repeat` times, and the fastest run is kept. The peak
+memory is measured with `tracemalloc` in a separate run, since tracing slows
+the stage down. The results are saved as JSON, to compare runs on two
+commits with `benchmarks.compare`.
+
+Usage:
+    ```bash
+    cd ai
+    python -m benchmarks.run --rooms 20 --days 30 --output base.json
+    ```
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+import scipy
+import sklearn
+
+from benchmarks.synthetic import make_timeslots, split_rooms
+from tilly.config import FEATURES, GIT_METADATA, MODEL_PARAMS
+from tilly.services import dashboard
+from tilly.services.ml.model import Model
+from tilly.services.ml.transformations import Transformer as T
+
+RESULTS_DIR = Path(__file__).parent / "results"
+BY = "SKOLE_ID"
+
+# the steps of `Preprocessor.featurize`, with the same arguments
+PREPROCESS_STAGES: list[tuple[str, Callable[[pd.DataFrame], pd.DataFrame]]] = [
+    ("merge_dt", lambda df: T.merge_dt(df, date="DATE", time="TIME", name="DATETIME")),
+    ("add_missing_timeslots", lambda df: T.add_missing_timeslots(df, by=BY)),
+    (
+        "interpolate_missing_islands",
+        lambda df: T.interpolate_missing_islands(df, target_col="CO2", limit=4, by=BY),
+    ),
+    (
+        "remove_stagnate_intervals",
+        lambda df: T.remove_stagnate_intervals(
+            df, target_col="CO2", threshold=5, by=BY
+        ),
+    ),
+    ("dropna", lambda df: df.dropna(subset=["CO2"])),
+    ("drop_outliers", lambda df: T.drop_outliers(df, bounds={"CO2": (1, 8000)})),
+    ("day_filter", lambda df: T.day_filter(df, min_ratio=0.25, by=BY)),
+    (
+        "apply_time_group_funcs",
+        lambda df: T.apply_time_group_funcs(
+            df,
+            funcs=[
+                (T.gaussian_smooth, dict(metric="CO2", std_dev=2)),
+                (
+                    T.calculate_kinematic_quantities,
+                    dict(metric="CO2_smoothed", window=4, prefix="CO2"),
+                ),
+            ],
+            by=BY,
+        ),
+    ),
+    (
+        "add_time_features",
+        lambda df: T.add_time_features(df, night_start=22, night_end=6),
+    ),
+]
+
+
+def measure(
+    func: Callable[..., Any],
+    setup: Callable[[], tuple] = tuple,
+    repeat: int = 3,
+    memory: bool = True,
+) -> tuple[Any, dict[str, float]]:
+    """Time a function, and measure the peak memory it allocates.
+
+    Args:
+        func (Callable[..., Any]): The function to measure.
+        setup (Callable[[], tuple], optional): Returns the arguments of each
+            call. It is not timed, so it can copy inputs that `func` changes.
+            Defaults to no arguments.
+        repeat (int, optional): Number of timed runs. Defaults to 3.
+        memory (bool, optional): Whether to measure the peak memory.
+            Defaults to True.
+
+    Returns:
+        tuple[Any, dict[str, float]]: The result of the last run, and the
+            fastest and mean run time in seconds and the peak memory in MiB.
+    """
+    timings = []
+    for _ in range(max(repeat, 1)):
+        args = setup()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+
+    stats = {"seconds": min(timings), "mean_seconds": float(np.mean(timings))}
+    if memory:
+        args = setup()
+        gc.collect()
+        tracemalloc.start()
+        func(*args)
+        stats["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, stats
+
+
+def fit_rooms(rooms: dict[str, pd.DataFrame]) -> dict[str, Model]:
+    return {
+        name: Model(
+            estimated_usage=0.3, model_params={**MODEL_PARAMS, "n_jobs": 1}
+        ).fit(X=room[FEATURES])
+        for name, room in rooms.items()
+    }
+
+
+def run(
+    n_rooms: int,
+    days: int,
+    gap_rate: float,
+    stagnant_rate: float,
+    repeat: int = 3,
+    memory: bool = True,
+    dashboard_rooms: int = 5,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """Run the benchmark.
+
+    Args:
+        n_rooms (int): Number of synthetic rooms.
+        days (int): Days of data per room.
+        gap_rate (float): Share of missing timeslots.
+        stagnant_rate (float): Share of timeslots starting a stagnant interval.
+        repeat (int, optional): Timed runs per stage. Defaults to 3.
+        memory (bool, optional): Whether to measure peak memory.
+            Defaults to True.
+        dashboard_rooms (int, optional): Number of rooms to render with
+            `update_dashboard`. Defaults to 5.
+        seed (int, optional): Seed of the generator. Defaults to 0.
+
+    Returns:
+        dict[str, Any]: The metadata of the run and the results per stage.
+    """
+    params = dict(
+        n_rooms=n_rooms,
+        days=days,
+        gap_rate=gap_rate,
+        stagnant_rate=stagnant_rate,
+        repeat=repeat,
+        dashboard_rooms=dashboard_rooms,
+        seed=seed,
+    )
+    timeslots = make_timeslots(n_rooms, days, gap_rate, stagnant_rate, seed)
+    rooms = split_rooms(timeslots)
+    stages: dict[str, dict[str, float]] = {}
+
+    def bench(name: str, func: Callable, setup: Callable[[], tuple] = tuple) -> Any:
+        result, stages[name] = measure(func, setup, repeat=repeat, memory=memory)
+        print(f"{name:<40} {stages[name]['seconds']:>9.3f}s")
+        return result
+
+    # Preprocessing, step by step, on all rooms at once
+    df = pd.concat(rooms.values())
+    for name, step in PREPROCESS_STAGES:
+        df = bench(f"preprocess.{name}", step, lambda df=df: (df,))
+    pd.testing.assert_frame_equal(df, T.featurize(pd.concat(rooms.values()), by=BY))
+
+    featurized = {
+        name: room for name, room in df.groupby(BY, sort=False) if not room.empty
+    }
+
+    # Model, summed over all rooms
+    models = bench("model.fit", fit_rooms, lambda: (featurized,))
+    scores = bench(
+        "model.score",
+        lambda: {
+            name: models[name].score(room[FEATURES])
+            for name, room in featurized.items()
+        },
+    )
+    preds = bench(
+        "model.predict",
+        lambda: {
+            name: models[name].predict(room[FEATURES])
+            for name, room in featurized.items()
+        },
+    )
+    bench(
+        "model.score_and_predict",
+        lambda: {
+            name: models[name].score_and_predict(room[FEATURES])
+            for name, room in featurized.items()
+        },
+    )
+    predicted = {
+        name: room.assign(ANOMALY_SCORE=scores[name], IN_USE=preds[name])
+        for name, room in featurized.items()
+    }
+
+    # Postprocessing
+    scored = bench(
+        "postprocess.heuristics",
+        T.heuristics_rooms,
+        lambda: ({name: room.copy() for name, room in predicted.items()},),
+    )
+    bench("postprocess.combine_frames", T.combine_frames, lambda: (rooms, scored))
+
+    # Dashboard, on a few rooms, written to a temporary directory
+    dirs = dashboard.PLOTS_DIR, dashboard.DASHBOARD_DATA_DIR, dashboard.ASSETS_DIR
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dashboard.PLOTS_DIR = Path(tmp_dir) / "plots"
+        dashboard.DASHBOARD_DATA_DIR = Path(tmp_dir) / "data"
+        dashboard.ASSETS_DIR = Path(tmp_dir) / "assets"
+        try:
+            sample = dict(list(scored.items())[:dashboard_rooms])
+            keys = [dashboard.room_key(room) for room in sample.values()]
+
+            def fresh_plots() -> tuple:
+                shutil.rmtree(tmp_dir)
+                Path(tmp_dir).mkdir()
+                return (sample,)
+
+            def update_dashboard(rooms: dict, prerender: bool = False) -> None:
+                dashboard.update_dashboard(rooms, prerender=prerender)
+
+            bench(
+                "dashboard.update_dashboard.prerender",
+                lambda rooms: update_dashboard(rooms, prerender=True),
+                fresh_plots,
+            )
+            bench("dashboard.update_dashboard", update_dashboard, fresh_plots)
+            # again, with all rooms up to date
+            bench(
+                "dashboard.update_dashboard.unchanged",
+                update_dashboard,
+                lambda: (sample,),
+            )
+
+            # the plots of the stored rooms, rendered on demand and cached
+            def room_specs() -> None:
+                for key in keys:
+                    dashboard.room_spec(*key)
+
+            def cold_cache() -> tuple:
+                dashboard.figure_cache.clear()
+                return ()
+
+            bench("dashboard.room_spec", room_specs, cold_cache)
+            bench("dashboard.room_spec.cached", room_specs)
+        finally:
+            (
+                dashboard.PLOTS_DIR,
+                dashboard.DASHBOARD_DATA_DIR,
+                dashboard.ASSETS_DIR,
+            ) = dirs
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "rows": len(timeslots),
+            "params": params,
+            "versions": {
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "scipy": scipy.__version__,
+                "scikit-learn": sklearn.__version__,
+            },
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "stages": stages,
+    }
+
+
+def git_commit() -> str:
+    """The current git commit, or GIT_METADATA outside of a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return GIT_METADATA
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--gap-rate", type=float, default=0.05)
+    parser.add_argument("--stagnant-rate", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dashboard-rooms", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc")
+    parser.add_argument("--output", type=Path, help="defaults to results/<commit>.json")
+    args = parser.parse_args()
+
+    results = run(
+        args.rooms,
+        args.days,
+        args.gap_rate,
+        args.stagnant_rate,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        dashboard_rooms=args.dashboard_rooms,
+        seed=args.seed,
+    )
+
+    output = args.output or RESULTS_DIR / f"{results['meta']['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Synthetic Room Generator
+
+Generates data shaped like the `TrainingTimeslots` table: one row per room
+and 15-minute timeslot, with the same columns and dtypes as returned by
+`crud.retrieve_data`. The CO2 of each room follows a daily cycle with
+occupied school hours, and the data has the kinds of flaws the
+preprocessing has to deal with:
+
+- gaps: missing timeslots, both scattered and in longer outages,
+- stagnant sensors: intervals where the CO2 value does not change,
+- missing CO2 values and outliers.
+
+Modules:
+    - make_timeslots: Generate a TrainingTimeslots-shaped DataFrame.
+    - split_rooms: Split it into rooms, keyed by SKOLE_ID.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def make_timeslots(
+    n_rooms: int = 20,
+    days: int = 30,
+    gap_rate: float = 0.05,
+    stagnant_rate: float = 0.01,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Generate synthetic training timeslots for a number of rooms.
+
+    Args:
+        n_rooms (int, optional): Number of rooms. Defaults to 20.
+        days (int, optional): Days of data per room. Defaults to 30.
+        gap_rate (float, optional): Share of the timeslots that are missing.
+            A third of it is lost in outages of 2 to 12 hours, the rest is
+            scattered. Defaults to 0.05.
+        stagnant_rate (float, optional): Share of the timeslots that start
+            an interval of 1 to 3 hours where the sensor is stuck.
+            Defaults to 0.01.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: The timeslots of all rooms, ordered by room and time.
+
+    Examples:
+        ```python
+        timeslots = make_timeslots(n_rooms=5, days=7, gap_rate=0.1)
+        rooms = split_rooms(timeslots)
+        ```
+    """
+    rng = np.random.default_rng(seed)
+    timeslots = pd.date_range("2023-01-02", periods=days * 96, freq="15T")
+    frames = []
+
+    for room in range(n_rooms):
+        keep = rng.random(len(timeslots)) >= gap_rate * 2 / 3
+        for start in rng.integers(0, len(timeslots), int(gap_rate * days / 4) + 1):
+            keep[start : start + rng.integers(8, 48)] = False
+        room_timeslots = timeslots[keep]
+        n_rows = len(room_timeslots)
+
+        # occupied on weekdays from 8 to 15, with some rooms empty on some days
+        hours = room_timeslots.hour + room_timeslots.minute / 60
+        weekday = room_timeslots.dayofweek < 5
+        occupied = weekday & (hours >= 8) & (hours < 15) & (rng.random(n_rows) < 0.7)
+        co2 = 420 + occupied * rng.normal(500, 120, n_rows) + rng.normal(0, 15, n_rows)
+        co2 = pd.Series(co2).rolling(4, min_periods=1).mean().to_numpy()
+
+        for start in np.flatnonzero(rng.random(n_rows) < stagnant_rate):
+            co2[start : start + rng.integers(4, 12)] = co2[start]
+        co2[rng.random(n_rows) < 0.02] = np.nan
+        co2[rng.random(n_rows) < 0.002] = 9000
+
+        booked = pd.Series(rng.random(n_rows) < 0.2, dtype=object)
+        booked[rng.random(n_rows) < 0.3] = None
+
+        frames.append(
+            pd.DataFrame(
+                {
+                    "ID": f"{room}.{room % 10}",
+                    "KOMMUNE": f"KOMMUNE_{room % 3}",
+                    "SKOLE": f"SKOLE_{room % 7}",
+                    "DATE": room_timeslots.strftime("%Y-%m-%d"),
+                    "TIME": room_timeslots.strftime("%H:%M:%S"),
+                    "DAYNAME": room_timeslots.day_name(),
+                    "TIDSPUNKT_TYPE": np.where(weekday, "SKOLETID", "FRITID"),
+                    "SKEMALAGT": occupied | (rng.random(n_rows) < 0.05),
+                    "TYPE": "Klasselokale",
+                    "NAVN": f"Lokale {room}",
+                    "CO2": co2,
+                    "TEMP": rng.normal(21, 1, n_rows),
+                    "MOTION": rng.random(n_rows) * occupied,
+                    "IAQ": rng.normal(50, 10, n_rows),
+                    "BOOKET": booked,
+                }
+            )
+        )
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def split_rooms(timeslots: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Split timeslots into rooms keyed by SKOLE_ID, like `crud.retrieve_data`."""
+    timeslots = timeslots.assign(SKOLE_ID=timeslots["SKOLE"] + "_" + timeslots["ID"])
+    return dict(iter(timeslots.groupby("SKOLE_ID", sort=False)))
@@ -0,0 +1,17 @@
+"""
+Test Configuration
+
+Settings required to import tilly, which the tests have no environment for.
+None of them are used by the code under test.
+"""
+
+import os
+
+os.environ.setdefault("SECRET", "test")
+os.environ.setdefault("USERS", "[]")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("TRAINING_TABLE", "TRAINING")
+os.environ.setdefault("PREDICT_TABLE", "PREDICT")
+os.environ.setdefault("SCORED_TABLE", "SCORED")
+os.environ.setdefault("SNOWFLAKE_CREDENTIALS", "{}")
+os.environ.setdefault("METRICS", "False")
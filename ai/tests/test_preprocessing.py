@@ -0,0 +1,100 @@
+"""Tests of the batched featurization of `Preprocessor.featurize_rooms`."""
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import make_timeslots, split_rooms
+from tilly.database.data.schema import compact_rooms
+from tilly.services.ml.transformations import Preprocessor
+from tilly.services.ml.transformations.pushdown import KINEMATIC_COLUMNS
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    """Synthetic rooms (8 rooms, 7 days, seed 5, one room with sparse CO2),
+    and the output of the original per-room `featurize` on each of them,
+    before the preprocessing was batched."""
+    rooms = split_rooms(pd.read_parquet(FIXTURES / "timeslots.parquet"))
+    featurized = pd.read_parquet(FIXTURES / "featurized.parquet")
+    expected = {
+        name: room.reset_index(drop=True)
+        for name, room in featurized.groupby("SKOLE_ID", sort=False)
+    }
+    return rooms, expected
+
+
+def test_featurize_rooms_matches_baseline(baseline):
+    """The batched featurization gives the rows and values of the original
+    implementation. Parquet does not keep the object dtype of the boolean
+    columns, so only the values are compared."""
+    rooms, expected = baseline
+
+    batched = Preprocessor.featurize_rooms(rooms)
+
+    assert list(batched) == list(expected)
+    for name, room in batched.items():
+        pd.testing.assert_frame_equal(
+            room, expected[name], check_dtype=False, rtol=1e-9
+        )
+
+
+def test_featurize_matches_baseline(baseline):
+    rooms, expected = baseline
+
+    for name, room in rooms.items():
+        pd.testing.assert_frame_equal(
+            Preprocessor.featurize(room).reset_index(drop=True),
+            expected[name],
+            check_dtype=False,
+            rtol=1e-9,
+        )
+
+
+def test_featurize_rooms_with_compact_dtypes_matches_baseline(baseline):
+    """Rooms loaded with the compact dtypes (see `crud.stream_data`) give
+    the same rows, timestamps and features as the original implementation."""
+    rooms, expected = baseline
+
+    batched = Preprocessor.featurize_rooms(compact_rooms(rooms))
+
+    columns = ["DATETIME", "CO2", *KINEMATIC_COLUMNS, "is_night"]
+    for name, room in batched.items():
+        pd.testing.assert_frame_equal(
+            room[columns], expected[name][columns], check_dtype=False, rtol=1e-9
+        )
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_featurize_rooms_matches_featurize_per_room(seed):
+    """Featurizing the rooms at once gives the same rooms as featurizing
+    each room on its own, also with gaps and stagnant intervals."""
+    rooms = split_rooms(
+        make_timeslots(n_rooms=6, days=7, gap_rate=0.1, stagnant_rate=0.02, seed=seed)
+    )
+
+    batched = Preprocessor.featurize_rooms(rooms)
+
+    assert list(batched) == list(rooms)
+    for name, room in rooms.items():
+        expected = Preprocessor.featurize(room).reset_index(drop=True)
+        pd.testing.assert_frame_equal(batched[name], expected)
+
+
+def test_featurize_rooms_keeps_empty_rooms():
+    """Rooms without rows are returned as empty DataFrames."""
+    rooms = split_rooms(make_timeslots(n_rooms=2, days=3, seed=0))
+    name = next(iter(rooms))
+    rooms[name] = rooms[name].iloc[:0]
+
+    batched = Preprocessor.featurize_rooms(rooms)
+
+    assert batched[name].empty
+    assert not batched[list(rooms)[1]].empty
+
+
+def test_featurize_rooms_without_rooms():
+    assert Preprocessor.featurize_rooms({}) == {}
@@ -0,0 +1,51 @@
+"""Tests of the local stand-in of the Snowflake featurization plan."""
+
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import make_timeslots, split_rooms
+from tilly.services.ml.transformations import Preprocessor
+from tilly.services.ml.transformations.pushdown import _package_zip, featurize_local
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_featurize_local_matches_featurize_rooms(seed):
+    """The plan of `featurize_table`, run locally, gives the same rooms as
+    `Preprocessor.featurize_rooms`."""
+    timeslots = make_timeslots(
+        n_rooms=4, days=7, gap_rate=0.1, stagnant_rate=0.02, seed=seed
+    )
+    rooms = split_rooms(timeslots)
+    expected = Preprocessor.featurize_rooms(rooms)
+
+    featurized = featurize_local(pd.concat(rooms.values(), ignore_index=True))
+
+    local = dict(list(featurized.groupby("SKOLE_ID", sort=False, observed=True)))
+    for room in expected.values():
+        if room.empty:
+            continue
+        actual = local[room["SKOLE_ID"].iat[0]].reset_index(drop=True)
+        pd.testing.assert_frame_equal(actual[room.columns], room)
+    assert sum(len(room) for room in expected.values()) == len(featurized)
+
+
+def test_udtf_zip_imports_only_the_preprocessing(tmp_path):
+    """The zip uploaded with the UDTFs imports the preprocessing module, and
+    it runs, without the settings, models or API of the tilly package."""
+    room = next(iter(split_rooms(make_timeslots(n_rooms=1, days=2)).values()))
+    room = Preprocessor.merge_dt(room, date="DATE", time="TIME", name="DATETIME")
+    room.to_pickle(tmp_path / "room.pkl")
+    script = f"""
+import sys
+sys.path.insert(0, {str(_package_zip())!r})
+import pandas as pd
+from tilly.services.ml.transformations.preprocessing import Preprocessor
+room = pd.read_pickle({str(tmp_path / "room.pkl")!r})
+assert len(Preprocessor.fill_timeslots(room)) >= len(room)
+assert not {{"sklearn", "joblib", "fastapi", "tilly.config"}} & set(sys.modules)
+"""
+    # isolated, so the tilly package of the repository is not importable
+    subprocess.run([sys.executable, "-I", "-c", script], cwd=tmp_path, check=True)
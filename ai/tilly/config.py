@@ -21,7 +21,21 @@ DB_ECHO = False
 TITLE = "Tilly API"
 DESCRIPTION = "Unsupervised anomaly detection for room usage"
 DEBUG = config("DEBUG", cast=bool, default=False)
+# Collect per-stage pipeline metrics, served at /metrics
+METRICS = config("METRICS", cast=bool, default=True)
 PLOTS_DIR = Path("tilly/dashboard/plots")
+# Number of processes rendering dashboard plots. 0 means all cores
+DASHBOARD_WORKERS = config("DASHBOARD_WORKERS", cast=int, default=0)
+# Most bars in the dashboard plot of a room. 0 plots every timeslot
+DASHBOARD_MAX_POINTS = config("DASHBOARD_MAX_POINTS", cast=int, default=2000)
+# Directory to keep the full resolution data of the dashboard plots in
+DASHBOARD_DATA_DIR = Path(config("DASHBOARD_DATA_DIR", default="tilly/dashboard_data"))
+# Render the plots of all rooms after training, instead of when they are requested
+DASHBOARD_PRERENDER = config("DASHBOARD_PRERENDER", cast=bool, default=False)
+# Most bytes of rendered plots to keep in memory
+DASHBOARD_CACHE_MAX_BYTES = config(
+    "DASHBOARD_CACHE_MAX_BYTES", cast=int, default=256 * 1024**2
+)
 
 
 ################
@@ -38,6 +52,30 @@ SCORED_TABLE_NAME = config("SCORED_TABLE")
 # Columns to output to the scored table
 OUTPUT_COLUMNS = ["ID", "KOMMUNE", "DATE", "TIME", "ANOMALY_SCORE", "IN_USE"]
 
+# Number of rooms to retrieve and process at a time
+ROOMS_PER_BATCH = config("ROOMS_PER_BATCH", cast=int, default=100)
+
+# Load room frames with categoricals, float32 sensor values (except CO2) and
+# nullable flags
+COMPACT_DTYPES = config("COMPACT_DTYPES", cast=bool, default=True)
+
+# Local Parquet cache of the retrieved tables, partitioned by KOMMUNE/SKOLE.
+# Opt-in, since it takes up to DATA_CACHE_MAX_BYTES of disk
+DATA_CACHE = config("DATA_CACHE", cast=bool, default=False)
+DATA_CACHE_DIR = Path(config("DATA_CACHE_DIR", default="tilly/cache"))
+DATA_CACHE_MAX_BYTES = config("DATA_CACHE_MAX_BYTES", cast=int, default=2 * 1024**3)
+
+# Rows per chunk, and concurrent chunk uploads, of `crud.push_data`
+PUSH_CHUNK_ROWS = config("PUSH_CHUNK_ROWS", cast=int, default=50_000)
+PUSH_WORKERS = config("PUSH_WORKERS", cast=int, default=4)
+# Attempts at uploading each chunk before `crud.push_data` gives up
+PUSH_ATTEMPTS = config("PUSH_ATTEMPTS", cast=int, default=3)
+
+# Number of threads scoring batches of rooms while others are fetched and written
+PIPELINE_SCORERS = config("PIPELINE_SCORERS", cast=int, default=2)
+# Number of batches that may wait between two stages of the pipeline
+PIPELINE_QUEUE_SIZE = config("PIPELINE_QUEUE_SIZE", cast=int, default=2)
+
 
 ################
 # snowflake credentials
@@ -45,9 +83,52 @@ OUTPUT_COLUMNS = ["ID", "KOMMUNE", "DATE", "TIME", "ANOMALY_SCORE", "IN_USE"]
 
 SNOWFLAKE_CREDENTIALS = config("SNOWFLAKE_CREDENTIALS", cast=literal_eval)
 
+# Snowpark sessions kept open and shared between requests and jobs
+SESSION_POOL_SIZE = config("SESSION_POOL_SIZE", cast=int, default=4)
+# Seconds a session may sit idle in the pool before it is closed
+SESSION_IDLE_TIMEOUT = config("SESSION_IDLE_TIMEOUT", cast=float, default=30 * 60)
+# Seconds a session may sit idle before it is probed with a query on checkout
+SESSION_PROBE_AFTER = config("SESSION_PROBE_AFTER", cast=float, default=60)
+# Seconds to wait for a session when all of them are in use
+SESSION_WAIT_TIMEOUT = config("SESSION_WAIT_TIMEOUT", cast=float, default=300)
+
 ################
 # MODEL
 ################
 
 MODEL_PARAMS = {"n_estimators": 300, "random_state": 42}
 FEATURES = ["CO2_velocity", "CO2_acceleration", "CO2_smoothed", "is_night", "CO2_log"]
+
+# Featurize all rooms in one batched pass instead of one room at a time
+BATCHED_FEATURIZATION = config("BATCHED_FEATURIZATION", cast=bool, default=True)
+# Featurize the training data in Snowflake, and only transfer featurized rows.
+# Off until the plan of `pushdown.featurize_table` has been run in Snowflake
+FEATURIZE_PUSHDOWN = config("FEATURIZE_PUSHDOWN", cast=bool, default=False)
+
+# Apply the postprocessing heuristics to all rooms at once, on concatenated arrays
+BATCHED_HEURISTICS = config("BATCHED_HEURISTICS", cast=bool, default=True)
+
+# How to fit the room models: "serial", "process", "thread" or "loky"
+FIT_EXECUTOR = config("FIT_EXECUTOR", default="serial")
+# Number of cores available for fitting. 0 means all cores on the machine
+FIT_CORES = config("FIT_CORES", cast=int, default=0)
+
+# Score rooms of up to this many rows with the flattened trees of their model
+# (see services.ml.flat_forest), instead of the per-tree loop of sklearn,
+# which is faster on larger rooms. 0 always uses sklearn
+FLAT_FOREST_MAX_ROWS = config("FLAT_FOREST_MAX_ROWS", cast=int, default=1000)
+
+# How to score the rooms with their models: "serial", "process", "thread" or "loky"
+SCORE_EXECUTOR = config("SCORE_EXECUTOR", default="thread")
+# Number of cores available for scoring. 0 means all cores on the machine
+SCORE_CORES = config("SCORE_CORES", cast=int, default=0)
+# Rows of feature matrices sent to a scoring worker at once
+SCORE_BATCH_ROWS = config("SCORE_BATCH_ROWS", cast=int, default=200_000)
+
+# Directory to persist trained model registries in
+MODEL_STORE_DIR = Path(config("MODEL_STORE_DIR", default="tilly/models"))
+# Number of registry versions to keep on disk
+MODEL_STORE_KEEP = config("MODEL_STORE_KEEP", cast=int, default=3)
+
+# Only refit rooms whose training data changed since the last training
+INCREMENTAL_TRAINING = config("INCREMENTAL_TRAINING", cast=bool, default=False)
@@ -10,8 +10,10 @@ The dashboard module is organized as follows:
 - /dashboard/dashboard.html: The main HTML file that serves as the dashboard
   interface.
 - /dashboard/plots: A subdirectory that holds room-specific data, organized by
-  municipality, school, and room. Note that these .html documents are generated
-  during model training.
+  municipality, school, and room. Note that these .json figure specs are
+  generated during model training.
+- /dashboard/assets: The plotly.js bundle shared by all plots, written by
+  `services.dashboard.write_plotlyjs`.
 - /dashboard/styles.css: The CSS file responsible for styling the dashboard.
 
 ## Dashboard Features
@@ -24,8 +26,8 @@ the municipality, and when navigating between schools, the dashboard will displa
 the first room in the school.
 
 ### Displaying Plots
-The dashboard dynamically loads and displays plots for selected rooms within the
-iframe container. The plots are organized in the /plots directory. Note that the
+The dashboard dynamically fetches the figure spec of the selected room and draws
+it in the plot container. The plots are organized in the /plots directory. Note that the
 dashboard relies on the endpoints in routes/dashboard.py to fetch plot data from
 the server.
 
@@ -0,0 +1,173 @@
+"""
+Data Cache Module
+
+This module contains a local, columnar cache of the tables retrieved from
+Snowflake, so that a table is not downloaded again on every training or
+scoring run when it has not changed. Each table is stored as Parquet files,
+partitioned by municipality and school:
+
+    DATA_CACHE_DIR/
+        <table>/KOMMUNE=<kommune>/SKOLE=<skole>.parquet
+
+Every partition is stored with the probe (row count, latest timeslot and
+hash of its rows) it had in Snowflake when it was fetched, in the metadata
+of its Parquet file. Before a table is read, the probes of all its
+partitions are computed in Snowflake, which is cheap, and only the
+partitions whose probe changed are fetched again (see `crud.stream_data`).
+Partitions that are no longer in the table are deleted, and the least
+recently used partitions are evicted when the cache grows beyond
+DATA_CACHE_MAX_BYTES.
+
+Rows with a NULL KOMMUNE or SKOLE form partitions of their own, with None
+in their key, stored as `KOMMUNE=%NULL` or `SKOLE=%NULL.parquet`, which no
+quoted name can be.
+
+The files are the only state of the cache: the probe lives in the file, and
+the last use is its modification time. Files are written to a temporary
+file and renamed into place, so several workers can share the cache.
+
+Modules:
+    - PartitionCache: The Parquet files of the cache.
+    - data_cache: The global PartitionCache of the application.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+from tilly.config import DATA_CACHE_DIR, DATA_CACHE_MAX_BYTES
+
+PROBE_KEY = b"tilly.probe"
+# Name of a NULL KOMMUNE or SKOLE in the path of a partition
+NULL_NAME = "%NULL"
+
+# a partition of a table: (KOMMUNE, SKOLE), None where the column is NULL
+PartitionKey = tuple[str | None, str | None]
+
+
+class PartitionCache:
+    """Parquet files of table partitions, with a size-bounded LRU policy.
+
+    Attributes:
+        - root (Path): The directory of the cache.
+        - max_bytes (int): The size the cache is evicted down to.
+    """
+
+    def __init__(self, root: Path = DATA_CACHE_DIR, max_bytes=DATA_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def path(self, table_name: str, key: PartitionKey) -> Path:
+        """The file of a partition. Names are quoted to be safe as paths."""
+        kommune, skole = (
+            NULL_NAME if value is None else quote(str(value), safe="") for value in key
+        )
+        return (
+            self.table_dir(table_name) / f"KOMMUNE={kommune}" / f"SKOLE={skole}.parquet"
+        )
+
+    def table_dir(self, table_name: str) -> Path:
+        return self.root / quote(table_name, safe="")
+
+    def stale(
+        self, table_name: str, probes: dict[PartitionKey, dict]
+    ) -> list[PartitionKey]:
+        """The partitions that are not cached, or whose probe changed.
+
+        Only the footers of the cached files are read.
+
+        Args:
+            table_name (str): The name of the table.
+            probes (dict[PartitionKey, dict]): The current probe of each
+                partition, as computed by `crud.probe_partitions`.
+
+        Returns:
+            list[PartitionKey]: The partitions to fetch again.
+        """
+        return [
+            key
+            for key, probe in probes.items()
+            if self._cached_probe(self.path(table_name, key)) != _encode(probe)
+        ]
+
+    def write(
+        self, table_name: str, key: PartitionKey, df: pd.DataFrame, probe: dict
+    ) -> None:
+        """Store a partition, with the probe it was fetched for."""
+        path = self.path(table_name, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), PROBE_KEY: _encode(probe)}
+        )
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def read(self, table_name: str, key: PartitionKey) -> pd.DataFrame | None:
+        """Read a partition, or None if it is not cached. Reading a partition
+        marks it as recently used."""
+        path = self.path(table_name, key)
+        try:
+            df = pq.read_table(path).to_pandas()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return df
+
+    def prune(self, table_name: str, keep: Iterable[PartitionKey]) -> None:
+        """Delete the cached partitions of a table that are not in `keep`,
+        e.g. because they were removed from the table."""
+        keep = {self.path(table_name, key) for key in keep}
+        for path in self.table_dir(table_name).glob("*/*.parquet"):
+            if path not in keep:
+                logger.debug(f"Removing {path} from the data cache")
+                path.unlink(missing_ok=True)
+
+    def evict(self, protect: Iterable[str] = ()) -> None:
+        """Delete the least recently used partitions until the cache is at
+        most `max_bytes`. Partitions of the `protect`ed tables are kept."""
+        protected = [self.table_dir(table_name) for table_name in protect]
+        files = []
+        for path in self.root.glob("*/*/*.parquet"):
+            try:
+                files.append((path.stat(), path))
+            except FileNotFoundError:  # removed by another worker
+                continue
+
+        size = sum(stat.st_size for stat, _ in files)
+        for stat, path in sorted(files, key=lambda file: file[0].st_mtime):
+            if size <= self.max_bytes:
+                break
+            if any(table_dir in path.parents for table_dir in protected):
+                continue
+            logger.debug(f"Evicting {path} from the data cache")
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
+
+    def size(self) -> int:
+        """The size of the cached partitions, in bytes."""
+        return sum(path.stat().st_size for path in self.root.glob("*/*/*.parquet"))
+
+    @staticmethod
+    def _cached_probe(path: Path) -> bytes | None:
+        try:
+            return (pq.read_schema(path).metadata or {}).get(PROBE_KEY)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+
+
+def _encode(probe: dict) -> bytes:
+    """The probe as it is stored in the Parquet metadata."""
+    return json.dumps(probe, sort_keys=True, default=str).encode()
+
+
+data_cache = PartitionCache()
@@ -6,18 +6,203 @@ This module contains functions that handle CRUD
 operations related to the data pipelines of Enformanten.
 """
 
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import Iterable, Iterator
+from uuid import uuid4
 from loguru import logger
+from snowflake.snowpark import functions as F
+from snowflake.snowpark.exceptions import SnowparkSQLException
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import ProgrammingError
 from tenacity import retry, retry_if_exception_type, stop_after_attempt
 import pandas as pd
 
 from tilly.utils.logger import log_size
-from tilly.config import OUTPUT_COLUMNS
-from tilly.database.data.db import refresh_session
+from tilly.config import (
+    COMPACT_DTYPES,
+    DATA_CACHE,
+    OUTPUT_COLUMNS,
+    PUSH_ATTEMPTS,
+    PUSH_CHUNK_ROWS,
+    PUSH_WORKERS,
+    ROOMS_PER_BATCH,
+)
+from tilly.database.data.cache import PartitionKey, data_cache
+from tilly.database.data.db import SessionPool, session_pool
+from tilly.database.data.schema import compact_rooms, expand
+from tilly.services.ml.transformations.pushdown import featurize_table
+
+# errors on which the upload of a chunk is attempted again
+RETRYABLE_ERRORS = (ProgrammingError, SnowparkSQLException)
+# The chunks appended to a table by `push_data`, per run key, are logged
+# in "<table>_PUSH_LOG"
+PUSH_LOG_SUFFIX = "_PUSH_LOG"
+
+
+def room_key():
+    """Snowpark column expression for the unique room identifier, SKOLE_ID,
+    which is built as '<SKOLE>_<ID>' (the same as in `retrieve_data`)."""
+    return F.concat(F.col("SKOLE"), F.lit("_"), F.col("ID"))
+
+
+def snapshot(session: Session) -> str:
+    """The current time in Snowflake, to read a table as of the same point
+    in time in several queries (see `read_table`)."""
+    return str(
+        session.sql(
+            "SELECT TO_VARCHAR(CURRENT_TIMESTAMP(), "
+            + "'YYYY-MM-DD HH24:MI:SS.FF9 TZH:TZM')"
+        ).collect()[0][0]
+    )
+
+
+def read_table(session: Session, table_name: str, at: str | None = None):
+    """Snowpark DataFrame of a table. If `at` is given (see `snapshot`), the
+    table is read as it was at that time, with Snowflake's Time Travel, so
+    rows written in the meantime are not seen. The table must retain its
+    history (DATA_RETENTION_TIME_IN_DAYS) for at least as long as the reads
+    take."""
+    if at is None:
+        return session.table(f'"{table_name}"')
+    return session.sql(
+        f"SELECT * FROM \"{table_name}\" AT(TIMESTAMP => '{at}'::TIMESTAMP_TZ)"
+    )
+
 
+def partition_filter(keys: Iterable[PartitionKey]):
+    """Snowpark column expression selecting the rows of cache partitions
+    (see `tilly.database.data.cache`). Partitions with a NULL KOMMUNE or
+    SKOLE are matched with IS NULL, since NULL never equals a value."""
+    keys = list(keys)
+    named = [
+        f"{kommune}/{skole}" for kommune, skole in keys if None not in (kommune, skole)
+    ]
+    condition = F.lit(False)
+    if named:
+        condition = F.concat(F.col("KOMMUNE"), F.lit("/"), F.col("SKOLE")).isin(named)
+    for key in keys:
+        if None in key:
+            kommune, skole = (
+                F.col(col).is_null() if value is None else F.col(col) == value
+                for col, value in zip(["KOMMUNE", "SKOLE"], key)
+            )
+            condition = condition | (kommune & skole)
+    return condition
 
-def retrieve_data(session: Session, table_name: str) -> dict[str, pd.DataFrame]:
+
+def _fingerprint_columns() -> list:
+    """Aggregates for the fingerprint of a group of rows: the number of
+    rows, the latest timeslot ('DATE TIME') and a hash of all rows."""
+    return [
+        F.count(F.lit(1)).alias("ROWS"),
+        F.max(F.concat_ws(F.lit(" "), F.col("DATE"), F.col("TIME"))).alias(
+            "LAST_TIMESLOT"
+        ),
+        F.sql_expr("HASH_AGG(*)").alias("HASH"),
+    ]
+
+
+def _fingerprint(row) -> dict:
+    """The fingerprint of a group of rows, with JSON types, so it compares
+    equal to the fingerprint stored in a model manifest."""
+    return {
+        "rows": int(row["ROWS"]),
+        "last_timeslot": str(row["LAST_TIMESLOT"]),
+        "hash": int(row["HASH"]),
+    }
+
+
+def retrieve_fingerprints(
+    session: Session, table_name: str, at: str | None = None
+) -> dict[str, dict]:
+    """
+    Retrieve a Fingerprint of the Data of Each Room.
+
+    The fingerprint is computed in Snowflake, so no rows are transferred. It
+    consists of the number of rows, the latest timeslot ('DATE TIME') and an
+    order-independent hash of all rows (HASH_AGG) of each room. If any of the
+    rows of a room are added, removed or changed, its fingerprint changes.
+
+    Args:
+        session (Session): The Snowpark session used to interact with
+            the database.
+        table_name (str): The name of the table to fingerprint.
+        at (str, optional): Fingerprint the table as of this `snapshot`, to
+            match data that is read at the same snapshot. Defaults to now.
+
+    Returns:
+        dict[str, dict]: The fingerprint of each room, keyed by SKOLE_ID.
+
+    Examples:
+        ```python
+        fingerprints = retrieve_fingerprints(session, "YourTableName")
+        fingerprints["School123_Room456"]
+        # {"rows": 8640, "last_timeslot": "2023-10-17 23:45:00", "hash": 81...}
+        ```
+    """
+    logger.debug(f"Retrieving fingerprints from {table_name}")
+
+    rows = (
+        read_table(session, table_name, at)
+        .group_by(room_key().alias("SKOLE_ID"))
+        .agg(*_fingerprint_columns())
+        .collect()
+    )
+    return {row["SKOLE_ID"]: _fingerprint(row) for row in rows}
+
+
+def probe_partitions(
+    session: Session, table_name: str, at: str | None = None
+) -> dict[PartitionKey, dict]:
+    """
+    Probe the Cache Partitions of a Table.
+
+    Like `retrieve_fingerprints`, but per partition of the data cache
+    (KOMMUNE, SKOLE) instead of per room. The probe is computed in Snowflake,
+    so no rows are transferred.
+
+    Args:
+        session (Session): The Snowpark session used to interact with
+            the database.
+        table_name (str): The name of the table to probe.
+        at (str, optional): Probe the table as of this `snapshot`.
+            Defaults to now.
+
+    Returns:
+        dict[PartitionKey, dict]: The probe of each partition, keyed by
+            (KOMMUNE, SKOLE), with None for NULL values.
+    """
+    rows = (
+        read_table(session, table_name, at)
+        .group_by("KOMMUNE", "SKOLE")
+        .agg(*_fingerprint_columns())
+        .collect()
+    )
+    return {(row["KOMMUNE"], row["SKOLE"]): _fingerprint(row) for row in rows}
+
+
+def count_rooms(session: Session, table_name: str) -> int:
+    """
+    Count the Rooms in a Table.
+
+    The count is computed in Snowflake, so no rows are transferred.
+
+    Args:
+        session (Session): The Snowpark session used to interact with
+            the database.
+        table_name (str): The name of the table to count the rooms of.
+
+    Returns:
+        int: The number of distinct rooms (SKOLE_IDs) in the table.
+    """
+    return session.table(f'"{table_name}"').select(room_key()).distinct().count()
+
+
+def retrieve_data(
+    session: Session, table_name: str, rooms: Iterable[str] | None = None
+) -> dict[str, pd.DataFrame]:
     """
     Retrieve Data from a Table and Group by School and Room IDs.
 
@@ -31,6 +216,8 @@ def retrieve_data(session: Session, table_name: str) -> dict[str, pd.DataFrame]:
         session (Session): The SQLAlchemy session used to interact with
             the database.
         table_name (str): The name of the table from which to retrieve data.
+        rooms (Iterable[str], optional): Only retrieve these rooms (SKOLE_IDs).
+            The filter is applied in Snowflake. Defaults to all rooms.
 
     Returns:
         dict[str, pd.DataFrame]: A dictionary where each key is a unique
@@ -61,49 +248,313 @@ def retrieve_data(session: Session, table_name: str) -> dict[str, pd.DataFrame]:
     """
     logger.debug(f"Retrieving data from {table_name}")
 
-    data = {
+    return {
         school_room: df
-        for school_room, df in (
-            session.table(f'"{table_name}"')
-            .to_pandas()
-            .assign(SKOLE_ID=lambda d: d.SKOLE + "_" + d.ID)
-            .pipe(log_size)
-            .rename(str, axis="columns")
-            .groupby("SKOLE_ID")
-        )
+        for batch in stream_data(session, table_name, rooms=rooms)
+        for school_room, df in batch.items()
     }
-    return data
 
 
-@retry(
-    stop=stop_after_attempt(3),
-    retry=retry_if_exception_type(ProgrammingError),
-    retry_error_callback=refresh_session,
-)
-def push_data(rooms: pd.DataFrame, table_name: str, session: Session) -> None:
+def stream_data(
+    session: Session,
+    table_name: str,
+    rooms: Iterable[str] | None = None,
+    rooms_per_batch: int = ROOMS_PER_BATCH,
+    use_cache: bool = DATA_CACHE,
+    compact: bool = COMPACT_DTYPES,
+    at: str | None = None,
+) -> Iterator[dict[str, pd.DataFrame]]:
+    """
+    Stream Data from a Table in Batches of Rooms.
+
+    The table is read ordered by room (SKOLE_ID), DATE and TIME with Snowpark's
+    `to_pandas_batches`, so only one result chunk is held in memory at a time,
+    instead of the full table. Chunks are cut at room boundaries, and the
+    rooms are yielded in batches of (at most) `rooms_per_batch` rooms, in the
+    same format as `retrieve_data`. Every room is yielded exactly once, with
+    all of its rows, even if it spans several result chunks.
+
+    With `use_cache`, the table is read from the local data cache instead,
+    one partition (school) at a time, after fetching the partitions that
+    changed since they were cached (see `tilly.database.data.cache`).
+
+    With `compact`, the rooms of each batch are converted to the compact
+    dtypes of `tilly.database.data.schema`, and get their DATETIME.
+
+    Args:
+        session (Session): The Snowpark session used to interact with
+            the database.
+        table_name (str): The name of the table from which to retrieve data.
+        rooms (Iterable[str], optional): Only retrieve these rooms (SKOLE_IDs).
+            The filter is applied in Snowflake. Defaults to all rooms.
+        rooms_per_batch (int, optional): Maximum number of rooms per batch.
+            Defaults to ROOMS_PER_BATCH.
+        use_cache (bool, optional): Read the table through the data cache.
+            Defaults to DATA_CACHE.
+        compact (bool, optional): Convert the rooms to compact dtypes.
+            Defaults to COMPACT_DTYPES.
+        at (str, optional): Read the table as of this `snapshot`, e.g. the
+            one its fingerprints were taken at. Defaults to now.
+
+    Yields:
+        dict[str, pd.DataFrame]: A batch of rooms, keyed by SKOLE_ID.
+
+    Examples:
+        ```python
+        for rooms in stream_data(session, "YourTableName", rooms_per_batch=50):
+            scored_rooms = model_registry.predict(rooms)
+        ```
+    """
+    logger.debug(f"Streaming data from {table_name}")
+
+    if rooms is not None and not (rooms := list(rooms)):
+        return
+
+    if use_cache:
+        chunks = _cached_chunks(session, table_name, rooms, at)
+    else:
+        table = read_table(session, table_name, at)
+        if rooms is not None:
+            table = table.filter(room_key().isin(rooms))
+        chunks = (
+            table.with_column("SKOLE_ID", room_key())
+            .sort("SKOLE_ID", "DATE", "TIME")
+            .to_pandas_batches()
+        )
+
+    for batch in _batch_rooms(chunks, rooms_per_batch):
+        yield compact_rooms(batch) if compact else batch
+
+
+def stream_featurized(
+    session: Session,
+    table_name: str,
+    rooms: Iterable[str] | None = None,
+    rooms_per_batch: int = ROOMS_PER_BATCH,
+    compact: bool = COMPACT_DTYPES,
+    at: str | None = None,
+) -> Iterator[dict[str, pd.DataFrame]]:
+    """
+    Stream Featurized Data from a Table in Batches of Rooms.
+
+    Like `stream_data`, but the rows are featurized in Snowflake (see
+    `tilly.services.ml.transformations.pushdown`), so only the featurized
+    rows that are left after preprocessing are transferred. The rooms are
+    the same as `Preprocessor.featurize_rooms` on the output of
+    `stream_data`, except that rooms without any rows left are not yielded.
+
+    Args:
+        session (Session): The Snowpark session used to interact with
+            the database.
+        table_name (str): The name of the table from which to retrieve data.
+        rooms (Iterable[str], optional): Only retrieve these rooms (SKOLE_IDs).
+            Defaults to all rooms.
+        rooms_per_batch (int, optional): Maximum number of rooms per batch.
+            Defaults to ROOMS_PER_BATCH.
+        compact (bool, optional): Convert the rooms to compact dtypes.
+            Defaults to COMPACT_DTYPES.
+        at (str, optional): Read the table as of this `snapshot`.
+            Defaults to now.
+
+    Yields:
+        dict[str, pd.DataFrame]: A batch of featurized rooms, keyed by SKOLE_ID.
+    """
+    logger.debug(f"Streaming featurized data from {table_name}")
+
+    if rooms is not None and not (rooms := list(rooms)):
+        return
+
+    table = read_table(session, table_name, at)
+    if rooms is not None:
+        table = table.filter(room_key().isin(rooms))
+    chunks = featurize_table(table.with_column("SKOLE_ID", room_key()))
+
+    for batch in _batch_rooms(chunks.to_pandas_batches(), rooms_per_batch):
+        batch = {name: room.reset_index(drop=True) for name, room in batch.items()}
+        yield compact_rooms(batch) if compact else batch
+
+
+def _batch_rooms(
+    chunks: Iterable[pd.DataFrame], rooms_per_batch: int
+) -> Iterator[dict[str, pd.DataFrame]]:
+    """Cut chunks of rows, ordered by room, into batches of whole rooms."""
+    batch: dict[str, pd.DataFrame] = {}
+    unfinished = None  # rows of the last room in the chunk, which may continue
+    for chunk in chunks:
+        chunk = chunk.rename(str, axis="columns").pipe(log_size)
+        if chunk.empty:
+            continue
+        if unfinished is not None:
+            chunk = pd.concat([unfinished, chunk], ignore_index=True)
+
+        is_last_room = chunk["SKOLE_ID"].eq(chunk["SKOLE_ID"].iat[-1]).to_numpy()
+        unfinished = chunk[is_last_room]
+
+        for school_room, df in chunk[~is_last_room].groupby("SKOLE_ID", sort=False):
+            batch[school_room] = df
+            if len(batch) >= rooms_per_batch:
+                yield batch
+                batch = {}
+
+    if unfinished is not None and not unfinished.empty:
+        batch[unfinished["SKOLE_ID"].iat[0]] = unfinished
+    if batch:
+        yield batch
+
+
+def _cached_chunks(
+    session: Session,
+    table_name: str,
+    rooms: list[str] | None = None,
+    at: str | None = None,
+) -> Iterator[pd.DataFrame]:
+    """Yield the schools of a table from the data cache, ordered by room,
+    after fetching the partitions that are missing or changed.
+
+    A room (SKOLE_ID) does not include its KOMMUNE, so a school of the same
+    name in several municipalities has its rooms in several partitions.
+    The partitions of a school are therefore read together, and yielded as
+    one chunk, so that each room is yielded once, with all of its rows, as
+    it is without the cache."""
+    probes = probe_partitions(session, table_name, at)
+    data_cache.prune(table_name, keep=probes)
+
+    # by school, then municipality, with NULL partitions last, as Snowflake
+    # sorts them
+    keys = sorted(
+        probes, key=lambda key: [(v is None, v or "") for v in (key[1], key[0])]
+    )
+    if rooms is not None:
+        # a room (SKOLE_ID) is '<SKOLE>_<ID>', and SKOLE may contain '_' too
+        schools = {
+            room.rsplit("_", n)[0]
+            for room in rooms
+            for n in range(1, room.count("_") + 1)
+        }
+        keys = [key for key in keys if key[1] in schools]
+
+    if stale := data_cache.stale(table_name, {key: probes[key] for key in keys}):
+        logger.info(
+            f"Data cache | fetching {len(stale)} of {len(keys)} partitions "
+            + f"of {table_name}"
+        )
+        _fetch_partitions(session, table_name, stale, probes, at)
+        data_cache.evict(protect=[table_name])
+
+    try:
+        for _, school_keys in groupby(keys, key=lambda key: key[1]):
+            partitions = [data_cache.read(table_name, key) for key in school_keys]
+            partitions = [part for part in partitions if part is not None]
+            if not partitions:
+                continue
+            school = pd.concat(partitions, ignore_index=True)
+            if rooms is not None:
+                school = school[school["SKOLE_ID"].isin(rooms)]
+            yield school.sort_values(["SKOLE_ID", "DATE", "TIME"], kind="stable")
+    finally:
+        data_cache.evict()
+
+
+def _fetch_partitions(
+    session: Session,
+    table_name: str,
+    keys: list[PartitionKey],
+    probes: dict[PartitionKey, dict],
+    at: str | None = None,
+) -> None:
+    """Fetch partitions of a table from Snowflake into the data cache.
+
+    The rows are streamed ordered by partition, so only one partition is
+    held in memory at a time. They are read at the same snapshot `at` as
+    their probes, so the cached rows always match their probe."""
+    chunks = (
+        read_table(session, table_name, at)
+        .filter(partition_filter(keys))
+        .with_column("SKOLE_ID", room_key())
+        .sort("KOMMUNE", "SKOLE", "SKOLE_ID", "DATE", "TIME")
+        .to_pandas_batches()
+    )
+
+    current, parts = None, []
+    for chunk in chunks:
+        chunk = chunk.rename(str, axis="columns")
+        # NULL KOMMUNE or SKOLE are partitions of their own, keyed by None
+        for key, part in chunk.groupby(["KOMMUNE", "SKOLE"], sort=False, dropna=False):
+            key = tuple(None if pd.isna(value) else value for value in key)
+            if key != current and parts:
+                data_cache.write(
+                    table_name,
+                    current,
+                    pd.concat(parts, ignore_index=True),
+                    probes[current],
+                )
+                parts = []
+            current = key
+            parts.append(part)
+    if parts:
+        data_cache.write(
+            table_name, current, pd.concat(parts, ignore_index=True), probes[current]
+        )
+
+
+def push_data(
+    rooms: pd.DataFrame,
+    table_name: str,
+    session: Session,
+    run_key: str | None = None,
+    chunk_rows: int = PUSH_CHUNK_ROWS,
+    max_workers: int = PUSH_WORKERS,
+) -> None:
     """
     Push Data to a Snowflake Table.
 
-    This function pushes a DataFrame to a specified Snowflake table.
-    If the operation fails due to a ProgrammingError, the function
-    will attempt to retry the operation with a new session.
+    This function appends a DataFrame to a specified Snowflake table, in
+    three steps:
+
+    1. The rows are split into chunks of at most `chunk_rows` rows, which
+       are uploaded to a staging table named after `run_key`. With more
+       than one worker, the chunks are uploaded concurrently, each on a
+       session borrowed from the session pool, since a Snowpark session
+       must not be used by several threads at once.
+    2. Chunks that fail with a ProgrammingError are uploaded again, up to
+       PUSH_ATTEMPTS times. Chunks that were already uploaded are not sent
+       again.
+    3. The staged chunks are appended to the table, and logged as pushed
+       for `run_key` in "<table>_PUSH_LOG", in a single statement. Then the
+       staging table is dropped.
+
+    The rows are appended, as they always were: rows of timeslots that are
+    already in the table are not updated. Pushing again with the same
+    `run_key`, e.g. when a push is retried after an error, skips the chunks
+    that the log records as pushed, so they are not duplicated. Without a
+    `run_key`, every push is a new run.
 
     Args:
         rooms (pd.DataFrame): The DataFrame containing the data to push.
         table_name (str): The name of the Snowflake table to which data
             should be pushed.
-        session (Session): The SQLAlchemy session used for the operation.
+        session (Session): The Snowpark session used for the operation. It
+            must not be in use by another thread during the push.
+        run_key (str, optional): Key of the push, naming its staging table
+            and its entries in the push log. Letters, digits and underscores.
+            Defaults to a new random key.
+        chunk_rows (int, optional): Maximum rows per uploaded chunk.
+            Defaults to PUSH_CHUNK_ROWS.
+        max_workers (int, optional): Number of concurrent uploads, at most
+            one per session of the pool. Defaults to PUSH_WORKERS.
 
     Returns:
         None
 
+    Raises:
+        ProgrammingError: If a chunk still fails after PUSH_ATTEMPTS attempts.
+            Nothing is written to the table in that case.
+        ValueError: If `run_key` has other characters.
+
     Examples:
         ```python
         import pandas as pd
-        from sqlalchemy.orm import Session
-
-        # Initialize SQLAlchemy session
-        session = Session()
+        from tilly.database.data.db import session_scope
 
         # Example DataFrame
         # (See OUTPUT_COLUMNS constant in tilly.config for the
@@ -113,22 +564,139 @@ def push_data(rooms: pd.DataFrame, table_name: str, session: Session) -> None:
             'Column2': ['a', 'b', 'c'],
         })
 
-        # Example table name
-        table_name = "YourSnowflakeTable"
-
         # Push data to Snowflake table
-        push_data(rooms, table_name, session)
+        with session_scope() as session:
+            push_data(rooms, "YourSnowflakeTable", session)
         ```
     """
+    if rooms.empty:
+        return
+    run_key = run_key or uuid4().hex
+    if not re.fullmatch(r"\w+", run_key, re.ASCII):
+        raise ValueError(f"Invalid run key: {run_key!r}")
+    staging_table = f"{table_name}_STAGING_{run_key.upper()}"
+    log_table = f"{table_name}{PUSH_LOG_SUFFIX}"
+    output = expand(rooms[OUTPUT_COLUMNS])
+    chunks = {
+        i: output.iloc[start : start + chunk_rows].assign(PUSH_CHUNK=i)
+        for i, start in enumerate(range(0, len(rooms), max(chunk_rows, 1)))
+    }
+
+    session.sql(
+        f'CREATE TABLE IF NOT EXISTS "{log_table}" (RUN_KEY VARCHAR, '
+        + "CHUNK INTEGER, N_ROWS INTEGER, "
+        + "PUSHED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP())"
+    ).collect()
+    pushed = _pushed_chunks(session, log_table, run_key)
+    chunks = {i: chunk for i, chunk in chunks.items() if i not in pushed}
+    if not chunks:
+        logger.debug(f"All chunks of run {run_key} are already in {table_name}")
+        return
+    logger.debug(
+        f"Sending {sum(map(len, chunks.values()))} rows to {table_name} in "
+        + f"{len(chunks)} chunks (run {run_key}) .."
+    )
+
+    session.sql(
+        f'CREATE OR REPLACE TRANSIENT TABLE "{staging_table}" LIKE "{table_name}"'
+    ).collect()
+    session.sql(
+        f'ALTER TABLE "{staging_table}" '
+        + "ADD COLUMN PUSH_CHUNK INTEGER, PUSH_ATTEMPT INTEGER"
+    ).collect()
     try:
-        logger.debug(f"Sending {rooms.shape[0]} rows to {table_name} ..")
-        session.write_pandas(
-            rooms[OUTPUT_COLUMNS],
-            f'"{table_name}"',
-            overwrite=False,
-            quote_identifiers=False,
+        _upload_chunks(chunks, staging_table, session, max_workers)
+        _append_staged(session, staging_table, table_name, log_table, run_key)
+    finally:
+        session.sql(f'DROP TABLE IF EXISTS "{staging_table}"').collect()
+
+
+def _pushed_chunks(session: Session, log_table: str, run_key: str) -> set[int]:
+    """The chunks of a run that the push log records as appended."""
+    rows = session.sql(
+        f"SELECT CHUNK FROM \"{log_table}\" WHERE RUN_KEY = '{run_key}'"
+    ).collect()
+    return {row["CHUNK"] for row in rows}
+
+
+def _upload_chunks(
+    chunks: dict[int, pd.DataFrame],
+    table_name: str,
+    session: Session,
+    max_workers: int,
+    pool: SessionPool = session_pool,
+) -> None:
+    """Upload chunks, retrying only the ones that failed. The rows are
+    uploaded with the attempt that uploaded them, so a chunk that was
+    uploaded, but reported as failed, is only appended once.
+
+    With one worker, the chunks are uploaded one at a time on `session`.
+    Otherwise every upload borrows a session of its own from `pool`, and
+    the pool bounds the number of concurrent uploads."""
+
+    def upload(chunk: pd.DataFrame, attempt: int) -> None:
+        if max_workers <= 1:
+            _write_chunk(session, chunk, table_name, attempt)
+            return
+        with pool.session() as worker_session:
+            _write_chunk(worker_session, chunk, table_name, attempt)
+
+    pending = list(chunks)
+    for attempt in range(1, PUSH_ATTEMPTS + 1):
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+            futures = {i: executor.submit(upload, chunks[i], attempt) for i in pending}
+        errors = {}
+        for i, future in futures.items():
+            try:
+                future.result()
+            except RETRYABLE_ERRORS as e:
+                errors[i] = e
+        if not errors:
+            return
+        pending = list(errors)
+        logger.debug(
+            f"{len(pending)} of {len(chunks)} chunks failed "
+            + f"(attempt {attempt}/{PUSH_ATTEMPTS}): {next(iter(errors.values()))}"
         )
-    except ProgrammingError as e:
-        logger.debug(f"{e} - Retrying with new session ..")
-        session.close()  # Explicitly close the session then raise error for retry
-        raise e
+    raise next(iter(errors.values()))
+
+
+def _write_chunk(
+    session: Session, chunk: pd.DataFrame, table_name: str, attempt: int
+) -> None:
+    session.write_pandas(
+        chunk.assign(PUSH_ATTEMPT=attempt),
+        f'"{table_name}"',
+        overwrite=False,
+        quote_identifiers=False,
+    )
+
+
+@retry(
+    stop=stop_after_attempt(PUSH_ATTEMPTS),
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    reraise=True,
+)
+def _append_staged(
+    session: Session, staging_table: str, table_name: str, log_table: str, run_key: str
+) -> None:
+    """Append the staged chunks to a table, and log them as pushed.
+
+    The rows and the log entries are inserted by a single multi-table
+    INSERT, so either both or neither are written. Of a chunk uploaded more
+    than once, only the rows of its first upload are appended, and chunks
+    already logged for the run are skipped, so the append is safe to retry."""
+    columns = ", ".join(OUTPUT_COLUMNS)
+    session.sql(
+        f'INSERT ALL WHEN 1 = 1 THEN INTO "{table_name}" ({columns}) '
+        + f"VALUES ({columns}) "
+        + f'WHEN CHUNK_ROW = 1 THEN INTO "{log_table}" (RUN_KEY, CHUNK, N_ROWS) '
+        + f"VALUES ('{run_key}', PUSH_CHUNK, CHUNK_ROWS) "
+        + f"SELECT {columns}, PUSH_CHUNK, "
+        + "ROW_NUMBER() OVER (PARTITION BY PUSH_CHUNK ORDER BY PUSH_CHUNK) "
+        + "AS CHUNK_ROW, COUNT(*) OVER (PARTITION BY PUSH_CHUNK) AS CHUNK_ROWS "
+        + f'FROM (SELECT * FROM "{staging_table}" '
+        + "QUALIFY PUSH_ATTEMPT = MIN(PUSH_ATTEMPT) OVER (PARTITION BY PUSH_CHUNK)) "
+        + f'WHERE PUSH_CHUNK NOT IN (SELECT CHUNK FROM "{log_table}" '
+        + f"WHERE RUN_KEY = '{run_key}')"
+    ).collect()
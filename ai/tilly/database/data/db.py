@@ -4,11 +4,202 @@ Snowflake Database Connection Script
 This module contains functions for establishing and managing connections
 to a Snowflake database. It relies on the `snowflake.snowpark` package
 to handle the actual database operations.
+
+Creating a Snowpark session logs in to Snowflake, which takes seconds, so
+sessions are kept open in a pool (`SessionPool`) and reused by requests and
+background jobs:
+
+- At most SESSION_POOL_SIZE sessions are open at a time. When all of them
+  are in use, callers wait up to SESSION_WAIT_TIMEOUT seconds for one.
+- Sessions idle for more than SESSION_IDLE_TIMEOUT seconds are closed, so
+  the pool does not keep sessions that Snowflake may have expired.
+- Sessions idle for more than SESSION_PROBE_AFTER seconds, or returned
+  after an error, are probed with `SELECT 1` on checkout, and replaced
+  with a new session if the probe fails.
+
+Modules:
+    - SessionPool: A pool of Snowpark sessions.
+    - session_pool: The global SessionPool of the application.
+    - session_scope: Borrow a session for the duration of a 'with' block.
+    - get_session: Borrow a session for a request (FastAPI dependency).
 """
 
-from typing import Generator
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+from typing import Callable, Generator
+
+from loguru import logger
 from snowflake.snowpark import Session
-from tilly.config import SNOWFLAKE_CREDENTIALS
+
+from tilly.config import (
+    SESSION_IDLE_TIMEOUT,
+    SESSION_POOL_SIZE,
+    SESSION_PROBE_AFTER,
+    SESSION_WAIT_TIMEOUT,
+    SNOWFLAKE_CREDENTIALS,
+)
+
+
+def create_session() -> Session:
+    """Log in to Snowflake with a new Snowpark session."""
+    return Session.builder.configs(SNOWFLAKE_CREDENTIALS).create()
+
+
+class SessionPool:
+    """A pool of Snowpark sessions, with health checks.
+
+    Idle sessions are kept last-in first-out, so that under low load the
+    same few sessions are reused and the others expire.
+
+    Attributes:
+        - size (int): The maximum number of open sessions.
+        - idle_timeout (float): Seconds after which idle sessions are closed.
+        - probe_after (float): Seconds of idleness after which sessions are
+            probed on checkout.
+        - wait_timeout (float): Seconds to wait for a session when all of
+            them are in use.
+    """
+
+    def __init__(
+        self,
+        size: int = SESSION_POOL_SIZE,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        probe_after: float = SESSION_PROBE_AFTER,
+        wait_timeout: float = SESSION_WAIT_TIMEOUT,
+        factory: Callable[[], Session] = create_session,
+    ):
+        self.size = max(size, 1)
+        self.idle_timeout = idle_timeout
+        self.probe_after = probe_after
+        self.wait_timeout = wait_timeout
+        self.factory = factory
+        # (session, last used, healthy), oldest on the left
+        self._idle: deque[tuple[Session, float, bool]] = deque()
+        self._open = 0
+        self._condition = Condition()
+
+    def acquire(self) -> Session:
+        """Borrow a healthy session, creating one if none is idle.
+
+        Raises:
+            TimeoutError: If no session is returned to the pool within
+                `wait_timeout` seconds.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._condition:
+                self._expire_idle()
+                while not self._idle and self._open >= self.size:
+                    if not self._condition.wait(deadline - time.monotonic()):
+                        raise TimeoutError(
+                            f"No Snowflake session available after {self.wait_timeout}s"
+                        )
+                    self._expire_idle()
+                if self._idle:
+                    session, last_used, healthy = self._idle.pop()
+                else:
+                    session = None
+                    self._open += 1
+
+            if session is None:
+                try:
+                    logger.debug("Creating a new Snowflake session ..")
+                    return self.factory()
+                except BaseException:
+                    self._forget()
+                    raise
+
+            idle = time.monotonic() - last_used
+            if (healthy and idle <= self.probe_after) or self._probe(session):
+                return session
+            logger.debug("Replacing an expired Snowflake session ..")
+            self._close(session)
+
+    def release(self, session: Session, healthy: bool = True) -> None:
+        """Return a session to the pool. Sessions that may be broken are
+        probed before they are handed out again."""
+        with self._condition:
+            self._idle.append((session, time.monotonic(), healthy))
+            self._condition.notify()
+
+    @contextmanager
+    def session(self) -> Generator[Session, None, None]:
+        """Borrow a session for the duration of a 'with' block."""
+        session = self.acquire()
+        try:
+            yield session
+        except BaseException:
+            self.release(session, healthy=False)
+            raise
+        else:
+            self.release(session)
+
+    def close(self) -> None:
+        """Close all idle sessions, e.g. on shutdown."""
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+        for session, *_ in idle:
+            self._close(session)
+
+    def _expire_idle(self) -> None:
+        """Close the sessions idle for more than `idle_timeout`. Must be
+        called with the lock held."""
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            session, *_ = self._idle.popleft()
+            self._open -= 1
+            self._close_quietly(session)
+            self._condition.notify()
+
+    def _forget(self) -> None:
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    def _close(self, session: Session) -> None:
+        self._close_quietly(session)
+        self._forget()
+
+    @staticmethod
+    def _close_quietly(session: Session) -> None:
+        try:
+            session.close()
+        except Exception as e:
+            logger.debug(f"Error closing a Snowflake session: {e}")
+
+    @staticmethod
+    def _probe(session: Session) -> bool:
+        try:
+            session.sql("SELECT 1").collect()
+            return True
+        except Exception as e:
+            logger.debug(f"Snowflake session probe failed: {e}")
+            return False
+
+
+session_pool = SessionPool()
+
+
+@contextmanager
+def session_scope() -> Generator[Session, None, None]:
+    """
+    Borrow a Snowflake Session for the Duration of a 'with' Block.
+
+    Unlike `get_session`, which is meant for FastAPI's dependency injection,
+    and whose session is returned once the request is done, this is meant for
+    work that outlives a request, such as background jobs. The session is
+    borrowed from the session pool, and must not be closed by the caller.
+
+    Examples:
+        ```python
+        with session_scope() as session:
+            prediction_flow(session, get_current_registry())
+        ```
+    """
+    with session_pool.session() as session:
+        yield session
 
 
 def get_session() -> Generator[Session, None, None]:
@@ -16,13 +207,13 @@ def get_session() -> Generator[Session, None, None]:
     Get a Snowflake Session for Database Interactions.
 
     This function yields a Snowflake session for interacting with the
-    Snowflake database. The session is yielded as a generator and
-    should be used within a 'with' context to ensure
-    that resources are managed appropriately.
+    Snowflake database, borrowed from the session pool. The session is
+    yielded as a generator and should be used within a 'with' context to
+    ensure that resources are managed appropriately.
 
     Yields:
         Generator[Session, None, None]: A generator yielding a Snowflake
-            session object. The session is automatically closed when exiting
+            session object. The session is returned to the pool when exiting
             the 'with' context.
 
     Examples:
@@ -34,19 +225,8 @@ def get_session() -> Generator[Session, None, None]:
             # Replace 'MyTable' and 'column_name' with actual table and column
             result = session.query(MyTable).filter_by(column_name='value').all()
 
-        # The session is automatically closed when the 'with' block is exited.
+        # The session is returned to the pool when the 'with' block is exited.
         ```
     """
-    with Session.builder.configs(SNOWFLAKE_CREDENTIALS).create() as session:
+    with session_scope() as session:
         yield session
-
-
-def refresh_session(retry_state):
-    """Create a new Snowflake session if an error occurs.
-    using tenacity's before_retry hook"""
-    old_session = retry_state.kwargs.get("session")
-    if old_session:
-        old_session.close()  # Explicitly close the old session
-
-    with get_session() as new_session:
-        retry_state.kwargs["session"] = new_session
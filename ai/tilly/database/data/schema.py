@@ -0,0 +1,105 @@
+"""
+Room Frame Schema Module
+
+This module contains the compact dtypes of the room frames retrieved from
+Snowflake. Snowpark returns the text, date and time columns as Python
+objects, and the sensor columns as float64, so every room frame repeats the
+same strings thousands of times. At load time (see `crud.stream_data`), the
+columns are converted to:
+
+- categoricals, for the identifiers and other repeated values, including
+  DATE and TIME,
+- float32, for the sensor values TEMP, MOTION and IAQ. CO2 is kept as
+  float64, since the features and the models are computed from it, and
+  rounding it to float32 changes which intervals are stagnant and the
+  anomaly scores,
+- nullable booleans, for the SKEMALAGT and BOOKET flags,
+
+and the DATETIME of each row is built once, from the distinct dates and
+times, instead of by parsing a string per row in `Preprocessor.merge_dt`.
+
+The rooms of a batch share the categories of each column, so they can be
+concatenated (as `Preprocessor.featurize_rooms` does) without falling back
+to object columns. Before data is written back to Snowflake, the columns are
+converted back to plain dtypes with `expand`.
+
+Modules:
+    - compact: Convert a DataFrame to the compact dtypes.
+    - compact_rooms: Convert a batch of rooms, with shared categories.
+    - expand: Convert categorical columns back to their values.
+"""
+
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLUMNS = [
+    "ID",
+    "KOMMUNE",
+    "SKOLE",
+    "SKOLE_ID",
+    "DATE",
+    "TIME",
+    "DAYNAME",
+    "TIDSPUNKT_TYPE",
+    "TYPE",
+    "NAVN",
+]
+FLOAT32_COLUMNS = ["TEMP", "MOTION", "IAQ"]
+FLAG_COLUMNS = ["SKEMALAGT", "BOOKET"]
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert a DataFrame to the compact dtypes, and add its DATETIME.
+
+    Args:
+        df (pd.DataFrame): The timeslots, as returned by Snowpark.
+
+    Returns:
+        pd.DataFrame: The timeslots with compact dtypes.
+    """
+    dtypes = {col: "category" for col in CATEGORICAL_COLUMNS if col in df.columns}
+    dtypes.update({col: "float32" for col in FLOAT32_COLUMNS if col in df.columns})
+    dtypes.update({col: "boolean" for col in FLAG_COLUMNS if col in df.columns})
+    df = df.astype(dtypes)
+
+    if "DATETIME" not in df.columns and {"DATE", "TIME"} <= set(df.columns):
+        df["DATETIME"] = datetimes(df["DATE"], df["TIME"])
+    return df
+
+
+def compact_rooms(rooms: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    """Convert a batch of rooms to the compact dtypes. The batch is converted
+    at once, so the rooms share the categories of each column."""
+    if not rooms:
+        return {}
+    batch = compact(pd.concat(rooms.values(), ignore_index=True))
+    ends = np.cumsum([len(room) for room in rooms.values()])
+    return {
+        name: batch.iloc[end - len(room) : end].reset_index(drop=True)
+        for (name, room), end in zip(rooms.items(), ends)
+    }
+
+
+def datetimes(date: pd.Series, time: pd.Series) -> pd.Series:
+    """The timestamps of categorical DATE and TIME columns, parsed once per
+    category. Gives the same result as `Preprocessor.merge_dt`."""
+    # missing values have code -1, so a NaT is appended to pick for them
+    days = pd.to_datetime(date.cat.categories.astype(str)).to_numpy()
+    days = np.append(days, np.datetime64("NaT", "ns"))
+    offsets = pd.to_timedelta(time.cat.categories.astype(str)).to_numpy()
+    offsets = np.append(offsets, np.timedelta64("NaT", "ns"))
+
+    values = days[date.cat.codes.to_numpy()] + offsets[time.cat.codes.to_numpy()]
+    return pd.Series(values, index=date.index)
+
+
+def expand(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the categorical columns of a DataFrame back to the dtype of
+    their values, e.g. before writing it to Snowflake."""
+    return df.astype(
+        {
+            col: df[col].cat.categories.dtype
+            for col in df.columns
+            if isinstance(df[col].dtype, pd.CategoricalDtype)
+        }
+    )
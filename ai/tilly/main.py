@@ -6,12 +6,14 @@ sets up the database and authentication.
 Main Components:
     - Initialization of the FastAPI application with metadata such as 
         title, version, description, and other settings.
-    - Event handler for startup that sets up the database and creates
-        initial users.
+    - Event handler for startup that sets up the database, creates
+        initial users and loads the latest stored model registry.
     - Inclusion of various routers to handle different functionalities:
         - Dashboard for visualizations.
         - Authentication and user management.
         - Model training and prediction.
+        - Status of background jobs.
+        - Pipeline metrics, in the Prometheus text format.
         - Room and heartbeat management.
 
 Startup Events:
@@ -19,12 +21,18 @@ Startup Events:
         and tables.
     - `create_initial_users` function is called to populate the database with
         initial users.
+    - `load_registry` function is called to load the latest trained models
+        from the model store, so predictions work without retraining.
+
+Shutdown Events:
+    - `session_pool.close` closes the pooled Snowflake sessions.
 
 Routing:
     - The script mounts a dashboard available at `/dashboard` for visualizations.
     - Various routers from different modules are included for handling
         functionalities related to dashboard, authentication, user management,
-        model training, prediction, room management, and heartbeat.
+        model training, prediction, job status, metrics, room management, and
+        heartbeat.
 
 Dependencies:
     - Some routes require the user to be authenticated, managed by 
@@ -45,8 +53,11 @@ import uvicorn
 from fastapi import Depends, FastAPI
 from fastapi.staticfiles import StaticFiles
 
+from tilly.database.data.db import session_pool
 from tilly.database.users.crud import create_db_and_tables
-from tilly.routes import predict, train, dashboard, heartbeat
+from tilly.routes import predict, train, dashboard, heartbeat, jobs, metrics
+from tilly.services.ml import update_registry
+from tilly.services.ml.model_store import load_registry
 from tilly.users.auth import auth_backend, current_active_user, fastapi_users
 from tilly.users.initial_users import create_initial_users
 from tilly.users.schemas import UserCreate, UserRead, UserUpdate
@@ -67,7 +78,21 @@ app = FastAPI(
 async def on_startup():
     await create_db_and_tables()
     await create_initial_users()
+    if registry := load_registry():
+        update_registry(registry)
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    session_pool.close()
+
 
+# before the static files, which would shadow the routes under /dashboard
+app.include_router(
+    dashboard.rooms_router,
+    tags=["dashboard"],
+    dependencies=[Depends(current_active_user)],
+)
 
 app.mount("/dashboard", StaticFiles(directory="tilly/dashboard/"), name="plots")
 
@@ -104,6 +129,18 @@ app.include_router(
     dependencies=[Depends(current_active_user)],
 )
 
+app.include_router(
+    jobs.router,
+    tags=["jobs"],
+    dependencies=[Depends(current_active_user)],
+)
+
+app.include_router(
+    metrics.router,
+    tags=["metrics"],
+    dependencies=[Depends(current_active_user)],
+)
+
 app.include_router(
     heartbeat.router,
     tags=["heartbeat"],
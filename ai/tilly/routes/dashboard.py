@@ -1,24 +1,36 @@
 """
 FastAPI Router for Tilly Dashboard and Plots
 
-This module contains routes for serving the Tilly dashboard and for retrieving
-the directory structure of the plots. It uses FastAPI and depends on the Jinja2 
-templating engine to render HTML responses.
+This module contains routes for serving the Tilly dashboard, for retrieving
+the structure of the plots from the plot index, and for plotting a room, or a
+slice of it in more detail when it is zoomed in on. It uses FastAPI and depends
+on the Jinja2 templating engine to render HTML responses.
+
+The plots of the rooms are rendered on demand, from the stored results of the
+latest scoring, and cached in memory (see `services.dashboard.room_spec`). They
+are served by `rooms_router`, whose routes require authentication: the
+dashboard page logs in at /auth/jwt/login and sends the token along. The
+router must be included before the static files mounted at /dashboard, which
+would shadow its routes.
 """
 
-from pathlib import Path
+import hashlib
 from typing import Optional, Dict
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Depends, Request, HTTPException, Query
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 
 from tilly import config as c
+from tilly.services.dashboard import room_spec, write_plotlyjs, zoom_spec
+from tilly.services.dashboard.index import plot_index
+from tilly.services.ml import ModelRegistry, get_current_registry
 
 # Initialize Jinja2 templates
 templates = Jinja2Templates(directory=c.PLOTS_DIR.parent)
 
-# Initialize FastAPI router
+# Initialize FastAPI routers
 router = APIRouter()
+rooms_router = APIRouter()
 
 
 @router.get("/", response_class=HTMLResponse)
@@ -41,58 +53,123 @@ def read_root(request: Request) -> HTMLResponse:
 
         This will return the HTML content of the Tilly dashboard.
     """
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return templates.TemplateResponse(
+        "dashboard.html", {"request": request, "plotly_js": write_plotlyjs()}
+    )
 
 
-def create_plot_structure(root_path: Path) -> Optional[Dict]:
+@router.get("/plots_structure", response_model=Optional[Dict])
+async def get_plots_structure(
+    request: Request,
+    kommune: Optional[str] = None,
+    skole: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+) -> Response:
     """
-    Generate Plot Directory Structure.
+    Get Plot Directory Structure.
+
+    This route returns the structure of the plots as a JSON object, as
+    `{kommune: {skole: {room: null}}}`. It is served from the plot index
+    in memory (see `services.dashboard.index`), instead of walking the stored
+    rooms. If there is no dashboard data directory, a 404 HTTP error is raised.
 
-    This function takes a root path and returns a dictionary representing the
-        directory structure rooted at that path.
+    The schools can be filtered by KOMMUNE and SKOLE, and paged: the matching
+    schools are ordered by KOMMUNE and SKOLE, and `limit` of them are
+    returned from `offset`. The number of matching schools is returned in the
+    `X-Total-Count` header.
+
+    The response has an ETag, and a request with a matching `If-None-Match`
+    header gets an empty 304 response while the index is unchanged.
 
     Args:
-        root_path (Path): The root path from which to generate the directory
-            structure.
+        request (Request): The FastAPI request object.
+        kommune (str, optional): Only this municipality. Defaults to all.
+        skole (str, optional): Only schools of this name. Defaults to all.
+        offset (int, optional): Schools to skip. Defaults to 0.
+        limit (int, optional): Most schools to return. Defaults to all.
 
     Returns:
-        Optional[Dict]: The dictionary representing the directory structure or
-            `None` if the provided path is not a directory.
+        Response: The JSON object representing the structure of the plots.
 
     Examples:
-        ```python
-        from pathlib import Path
-
-        root_path = Path("/path/to/plots")
-        structure = create_plot_structure(root_path)
+        ```bash
+        curl http://localhost:8000/plots_structure
+        curl "http://localhost:8000/plots_structure?kommune=KOMMUNE&limit=20"
         ```
-    """
-    if not root_path.is_dir():
-        return None
-    return {child.name: create_plot_structure(child) for child in root_path.iterdir()}
 
+        This will return a JSON object representing the structure of the
+        plots.
+    """
+    structure, total, version = plot_index.query(kommune, skole, offset, limit)
+    if structure is None:
+        raise HTTPException(status_code=404, detail="Invalid directory structure")
 
-@router.get("/plots_structure", response_model=Optional[Dict])
-def get_plots_structure() -> Optional[Dict] | HTTPException:
+    # the same index gives different pages, so the query is part of the tag
+    query = f"{kommune}|{skole}|{offset}|{limit}"
+    etag = f'"{version}-{hashlib.sha1(query.encode()).hexdigest()[:8]}"'
+    headers = {"ETag": etag, "X-Total-Count": str(total)}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=structure, headers=headers)
+
+
+@rooms_router.get("/dashboard/rooms/{kommune}/{skole}/{room}")
+def get_room(
+    kommune: str,
+    skole: str,
+    room: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    max_points: int = Query(c.DASHBOARD_MAX_POINTS, ge=2, le=20_000),
+    model_registry: ModelRegistry = Depends(get_current_registry),
+) -> Response:
     """
-    Get Plot Directory Structure.
+    Get the Plot of a Room.
+
+    This route returns the JSON figure spec of a room, rendered from the results
+    of its latest scoring the first time it is requested, and then served from
+    an in-memory cache keyed by the room and the version of the model registry.
+
+    With `start` or `end`, only the timeslots of the room between them are
+    plotted, downsampled to `max_points` bars. The dashboard requests this
+    when the user zooms in on a plot, to show the zoomed-in slice in more
+    detail than the plot of the whole room. Slices are not cached.
 
-    This route returns the directory structure of the plots as a JSON object.
-    If the directory structure is invalid, a 404 HTTP error is raised.
+    **NOTE**: Authentication is required for this endpoint.
+
+    Args:
+        kommune (str): The municipality of the room.
+        skole (str): The school of the room.
+        room (str): The room, as named in the plot index, without ".json".
+        start (str, optional): The first time to plot, e.g. "2023-10-02 08:00".
+            Defaults to the first timeslot of the room.
+        end (str, optional): The last time to plot. Defaults to the last
+            timeslot of the room.
+        max_points (int, optional): The most bars to plot.
+            Defaults to DASHBOARD_MAX_POINTS.
+        model_registry (ModelRegistry): The current model registry.
 
     Returns:
-        Optional[Dict]: The dictionary representing the directory structure.
+        Response: The JSON figure spec of the room, or of the slice.
 
     Examples:
         ```bash
-        curl http://localhost:8000/plots_structure
+        curl -H "Authorization: Bearer $TOKEN" http://localhost:8000/dashboard/rooms/KOMMUNE/SKOLE/0_1
+        curl -H "Authorization: Bearer $TOKEN" "http://localhost:8000/dashboard/rooms/KOMMUNE/SKOLE/0_1?start=2023-10-02&end=2023-10-03"
         ```
-
-        This will return a JSON object representing the directory structure of
-        the plots.
     """
-    plot_dir = Path(c.PLOTS_DIR)
-    result = create_plot_structure(plot_dir)
-    if result is None:
-        raise HTTPException(status_code=404, detail="Invalid directory structure")
-    return result
+    if start is None and end is None:
+        version = getattr(model_registry, "version", None)
+        spec = room_spec(kommune, skole, room, version, max_points)
+    else:
+        try:
+            spec = zoom_spec(kommune, skole, room, start, end, max_points)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid time range: {e}")
+    if spec is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return Response(content=spec, media_type="application/json")
@@ -0,0 +1,101 @@
+"""
+Job Status Endpoint for Tilly Service
+
+This module contains a FastAPI router for looking up the status and progress
+of background jobs, such as the scoring jobs started by `POST /predict/` and
+the training jobs started by `POST /train`, and for cancelling them.
+"""
+
+from fastapi import APIRouter, HTTPException
+
+from tilly.services.jobs import jobs
+
+# Initialize FastAPI router
+router = APIRouter()
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str) -> dict:
+    """
+    Get the Status and Progress of a Job.
+
+    **NOTE**: Authentication is required for this endpoint.
+
+    Args:
+
+        job_id (str): The id of the job, as returned when it was started.
+
+    Returns:
+
+        dict: The status of the job ("pending", "running", "completed",
+            "failed" or "cancelled"), its progress counters, the seconds it
+            has been running for, and the error message if it failed.
+
+    Examples:
+        ```bash
+        curl http://localhost:8000/jobs/3f0c5e0e2b8a4c4f9d6a1b7e5c2d9f10
+        ```
+
+    Output:
+        ```json
+        {
+            "id": "3f0c5e0e2b8a4c4f9d6a1b7e5c2d9f10",
+            "kind": "predict",
+            "status": "running",
+            "progress": {"rooms_total": 1200, "rooms_done": 300,
+                         "rows_written": 288000},
+            "elapsed_seconds": 42.1,
+            "error": null,
+            "cancel_requested": false
+        }
+        ```
+    """
+    if (job := jobs.get(job_id)) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.as_dict()
+
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str) -> dict:
+    """
+    Cancel a Job.
+
+    Cancellation is cooperative: the job stops the next time it reports
+    progress, e.g. after the room it is training. A cancelled training keeps
+    serving the previously stored models. A cancelled scoring stops between
+    two batches of rooms, and keeps the scores it has already written.
+
+    **NOTE**: Authentication is required for this endpoint.
+
+    Args:
+
+        job_id (str): The id of the job, as returned when it was started.
+
+    Returns:
+
+        dict: The status of the job, as for `GET /jobs/{job_id}`, with
+            `cancel_requested` set if the job was still running.
+
+    Examples:
+        ```bash
+        curl -X POST http://localhost:8000/jobs/9b2d4e6f8a0c4e1f9d3b5a7c9e1f3a5b/cancel
+        ```
+
+    Output:
+        ```json
+        {
+            "id": "9b2d4e6f8a0c4e1f9d3b5a7c9e1f3a5b",
+            "kind": "train",
+            "status": "running",
+            "progress": {"rooms_total": 1200, "stage": "fit_predict",
+                         "stages": {"preprocess": 100, "fit_predict": 37}},
+            "elapsed_seconds": 64.8,
+            "error": null,
+            "cancel_requested": true
+        }
+        ```
+    """
+    if (job := jobs.get(job_id)) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    job.cancel()
+    return job.as_dict()
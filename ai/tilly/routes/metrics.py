@@ -0,0 +1,48 @@
+"""
+Metrics Endpoint for Tilly Service
+
+This module contains a FastAPI router for serving the pipeline metrics
+(see `tilly.utils.metrics`) in the Prometheus text format, to be scraped
+by Prometheus or read directly to find the slow stages and rooms.
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from tilly.utils.metrics import metrics
+
+# Initialize FastAPI router
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    """
+    Get the Pipeline Metrics.
+
+    Returns the duration histogram, the rows in and out, the memory deltas and
+    the slowest calls (with their room) of every preprocessing stage since the
+    service started, in the Prometheus text format. Empty if the `METRICS`
+    setting is off.
+
+    **NOTE**: Authentication is required for this endpoint.
+
+    Returns:
+
+        PlainTextResponse: The metrics in the Prometheus text format.
+
+    Examples:
+        ```bash
+        curl -H "Authorization: Bearer $TOKEN" http://localhost:8000/metrics
+        ```
+
+    Output:
+        ```text
+        # HELP tilly_stage_duration_seconds Duration of pipeline stages.
+        # TYPE tilly_stage_duration_seconds histogram
+        tilly_stage_duration_seconds_bucket{stage="add_missing_timeslots",le="0.001"} 0
+        ...
+        tilly_stage_slowest_seconds{stage="featurize",room="Skole_1.23"} 0.912345
+        ```
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
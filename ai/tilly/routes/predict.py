@@ -4,48 +4,116 @@ Prediction Endpoint for Tilly Service
 This module contains a FastAPI router for serving an endpoint that performs
 predictions based on unscored timeslots. The data is processed, predicted,
 and then stored back into the database as scored timeslots.
+
+Scoring runs as a background job, so the endpoint returns right away with the
+id of the job. Its progress can be followed at `GET /jobs/{job_id}`, and it can
+be cancelled at `POST /jobs/{job_id}/cancel`.
 """
 
-from fastapi import Depends, APIRouter, Request
+import os
+from typing import Iterator
+from uuid import uuid4
+
+from fastapi import Depends, APIRouter, HTTPException, Request
 from sqlalchemy.orm import Session
 from pandas import DataFrame
 from loguru import logger
 
+from tilly.config import PIPELINE_SCORERS, SCORE_CORES
 from tilly.database.data import crud
 from tilly.database.data.models import UnscoredTimeslots, ScoredTimeslots
-from tilly.database.data.db import get_session
+from tilly.database.data.db import session_scope
+from tilly.services.jobs import Job, JobAlreadyRunning, jobs
 from tilly.services.ml import ModelRegistry, get_current_registry, Transformer
+from tilly.services.ml.pipeline import run_pipeline
 
 
-def prediction_flow(session: Session, model: ModelRegistry) -> None:
+def prediction_flow(
+    session: Session, model: ModelRegistry, job: Job | None = None
+) -> None:
     """
     Run the Prediction Workflow.
 
     This function orchestrates the steps for the prediction workflow, including
-    data retrieval, prediction, and data storage.
+    data retrieval, prediction, and data storage. The steps run as a pipeline
+    (see `run_pipeline`): while one batch of rooms is being scored, the next
+    is fetched and the previous one is written. Since the fetcher and the
+    writer run in threads of their own, and a Snowpark session must not be
+    used by several threads at once, the writer borrows a second session
+    from the session pool, and `session` is only used by the fetcher.
+
+    The batches are scored by PIPELINE_SCORERS threads at once, which share
+    the SCORE_CORES between them, so the scorers do not oversubscribe the
+    machine.
+
+    Each batch is pushed with a run key of the job and the position of the
+    batch in the stream (see `crud.push_data`), so a push that is retried
+    within the run never appends the same chunk twice.
 
     Args:
         session (Session): SQLAlchemy session to the Snowflake database.
         model (ModelRegistry): Machine Learning model for performing the predictions.
+        job (Job, optional): Job to report the rooms done and rows written to.
+            The scoring stops between two batches if the job is cancelled;
+            the batches written until then are kept. Defaults to None.
 
     Examples:
         ```python
-        from tilly.database.data.db import get_session
+        from tilly.database.data.db import session_scope
         from tilly.services.ml import get_current_registry
 
-        with get_session() as session:
+        with session_scope() as session:
             model_registry = get_current_registry()
             prediction_flow(session, model_registry)
         ```
     """
-    rooms: dict[str, DataFrame] = crud.retrieve_data(
-        session, UnscoredTimeslots.__tablename__
-    )
-    scored_rooms: dict[str, DataFrame] = model.predict(rooms)
-    combined_rooms: DataFrame = Transformer.combine_frames(rooms, scored_rooms)
-    crud.push_data(
-        combined_rooms, table_name=ScoredTimeslots.__tablename__, session=session
-    )
+    if job is not None:
+        job.update(
+            rooms_total=crud.count_rooms(session, UnscoredTimeslots.__tablename__),
+            rooms_done=0,
+            rows_written=0,
+        )
+
+    run_id = job.id if job is not None else uuid4().hex
+    n_cores = max((SCORE_CORES or os.cpu_count() or 1) // PIPELINE_SCORERS, 1)
+
+    def fetch() -> Iterator[tuple[int, dict[str, DataFrame]]]:
+        batches = crud.stream_data(session, UnscoredTimeslots.__tablename__)
+        for index, rooms in enumerate(batches):
+            if job is not None:
+                job.check_cancelled()
+            yield index, rooms
+
+    def score(batch: tuple[int, dict[str, DataFrame]]) -> tuple[int, int, DataFrame]:
+        index, rooms = batch
+        scored_rooms: dict[str, DataFrame] = model.predict(rooms, n_cores=n_cores)
+        return index, len(rooms), Transformer.combine_frames(rooms, scored_rooms)
+
+    # batches of rooms are fetched, scored and pushed concurrently, with
+    # bounded queues in between, so the full table is never held in memory
+    with session_scope() as write_session:
+
+        def write(scored: tuple[int, int, DataFrame]) -> None:
+            # batches may arrive out of order, so the key is the fetch order
+            index, n_rooms, combined_rooms = scored
+            if job is not None:
+                job.check_cancelled()
+            crud.push_data(
+                combined_rooms,
+                table_name=ScoredTimeslots.__tablename__,
+                session=write_session,
+                run_key=f"{run_id}_{index}",
+            )
+            if job is not None:
+                job.increment(rooms_done=n_rooms, rows_written=len(combined_rooms))
+
+        run_pipeline(fetch(), transform=score, sink=write, n_scorers=PIPELINE_SCORERS)
+
+
+def prediction_job(job: Job, model: ModelRegistry) -> None:
+    """Run the prediction workflow as a job, with a session of its own."""
+    with session_scope() as session:
+        prediction_flow(session, model, job=job)
 
 
 # Initialize FastAPI router
@@ -55,7 +123,6 @@ router = APIRouter()
 @router.post("/predict/")
 def predict(
     _: Request,
-    session: Session = Depends(get_session),
     model_registry: ModelRegistry = Depends(get_current_registry),
 ) -> dict[str, str]:
     """
@@ -64,7 +131,9 @@ def predict(
     using the designated room-specific machine learning model, and stores the
     scored data back into the database.
 
-    Calls the `prediction_flow` function as a async background task.
+    Runs the `prediction_flow` function as a background job, and returns the id
+    of the job. Only one scoring job runs at a time: while one is running, new
+    requests are refused with status 409.
 
     **NOTE**: Authentication is required for this endpoint.
 
@@ -72,15 +141,13 @@ def predict(
 
         request: The FastAPI request object. This argument is currently not used.
 
-        session (Session, optional): SQLAlchemy session. Defaults to a new
-            session from `get_session`.
-
         model_registry (ModelRegistry, optional): ML model registry. Defaults to
             the current model from `get_current_registry`.
 
     Returns:
 
-        dict: A message indicating the completion status of the scoring sequence.
+        dict: A message indicating the status of the scoring sequence, and the
+            id of the job to follow it with at `GET /jobs/{job_id}`.
 
 
     Examples:
@@ -91,15 +158,18 @@ def predict(
     Output:
         ```json
         {
-            "message": "Scoring sequence completed."
+            "message": "Scoring sequence started.",
+            "job_id": "3f0c5e0e2b8a4c4f9d6a1b7e5c2d9f10"
         }
         ```
     """
     logger.debug("Predict endpoint called")
-    if model_registry:
-        prediction_flow(session, model_registry)
-        response = "Scoring sequence completed."
-    else:
-        response = "No models available - please train first"
+    if not model_registry:
+        return {"message": "No models available - please train first"}
+
+    try:
+        job = jobs.submit("predict", prediction_job, model_registry)
+    except JobAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-    return {"message": response}
+    return {"message": "Scoring sequence started.", "job_id": job.id}
@@ -4,51 +4,118 @@ Machine Learning Training Endpoint
 This module contains a FastAPI router for initiating machine learning
 model training. The actual training is performed by the `train_models`
 function from the `tilly.services.ml.trainer` module and dashboard updates
-are performed by `update_dashboard` from `tilly.services.dashboard`.
+are performed by `update_dashboard` from `tilly.services.dashboard`, through
+a `DashboardStaging` that is published once the new models are.
+
+Training runs as a background job, so the endpoint returns right away with
+the id of the job. Its progress per stage can be followed at
+`GET /jobs/{job_id}`, and it can be cancelled at `POST /jobs/{job_id}/cancel`.
 """
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Request
+from typing import Iterator
+from fastapi import APIRouter, HTTPException, Request
 from loguru import logger
 from sqlalchemy.orm import Session
 from pandas import DataFrame
 
 from tilly.database.data import crud
 from tilly.database.data.models import TrainingTimeslots
-from tilly.database.data.db import get_session
-from tilly.services.ml.trainer import train_models
-from tilly.services.dashboard import update_dashboard
+from tilly.database.data.db import session_scope
+from tilly.config import FEATURIZE_PUSHDOWN, INCREMENTAL_TRAINING
+from tilly.services.jobs import Job, JobAlreadyRunning, jobs
+from tilly.services.ml import get_current_registry
+from tilly.services.ml.trainer import rooms_to_refit, train_models
+from tilly.services.dashboard import DashboardStaging
 
 # Initialize FastAPI router
 router = APIRouter()
 
 
-def training_flow(session):
+def training_flow(
+    session: Session, incremental: bool = INCREMENTAL_TRAINING, job: Job | None = None
+) -> None:
     """
     Initiates the Training Sequence.
 
     This function retrieves training data, trains machine learning models,
-    and updates the dashboard based on the new models.
+    and updates the dashboard based on the new models. The dashboard updates
+    are staged (see `DashboardStaging`), and only published once the new
+    models are, after which the rooms that are no longer in the training
+    table are removed from the dashboard. If the training fails or is
+    cancelled, the dashboard is left as it was.
+
+    In incremental mode, only the rooms whose data changed since the last
+    training (see `rooms_to_refit`) are retrieved and refitted, and the models
+    of all other rooms are carried over from the current registry.
+
+    The fingerprints and the training data are read at the same `snapshot` of
+    the table, so rows written during the training neither go unnoticed by
+    the next training, nor end up in models with an older fingerprint.
 
     Args:
         session (Session): SQLAlchemy session for database interactions.
+        incremental (bool, optional): Only refit rooms with new data.
+            Defaults to INCREMENTAL_TRAINING.
+        job (Job, optional): Job to report the rooms done per stage to. The
+            training stops between two rooms if the job is cancelled.
+            Defaults to None.
     """
-    training_data: dict[str, DataFrame] = crud.retrieve_data(
-        session, TrainingTimeslots.__tablename__
+    table_name = TrainingTimeslots.__tablename__
+    at = crud.snapshot(session)
+    fingerprints = crud.retrieve_fingerprints(session, table_name, at=at)
+
+    previous = get_current_registry() if incremental else None
+    rooms = rooms_to_refit(fingerprints, previous)
+    if previous is not None and not rooms:
+        logger.info("No rooms with new training data - skipping training")
+        return
+
+    staging = DashboardStaging()
+    on_results, progress = staging.update, None
+    if job is not None:
+        job.update(rooms_total=len(rooms))
+        progress = job.advance
+
+        def on_results(results: dict[str, DataFrame]) -> None:
+            staging.update(results)
+            job.advance("dashboard", len(results))
+
+    # rooms are streamed in batches, and the dashboard is updated per batch,
+    # so neither the full table nor all results are held in memory at once.
+    # With FEATURIZE_PUSHDOWN, the rooms are featurized in Snowflake
+    stream = crud.stream_featurized if FEATURIZE_PUSHDOWN else crud.stream_data
+    training_batches: Iterator[dict[str, DataFrame]] = stream(
+        session, table_name, rooms=rooms if previous is not None else None, at=at
     )
-    data_results: dict[str, DataFrame] = train_models(training_data)
-    update_dashboard(data_results)
+    try:
+        train_models(
+            training_batches,
+            fingerprints=fingerprints,
+            previous=previous,
+            on_results=on_results,
+            progress=progress,
+            featurized=FEATURIZE_PUSHDOWN,
+        )
+    except BaseException:
+        staging.discard()
+        raise
+    staging.publish(keep=fingerprints)
+
+
+def training_job(job: Job, incremental: bool = INCREMENTAL_TRAINING) -> None:
+    """Run the training workflow as a job, with a session of its own."""
+    with session_scope() as session:
+        training_flow(session, incremental, job=job)
 
 
 @router.post("/train")
-def train(
-    _: Request,
-    background_tasks: BackgroundTasks,
-    session: Session = Depends(get_session),
-):
+def train(_: Request, incremental: bool = INCREMENTAL_TRAINING) -> dict[str, str]:
     """
     Initiate training of room-specific ML models for all rooms in data source.
 
-    Calls the `training_flow` function as a async background task.
+    Runs the `training_flow` function as a background job, and returns the id
+    of the job. Only one training job runs at a time: while one is running, new
+    requests are refused with status 409.
 
     **NOTE**: Authentication is required for this endpoint.
 
@@ -57,30 +124,34 @@ def train(
         request: Request: FastAPI Request object. Not used, but kept for FastAPI
             dependency injection.
 
-        background_tasks: FastAPI BackgroundTasks for running functions in the
-            background.
-
-        session: SQLAlchemy Session object for database interactions
-            (injected via FastAPI's dependency system).
+        incremental: Only retrieve and refit the rooms whose data changed since
+            the last training, and keep the models of all other rooms.
 
     Returns:
 
         dict: A dictionary containing a message indicating that the training
-            sequence has been initialized.
+            sequence has been initialized, and the id of the job to follow it
+            with at `GET /jobs/{job_id}`.
 
     Examples:
         ```bash
         curl -X POST http://localhost:8000/train
+        curl -X POST "http://localhost:8000/train?incremental=true"
         ```
 
         This will initiate the training sequence and return:
 
         ```json
         {
-            "message": "Training sequence initialized"
+            "message": "Training sequence initialized",
+            "job_id": "9b2d4e6f8a0c4e1f9d3b5a7c9e1f3a5b"
         }
         ```
     """
-    background_tasks.add_task(training_flow, session)
+    try:
+        job = jobs.submit("train", training_job, incremental)
+    except JobAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
     logger.info("Training sequence initialized")
-    return {"message": "Training sequence initialized"}
+    return {"message": "Training sequence initialized", "job_id": job.id}
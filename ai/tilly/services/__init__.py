@@ -6,7 +6,7 @@ functionalities for preprocessing, training, and postprocessing,
 as well as maintaining a global model registry.
 
 Main Components:
-    - ModelRegistry: A singleton class that serves as an in-memory registry for
+    - ModelRegistry: A class that serves as an in-memory registry for
         trained machine learning models. 
         Each model is room-specific and is used for batch predictions. 
         This class also takes care of model training, fitting, and predictions.
@@ -24,6 +24,9 @@ Main Components:
     - Trainer: A script responsible for orchestrating the model training flow. 
         It takes in new data, triggers model training, and updates the
         global model registry.
+
+    - Jobs: A job manager that runs long flows, such as scoring, in the
+        background, and keeps track of their status and progress.
                
 The package is designed to be robust, scalable, and thread-safe.
 
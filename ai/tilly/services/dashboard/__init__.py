@@ -3,13 +3,61 @@ Dashboard Updater Module
 
 This module contains functions for processing room data,
 generating plots, and updating the dashboard by saving the plots to disk.
+
+Each room is stored as a compact JSON figure spec, which the dashboard page
+fetches on demand and draws with a single, shared plotly.js asset (see
+`write_plotlyjs`), instead of a standalone HTML file embedding all of
+plotly.js. Rooms with long histories are downsampled to DASHBOARD_MAX_POINTS
+bars before plotting (see `downsample`), and the plotted values are stored
+as float32. The full resolution data of each room is kept in Parquet files
+in DASHBOARD_DATA_DIR, from which `zoom_spec` plots a slice of a room in
+more detail when the user zooms in.
+
+After training, `update_dashboard` only stores the data of the rooms, and
+the plot of a room is rendered when it is first requested (see `room_spec`),
+and kept in an in-memory LRU cache (see `figure_cache`) keyed by the room
+and the model version that scored it. With DASHBOARD_PRERENDER, the plots of
+all rooms are rendered to PLOTS_DIR after training instead.
+
+The dashboard is updated incrementally: every data file, and every
+pre-rendered plot file, carries a hash of the data it holds, and
+`update_dashboard` only writes the rooms whose hash changed. The changed
+rooms are rendered in a process pool. Finally, the rooms are added to the
+index of the dashboard (see `index`). Once a training is done,
+`prune_dashboard` removes the rooms that are no longer in the data source,
+and rebuilds the index from the stored rooms once.
+
+A training updates the dashboard through a `DashboardStaging`, which holds
+the files of the rooms back in a staging directory until the new models are
+published, so the dashboard never shows the results of models that are not
+served, e.g. of a training that failed or was cancelled.
 """
 
+import hashlib
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterable
+from uuid import uuid4
+import numpy as np
 import pandas as pd
+import plotly
+import pyarrow as pa
+import pyarrow.parquet as pq
 import warnings
+from loguru import logger
 
-from tilly.config import PLOTS_DIR, FEATURES
+from tilly.services.dashboard.figure_cache import figure_cache
+from tilly.services.dashboard.index import add_to_index, write_index
+from tilly.config import (
+    PLOTS_DIR,
+    FEATURES,
+    DASHBOARD_WORKERS,
+    DASHBOARD_MAX_POINTS,
+    DASHBOARD_DATA_DIR,
+    DASHBOARD_PRERENDER,
+)
 
 # Configure Pandas plotting backend
 pd.options.plotting.backend = "plotly"
@@ -18,19 +66,21 @@ warnings.filterwarnings(
     "ignore", category=FutureWarning, module="_plotly_utils.basevalidators"
 )
 
+# Bump to render all plots again after changing how they are drawn
+PLOT_VERSION = 3
+# The columns a plot is drawn from
+PLOT_COLUMNS = ["KOMMUNE", "SKOLE", "ID", "DATETIME", "CO2", "IN_USE"] + FEATURES
+PLOT_COLUMNS += ["ANOMALY_SCORE"]
+# Start of a plot file, followed by the hash of its data
+HASH_PREFIX = b'{"hash":"'
+# Key of the hash of a data file in its Parquet metadata
+DATA_HASH_KEY = b"tilly.hash"
+# Key of the name of the room of a data file, as SKOLE_ID, in its metadata
+DATA_ROOM_KEY = b"tilly.room"
 
-def create_dir(municipality: str, school: str) -> None:
-    """
-    Create Municipality/School Directories
-
-    Create the directories for storing plots related to a specific municipality
-    and school if they do not already exist.
-
-    Args:
-        municipality (str): The name of the municipality.
-        school (str): The name of the school.
-    """
-    Path(f"{PLOTS_DIR}/{municipality}/{school}").mkdir(parents=True, exist_ok=True)
+# The shared plotly.js of the dashboard, served from /dashboard/assets
+ASSETS_DIR = PLOTS_DIR.parent / "assets"
+PLOTLY_JS = f"plotly-{plotly.__version__}.min.js"
 
 
 def process_for_dashboard(rooms: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
@@ -38,7 +88,7 @@ def process_for_dashboard(rooms: dict[str, pd.DataFrame]) -> dict[str, pd.DataFr
     Process Room Data for Dashboard
 
     This function takes room data, processes it, and generates plotly figures.
-    It also creates necessary directories for storing the plots.
+    The figures are not written to disk, so no directories are created.
 
     Args:
         rooms (dict[str, pd.DataFrame]): Dictionary containing room data as
@@ -49,43 +99,161 @@ def process_for_dashboard(rooms: dict[str, pd.DataFrame]) -> dict[str, pd.DataFr
     """
     output = {}
     for _, room in rooms.items():
-        # retrive the first instance of 'KOMMUNE' and 'SKOLE'
-        municipality = room["KOMMUNE"].iloc[0]
-        school = room["SKOLE"].iloc[0]
-        room_id = room["ID"].iloc[0].replace(".", "_")
-
-        create_dir(municipality, school)
-
-        fig = room.sort_values("DATETIME", ascending=True).plot.bar(
-            x="DATETIME",
-            y="CO2",
-            color="IN_USE",
-            title=(f"Lokale {room_id} " + f"- {school} ({municipality} KOMMUNE)"),
-            width=2000,
-            hover_data=room[FEATURES + ["ANOMALY_SCORE"]],
-        )
-        # Update bar border width
-        fig.update_traces(dict(marker_line_width=0))
-        # Update legend position
-        fig.update_layout(
-            legend=dict(
-                yanchor="top",
-                y=0.99,
-                xanchor="left",
-                x=0.01,
-                title=None,
-            )
-        )
-        output[(municipality, school, room_id)] = fig
+        output[room_key(room)] = room_figure(room)
 
     return output
 
 
+def room_key(room: pd.DataFrame) -> tuple[str, str, str]:
+    """The (municipality, school, room_id) of a room, as used in the plot paths."""
+    # retrive the first instance of 'KOMMUNE' and 'SKOLE'
+    municipality = room["KOMMUNE"].iloc[0]
+    school = room["SKOLE"].iloc[0]
+    room_id = room["ID"].iloc[0].replace(".", "_")
+    return municipality, school, room_id
+
+
+def room_name(room: pd.DataFrame) -> str:
+    """The name of a room in the data source and the model registry, SKOLE_ID,
+    built as in `crud.retrieve_data`."""
+    return f"{room['SKOLE'].iloc[0]}_{room['ID'].iloc[0]}"
+
+
+def room_figure(room: pd.DataFrame, max_points: int = DASHBOARD_MAX_POINTS):
+    """
+    Create the Plotly Figure of a Room
+
+    Args:
+        room (pd.DataFrame): The scored data of the room.
+        max_points (int, optional): The most bars to plot, see `downsample`.
+            Defaults to DASHBOARD_MAX_POINTS.
+
+    Returns:
+        The plotly figure of CO2 over time, colored by IN_USE.
+    """
+    municipality, school, room_id = room_key(room)
+    room = compact_values(downsample(room, max_points))
+    fig = room.sort_values("DATETIME", ascending=True).plot.bar(
+        x="DATETIME",
+        y="CO2",
+        color="IN_USE",
+        title=(f"Lokale {room_id} " + f"- {school} ({municipality} KOMMUNE)"),
+        width=2000,
+        hover_data=room[FEATURES + ["ANOMALY_SCORE"]],
+    )
+    # Update bar border width
+    fig.update_traces(dict(marker_line_width=0))
+    # Update legend position
+    fig.update_layout(
+        legend=dict(
+            yanchor="top",
+            y=0.99,
+            xanchor="left",
+            x=0.01,
+            title=None,
+        )
+    )
+    return fig
+
+
+def downsample(room: pd.DataFrame, max_points: int = DASHBOARD_MAX_POINTS):
+    """
+    Downsample a Room to a Number of Bars
+
+    The timeslots of the room are split into `max_points // 2` buckets of
+    consecutive timeslots, and two timeslots are kept of each bucket:
+
+    - in buckets where IN_USE changes, the timeslot with the highest CO2 of
+      each IN_USE state, so every period of use stays visible,
+    - in other buckets, the timeslots with the lowest and highest CO2, so
+      the troughs and peaks of the room stay visible.
+
+    Args:
+        room (pd.DataFrame): The scored data of the room.
+        max_points (int, optional): The most timeslots to keep, at least 2.
+            0 keeps all timeslots. Defaults to DASHBOARD_MAX_POINTS.
+
+    Returns:
+        pd.DataFrame: The kept timeslots, in order of DATETIME.
+    """
+    if not max_points or len(room) <= max_points:
+        return room
+    room = room.sort_values("DATETIME", kind="stable")
+    co2 = room["CO2"].to_numpy(dtype=float)
+    in_use = room["IN_USE"].to_numpy(dtype=float) == 1
+    # missing CO2 is the last pick for both the lowest and the highest,
+    # but is still above the timeslots of the other IN_USE state
+    low = np.nan_to_num(co2, nan=np.finfo(float).max)
+    high = np.nan_to_num(co2, nan=np.finfo(float).min)
+
+    n_buckets = max(max_points // 2, 1)
+    starts = np.unique(np.arange(len(room)) * n_buckets // len(room), True)[1]
+    sizes = np.diff(np.append(starts, len(room)))
+    used = np.add.reduceat(in_use.astype(int), starts)
+    mixed = (used > 0) & (used < sizes)
+
+    lowest = _bucket_argmax(-low, starts, sizes)
+    highest = _bucket_argmax(high, starts, sizes)
+    highest_used = _bucket_argmax(np.where(in_use, high, -np.inf), starts, sizes)
+    highest_unused = _bucket_argmax(np.where(in_use, -np.inf, high), starts, sizes)
+
+    keep = np.concatenate(
+        [
+            np.where(mixed, highest_used, lowest),
+            np.where(mixed, highest_unused, highest),
+        ]
+    )
+    return room.iloc[np.unique(keep)]
+
+
+def _bucket_argmax(
+    values: np.ndarray, starts: np.ndarray, sizes: np.ndarray
+) -> np.ndarray:
+    """The position of the first maximum of each bucket of consecutive
+    values. The buckets are contiguous, so they can be reduced at once."""
+    maxima = np.flatnonzero(
+        values == np.repeat(np.maximum.reduceat(values, starts), sizes)
+    )
+    return maxima[np.searchsorted(maxima, starts)]
+
+
+def compact_values(room: pd.DataFrame) -> pd.DataFrame:
+    """The plotted values of a room as float32, which halves the figure specs."""
+    values = ["CO2"] + FEATURES + ["ANOMALY_SCORE"]
+    return room.astype({col: "float32" for col in values if col in room.columns})
+
+
+def write_plotlyjs() -> str:
+    """
+    Write the Shared plotly.js Asset
+
+    Writes the plotly.js bundle of the installed plotly version to
+    ASSETS_DIR, if it is not there yet. The file name contains the version,
+    so browsers can cache it across page loads.
+
+    Returns:
+        str: The file name of the asset, relative to ASSETS_DIR.
+    """
+    path = ASSETS_DIR / PLOTLY_JS
+    if not path.exists():
+        ASSETS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(plotly.offline.get_plotlyjs(), encoding="utf-8")
+        os.replace(tmp_path, path)
+    return PLOTLY_JS
+
+
+def figure_spec(fig, digest: str) -> bytes:
+    """The JSON spec of a figure, starting with the hash of its data."""
+    return HASH_PREFIX + f'{digest}",'.encode() + fig.to_json().encode()[1:]
+
+
 def save_figures(named_plots: dict[tuple[str, str, str], object]) -> None:
     """
     Save Figures to Disk
 
-    Takes a dictionary of named plots and saves them to disk.
+    Takes a dictionary of named plots and saves them to disk, as JSON
+    figure specs.
 
     Args:
         named_plots (dict): A dictionary containing plotly figures keyed
@@ -93,24 +261,401 @@ def save_figures(named_plots: dict[tuple[str, str, str], object]) -> None:
     """
 
     for (municipality, school, room_id), fig in named_plots.items():
-        fig.write_html(f"{PLOTS_DIR}/{municipality}/{school}/{room_id}.html")
+        fig.write_json(plot_path(municipality, school, room_id))
+
+
+def plot_path(municipality: str, school: str, room_id: str) -> Path:
+    """The plot file of a room."""
+    return Path(f"{PLOTS_DIR}/{municipality}/{school}/{room_id}.json")
+
+
+def data_path(municipality: str, school: str, room_id: str) -> Path:
+    """The Parquet file of the full resolution data of a room."""
+    return Path(f"{DASHBOARD_DATA_DIR}/{municipality}/{school}/{room_id}.parquet")
 
 
-def update_dashboard(plot_data: dict[str, pd.DataFrame]) -> None:
+def stored_data_path(municipality: str, school: str, room_id: str) -> Path | None:
+    """The data file of a room, or None if the names would lead outside of
+    DASHBOARD_DATA_DIR."""
+    root = Path(DASHBOARD_DATA_DIR).resolve()
+    path = data_path(municipality, school, room_id).resolve()
+    return path if root in path.parents else None
+
+
+def load_room_data(municipality: str, school: str, room_id: str) -> pd.DataFrame | None:
+    """The full resolution data of a room, or None if it is not stored."""
+    path = stored_data_path(municipality, school, room_id)
+    if path is None:
+        return None
+    try:
+        return pd.read_parquet(path)
+    except FileNotFoundError:
+        return None
+
+
+def room_spec(
+    municipality: str,
+    school: str,
+    room_id: str,
+    version: str | None = None,
+    max_points: int = DASHBOARD_MAX_POINTS,
+) -> bytes | None:
+    """
+    Get the Plot of a Room, Rendering it on Demand
+
+    The plot of the whole room is rendered from its stored data the first
+    time it is requested, and then served from `figure_cache`. The cache key
+    holds the model version and the modification time of the data file, so
+    the room is rendered again after it is scored by another model, also by
+    another worker of the API.
+
+    Args:
+        municipality (str): The municipality of the room.
+        school (str): The school of the room.
+        room_id (str): The room, as named in the plot index.
+        version (str, optional): The version of the model registry, see
+            `model_store`. Defaults to None, for an unsaved registry.
+        max_points (int, optional): The most bars to plot.
+            Defaults to DASHBOARD_MAX_POINTS.
+
+    Returns:
+        bytes | None: The JSON figure spec of the room, or None if the room
+            has no stored data.
+    """
+    path = stored_data_path(municipality, school, room_id)
+    try:
+        stamp = path.stat().st_mtime_ns if path is not None else None
+    except FileNotFoundError:
+        stamp = None
+    if stamp is None:
+        return None
+
+    key = (municipality, school, room_id, version, stamp, max_points)
+    return figure_cache.get_or_render(
+        key, lambda: zoom_spec(municipality, school, room_id, max_points=max_points)
+    )
+
+
+def zoom_spec(
+    municipality: str,
+    school: str,
+    room_id: str,
+    start: str | None = None,
+    end: str | None = None,
+    max_points: int = DASHBOARD_MAX_POINTS,
+) -> bytes | None:
+    """
+    Plot a Slice of a Room
+
+    Plots the timeslots of a room between `start` and `end` from its full
+    resolution data, downsampled to `max_points` bars. The narrower the
+    slice, the more of its timeslots are shown, down to every timeslot.
+
+    Args:
+        municipality (str): The municipality of the room.
+        school (str): The school of the room.
+        room_id (str): The room, as named in the plot files.
+        start (str, optional): The first time to plot. Defaults to the
+            first timeslot of the room.
+        end (str, optional): The last time to plot. Defaults to the last
+            timeslot of the room.
+        max_points (int, optional): The most bars to plot.
+            Defaults to DASHBOARD_MAX_POINTS.
+
+    Returns:
+        bytes | None: The JSON figure spec of the slice, with the x axis set
+            to the slice, or None if the room has no stored data.
+
+    Raises:
+        ValueError: If `start` or `end` is not a valid time.
+    """
+    room = load_room_data(municipality, school, room_id)
+    if room is None:
+        return None
+
+    times = room["DATETIME"]
+    lower = pd.Timestamp(start) if start else times.min()
+    upper = pd.Timestamp(end) if end else times.max()
+    window = room[times.between(lower, upper)]
+
+    # an empty slice is plotted without bars, but with the title of the room
+    fig = room_figure(room.head(1) if window.empty else window, max_points)
+    if window.empty:
+        fig.update_traces(x=[], y=[], customdata=[])
+    if start or end:
+        fig.update_xaxes(range=[lower, upper])
+    return fig.to_json().encode()
+
+
+def content_hash(room: pd.DataFrame) -> str:
+    """A hash of the data a room is plotted from, and of PLOT_VERSION."""
+    values = pd.util.hash_pandas_object(room[PLOT_COLUMNS], index=False)
+    digest = hashlib.sha1(f"{PLOT_VERSION}".encode())
+    digest.update(values.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def stored_hash(path: Path) -> str | None:
+    """The hash a plot file was rendered from, or None if there is no plot."""
+    try:
+        with open(path, "rb") as file:
+            head = file.read(len(HASH_PREFIX) + 64)
+    except FileNotFoundError:
+        return None
+    if not head.startswith(HASH_PREFIX):
+        return None
+    return head[len(HASH_PREFIX) :].split(b'"', 1)[0].decode()
+
+
+def stored_data_hash(path: Path) -> str | None:
+    """The hash of the data in a data file, or None if there is no data.
+    Only the footer of the file is read."""
+    try:
+        digest = (pq.read_schema(path).metadata or {}).get(DATA_HASH_KEY)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    return digest.decode() if digest is not None else None
+
+
+def store_room(
+    room: pd.DataFrame, data: Path, digest: str, path: Path, render: bool = False
+) -> None:
+    """
+    Store the Data of a Room, and Optionally Render its Plot to Disk
+
+    Defined at module level, so it can be shipped to worker processes. The
+    files are written to a temporary file and renamed into place, so the
+    dashboard never serves a partial file.
+
+    Args:
+        room (pd.DataFrame): The scored data of the room.
+        data (Path): The data file, for `room_spec` and `zoom_spec`.
+        digest (str): The `content_hash` of the room, stored with the data
+            and at the start of the plot.
+        path (Path): The plot file. Unless the plot is rendered, the plot
+            file is removed, since it no longer matches the data.
+        render (bool, optional): Render the plot. Defaults to False.
+    """
+    data.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(room, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            DATA_HASH_KEY: digest.encode(),
+            DATA_ROOM_KEY: room_name(room).encode(),
+        }
+    )
+    tmp_data = data.with_name(f".{data.name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp_data)
+    os.replace(tmp_data, data)
+
+    # the HTML plot of the room from before the plots were stored as JSON
+    path.with_suffix(".html").unlink(missing_ok=True)
+    if not render:
+        path.unlink(missing_ok=True)
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    spec = figure_spec(room_figure(room), digest)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(spec)
+    os.replace(tmp_path, path)
+
+
+def update_dashboard(
+    plot_data: dict[str, pd.DataFrame],
+    workers: int = DASHBOARD_WORKERS,
+    prerender: bool = DASHBOARD_PRERENDER,
+    staging: "DashboardStaging | None" = None,
+) -> None:
     """
     Update Dashboard
 
-    Update the dashboard by processing the provided room data and saving the
-    generated plots.
+    Update the dashboard by storing the full resolution data of the rooms
+    whose data changed since it was last stored, from which their plots are
+    rendered on demand. With `prerender`, the plots of the changed rooms are
+    rendered to disk as well, in a process pool when there are several.
 
     Args:
         plot_data (dict[str, pd.DataFrame]): dict containing room data as
         Pandas DataFrames, indexed by room name.
+        workers (int, optional): Number of processes to render the plots
+            with. 0 means all cores. Defaults to DASHBOARD_WORKERS.
+        prerender (bool, optional): Render the plots of the rooms to disk.
+            Defaults to DASHBOARD_PRERENDER.
+        staging (DashboardStaging, optional): Write the changed rooms to this
+            staging directory instead, until it is published. Defaults to
+            None, which updates the dashboard right away.
 
     Side Effects:
-        - Directories for storing plots may be created.
-        - Plot files may be written to disk.
+        - Directories for storing data and plots may be created.
+        - Room data files, and plot files, may be written to disk.
+        - Unless staged, the rooms are added to the plot index (see
+          `index.add_to_index`).
+    """
+    write_plotlyjs()
+    rooms = [room for room in plot_data.values() if not room.empty]
+    keys = [room_key(room) for room in rooms]
+    changed: dict[Path, tuple[pd.DataFrame, str, Path]] = {}
+    for key, room in zip(keys, rooms):
+        data, path, digest = data_path(*key), plot_path(*key), content_hash(room)
+        if stored_data_hash(data) != digest or (
+            prerender and stored_hash(path) != digest
+        ):
+            if staging is not None:
+                data, path = staging.data_path(*key), staging.plot_path(*key)
+            changed[data] = (room[PLOT_COLUMNS], digest, path)
+
+    action = "Rendering" if prerender else "Storing"
+    logger.info(f"{action} {len(changed)} of {len(plot_data)} rooms")
+
+    # without rendering, storing the data is cheaper than starting processes
+    n_workers = min(len(changed), workers or os.cpu_count() or 1) if prerender else 1
+    if n_workers <= 1:
+        for data, (room, digest, path) in changed.items():
+            store_room(room, data, digest, path, prerender)
+    else:
+        frames, digests, paths = zip(*changed.values())
+        with ProcessPoolExecutor(max_workers=n_workers) as ex:
+            list(
+                ex.map(
+                    store_room,
+                    frames,
+                    changed,
+                    digests,
+                    paths,
+                    [prerender] * len(changed),
+                )
+            )
+
+    # once all rooms are written, so the index never lists a missing room.
+    # Staged rooms are indexed when they are published
+    if staging is None:
+        add_to_index(DASHBOARD_DATA_DIR, keys)
+
+
+class DashboardStaging:
+    """Dashboard updates held back in a staging directory until `publish`.
+
+    The staged data and plot files are kept in hidden directories inside
+    DASHBOARD_DATA_DIR and PLOTS_DIR, so that publishing only renames them
+    into place. Rooms whose data is staged without a plot have their old
+    plot removed when they are published, as `store_room` does.
+
+    Attributes:
+        - data_dir (Path): The staged data files.
+        - plots_dir (Path): The staged plot files.
+        - workers (int): Number of processes to render the plots with.
+        - prerender (bool): Render the plots of the rooms to disk.
+
+    Examples:
+        ```python
+        staging = DashboardStaging()
+        try:
+            train_models(batches, on_results=staging.update)
+        except BaseException:
+            staging.discard()
+            raise
+        staging.publish(keep=fingerprints)
+        ```
+    """
+
+    def __init__(
+        self,
+        workers: int = DASHBOARD_WORKERS,
+        prerender: bool = DASHBOARD_PRERENDER,
+    ):
+        name = f".staging-{uuid4().hex}"
+        self.data_dir = Path(DASHBOARD_DATA_DIR) / name
+        self.plots_dir = Path(PLOTS_DIR) / name
+        self.workers = workers
+        self.prerender = prerender
+
+    def data_path(self, municipality: str, school: str, room_id: str) -> Path:
+        """The staged data file of a room."""
+        return self.data_dir / municipality / school / f"{room_id}.parquet"
+
+    def plot_path(self, municipality: str, school: str, room_id: str) -> Path:
+        """The staged plot file of a room."""
+        return self.plots_dir / municipality / school / f"{room_id}.json"
+
+    def update(self, plot_data: dict[str, pd.DataFrame]) -> None:
+        """Stage the rooms that changed, see `update_dashboard`."""
+        update_dashboard(plot_data, self.workers, self.prerender, staging=self)
+
+    def publish(self, keep: Iterable[str] | None = None) -> None:
+        """
+        Move the Staged Rooms Onto the Dashboard
+
+        Args:
+            keep (Iterable[str], optional): The names (SKOLE_ID) of the rooms
+                to keep, see `prune_dashboard`. Defaults to None, which keeps
+                all rooms.
+        """
+        staged = sorted(self.data_dir.glob("*/*/*.parquet"))
+        for staged_data in staged:
+            key = staged_data.parent.parent.name, staged_data.parent.name
+            key += (staged_data.stem,)
+            data, path = data_path(*key), plot_path(*key)
+            data.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged_data, data)
+
+            path.with_suffix(".html").unlink(missing_ok=True)
+            if (staged_plot := self.plot_path(*key)).exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staged_plot, path)
+            else:
+                path.unlink(missing_ok=True)
+        self.discard()
+
+        logger.info(f"Published {len(staged)} rooms to the dashboard")
+        if keep is None:
+            write_index(DASHBOARD_DATA_DIR)
+        else:
+            prune_dashboard(keep)
+
+    def discard(self) -> None:
+        """Remove the staged rooms."""
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+        shutil.rmtree(self.plots_dir, ignore_errors=True)
+
+
+def stored_room_name(path: Path) -> str | None:
+    """The SKOLE_ID of the room of a data file, or None if it has no data.
+    Files stored before the name was kept in their metadata are read."""
+    try:
+        name = (pq.read_schema(path).metadata or {}).get(DATA_ROOM_KEY)
+        if name is not None:
+            return name.decode()
+        room = pq.read_table(path, columns=["SKOLE", "ID"]).slice(0, 1).to_pandas()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    return room_name(room) if not room.empty else None
+
+
+def prune_dashboard(rooms: Iterable[str]) -> None:
+    """
+    Remove the Rooms That Are No Longer Scored
+
+    Removes the stored data, and any pre-rendered plot, of the rooms that are
+    not in `rooms`, e.g. because they were removed from the data source, and
+    rebuilds the index of the dashboard, so they are no longer listed.
+
+    Args:
+        rooms (Iterable[str]): The names (SKOLE_ID) of the rooms to keep,
+            e.g. the fingerprinted rooms of the training table.
     """
+    keep = set(rooms)
+    removed = 0
+    for data in Path(DASHBOARD_DATA_DIR).glob("*/*/*.parquet"):
+        if stored_room_name(data) in keep:
+            continue
+        municipality, school = data.parent.parent.name, data.parent.name
+        path = plot_path(municipality, school, data.stem)
+        for file in (data, path, path.with_suffix(".html")):
+            file.unlink(missing_ok=True)
+        removed += 1
 
-    named_plots: dict[tuple(str, str, str), object] = process_for_dashboard(plot_data)
-    save_figures(named_plots)
+    if removed:
+        logger.info(f"Removed {removed} rooms from the dashboard")
+    write_index(DASHBOARD_DATA_DIR)
@@ -0,0 +1,101 @@
+"""
+Figure Cache Module
+
+This module contains an in-memory cache of the rendered figure specs of the
+dashboard. The plots of the rooms are no longer rendered when the models are
+trained, but when they are first requested (see `room_spec`), and the
+rendered specs are kept here, so a room is only rendered again when it was
+scored by another model version or its data changed.
+
+The cache is a least recently used cache, bounded by the total size of the
+specs in it, DASHBOARD_CACHE_MAX_BYTES, rather than by their number, since
+the specs of rooms with long histories are much larger than the others.
+
+Modules:
+    - FigureCache: A size-bounded LRU cache of figure specs.
+    - figure_cache: The global FigureCache of the application.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Hashable
+
+from tilly.config import DASHBOARD_CACHE_MAX_BYTES
+
+
+class FigureCache:
+    """Figure specs by key, with a size-bounded LRU policy.
+
+    Attributes:
+        - max_bytes (int): The most bytes of specs to keep. 0 keeps none.
+    """
+
+    def __init__(self, max_bytes: int = DASHBOARD_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._specs: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> bytes | None:
+        """The spec of a key, or None if it is not cached. Getting a spec
+        marks it as recently used."""
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is not None:
+                self._specs.move_to_end(key)
+            return spec
+
+    def put(self, key: Hashable, spec: bytes) -> None:
+        """Cache a spec, and evict the least recently used specs until the
+        cache is at most `max_bytes`. Specs larger than that are not cached."""
+        if len(spec) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._specs:
+                self._size -= len(self._specs.pop(key))
+            self._specs[key] = spec
+            self._size += len(spec)
+            while self._size > self.max_bytes:
+                _, evicted = self._specs.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get_or_render(
+        self, key: Hashable, render: Callable[[], bytes | None]
+    ) -> bytes | None:
+        """
+        Get a Spec, Rendering it on a Miss
+
+        The spec is rendered outside of the lock, so requests for other rooms
+        are not held up by it.
+
+        Args:
+            key (Hashable): The key of the spec.
+            render (Callable[[], bytes | None]): Renders the spec, or returns
+                None if there is nothing to render, which is not cached.
+
+        Returns:
+            bytes | None: The spec, or None if `render` returned None.
+        """
+        spec = self.get(key)
+        if spec is None:
+            spec = render()
+            if spec is not None:
+                self.put(key, spec)
+        return spec
+
+    def clear(self) -> None:
+        """Remove all specs."""
+        with self._lock:
+            self._specs.clear()
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        """The size of the cached specs, in bytes."""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+
+figure_cache = FigureCache()
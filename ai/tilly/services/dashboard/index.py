@@ -0,0 +1,204 @@
+"""
+Plot Index Module
+
+This module contains the index of the dashboard plots: which rooms can be
+plotted, per municipality and school. These are the rooms whose scored data
+is stored in DASHBOARD_DATA_DIR (see `update_dashboard`), and the index is
+kept as a manifest next to them, `DASHBOARD_DATA_DIR/.index.json`, so that
+`/plots_structure` does not walk the directory tree of thousands of rooms on
+every request:
+
+    {"<kommune>": {"<skole>": ["<room>", ...], ...}, ...}
+
+`update_dashboard` adds the rooms it stored to the manifest, without walking
+the directory, so updating the dashboard batch by batch stays linear in the
+number of rooms. `prune_dashboard`, which runs once at the end of a training,
+rebuilds the manifest from the stored rooms, so rooms that are no longer
+stored leave the index. The API keeps the manifest in memory (see
+`PlotIndex`), and only reads it again when the file changed, so workers that
+did not run the training pick up new plots too. The hash of the manifest is
+its ETag.
+
+Modules:
+    - write_index: Rebuild the manifest of a data directory.
+    - add_to_index: Add rooms to the manifest of a data directory.
+    - build_index: Index the stored rooms of a data directory.
+    - PlotIndex: The manifest, loaded in memory, with filtering and paging.
+    - plot_index: The global PlotIndex of the application.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock
+
+from tilly.config import DASHBOARD_DATA_DIR
+
+INDEX_NAME = ".index.json"
+
+# municipality -> school -> rooms
+Structure = dict[str, dict[str, list[str]]]
+
+
+def build_index(data_dir: Path) -> Structure:
+    """Index the stored rooms of a data directory, by walking it once."""
+    rooms = [
+        (path.parent.parent.name, path.parent.name, path.stem)
+        for path in Path(data_dir).glob("*/*/*.parquet")
+    ]
+    return _structure(rooms)
+
+
+def _structure(rooms: list[tuple[str, str, str]]) -> Structure:
+    """The index of (municipality, school, room) keys, in sorted order."""
+    structure: Structure = {}
+    for municipality, school, room in sorted(set(rooms)):
+        structure.setdefault(municipality, {}).setdefault(school, []).append(room)
+    return structure
+
+
+def write_index(data_dir: Path) -> None:
+    """
+    Rebuild the Plot Index
+
+    Indexes the rooms stored in a data directory, and writes the manifest if
+    it changed, so rooms whose data was removed leave the index.
+
+    Args:
+        data_dir (Path): The data directory, see DASHBOARD_DATA_DIR.
+    """
+    _write_manifest(Path(data_dir) / INDEX_NAME, build_index(data_dir))
+
+
+def add_to_index(data_dir: Path, rooms: list[tuple[str, str, str]]) -> None:
+    """
+    Add Rooms to the Plot Index
+
+    Adds rooms that were just stored to the manifest, without walking the
+    data directory. If there is no manifest yet, it is built from the stored
+    rooms instead.
+
+    Args:
+        data_dir (Path): The data directory, see DASHBOARD_DATA_DIR.
+        rooms (list[tuple[str, str, str]]): The (municipality, school, room)
+            of the stored rooms.
+    """
+    path = Path(data_dir) / INDEX_NAME
+    try:
+        structure: Structure = json.loads(path.read_bytes())
+    except (FileNotFoundError, ValueError):
+        structure = build_index(data_dir)
+
+    indexed = [
+        (municipality, school, room)
+        for municipality, schools in structure.items()
+        for school, school_rooms in schools.items()
+        for room in school_rooms
+    ]
+    _write_manifest(path, _structure(indexed + list(rooms)))
+
+
+def _write_manifest(path: Path, structure: Structure) -> None:
+    """Write the manifest, if it changed."""
+    content = json.dumps(structure).encode()
+    try:
+        if path.read_bytes() == content:
+            return
+    except FileNotFoundError:
+        pass
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{INDEX_NAME}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+class PlotIndex:
+    """The plot index of a data directory, loaded in memory.
+
+    The manifest is read again when its modification time or size changed.
+    If there is no manifest yet, it is built from the stored rooms.
+
+    Attributes:
+        - data_dir (Path): The data directory.
+    """
+
+    def __init__(self, data_dir: Path = DASHBOARD_DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self._structure: Structure | None = None
+        self._etag = ""
+        self._stamp: tuple[int, int] | None = None
+        self._lock = Lock()
+
+    def snapshot(self) -> tuple[Structure | None, str]:
+        """
+        The Current Index
+
+        Returns:
+            tuple[Structure | None, str]: The index, or None if there is no
+                data directory, and its ETag.
+        """
+        path = self.data_dir / INDEX_NAME
+        with self._lock:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                if not self.data_dir.is_dir():
+                    return None, ""
+                write_index(self.data_dir)
+                stat = path.stat()
+
+            if (stat.st_mtime_ns, stat.st_size) != self._stamp:
+                content = path.read_bytes()
+                self._structure = json.loads(content)
+                self._etag = hashlib.sha1(content).hexdigest()[:16]
+                self._stamp = (stat.st_mtime_ns, stat.st_size)
+            return self._structure, self._etag
+
+    def query(
+        self,
+        kommune: str | None = None,
+        skole: str | None = None,
+        offset: int = 0,
+        limit: int | None = None,
+    ) -> tuple[dict | None, int, str]:
+        """
+        Filter and Page the Index
+
+        The schools matching `kommune` and `skole` are ordered by
+        municipality and school, and `limit` of them are returned, starting
+        at `offset`, with all their rooms.
+
+        Args:
+            kommune (str, optional): Only this municipality. Defaults to all.
+            skole (str, optional): Only schools of this name. Defaults to all.
+            offset (int, optional): Schools to skip. Defaults to 0.
+            limit (int, optional): Most schools to return. Defaults to all.
+
+        Returns:
+            tuple[dict | None, int, str]: The structure of the returned
+                schools, as `{kommune: {skole: {room: None}}}`, or None if
+                there is no data directory. Then the number of matching
+                schools, and the ETag of the index.
+        """
+        structure, etag = self.snapshot()
+        if structure is None:
+            return None, 0, etag
+
+        schools = [
+            (municipality, school, rooms)
+            for municipality, municipality_schools in structure.items()
+            if kommune is None or municipality == kommune
+            for school, rooms in municipality_schools.items()
+            if skole is None or school == skole
+        ]
+        end = None if limit is None else offset + limit
+
+        page: dict = {}
+        for municipality, school, rooms in schools[offset:end]:
+            page.setdefault(municipality, {})[school] = dict.fromkeys(rooms)
+        return page, len(schools), etag
+
+
+plot_index = PlotIndex()
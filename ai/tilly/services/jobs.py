@@ -0,0 +1,223 @@
+"""
+Job Manager Module
+
+This module runs long flows, such as training and scoring, as background
+jobs, so that the API keeps serving other requests while they run. Each job
+gets an id, and its status and progress can be looked up while it runs and
+after it has finished.
+
+At most one job of each kind runs at a time: submitting a job while one of
+the same kind is running raises `JobAlreadyRunning`.
+
+Jobs can be cancelled cooperatively: `Job.cancel` only flags the job, and the
+job stops the next time it reports progress with `Job.advance` (e.g. between
+two rooms), or checks for it with `Job.check_cancelled` (e.g. between two
+batches), by raising `JobCancelled`.
+
+Modules:
+    - Job: A background job, with its status and progress.
+    - JobManager: Starts jobs in background threads and keeps track of them.
+    - jobs: The global JobManager of the application.
+"""
+
+import time
+import uuid
+from dataclasses import dataclass, field
+from enum import Enum
+from threading import Lock, Thread
+from typing import Any, Callable
+
+from loguru import logger
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobAlreadyRunning(Exception):
+    """Raised when a job is submitted while one of the same kind is running."""
+
+    def __init__(self, job: "Job"):
+        super().__init__(f"A {job.kind} job is already running: {job.id}")
+        self.job = job
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it reports progress after being cancelled."""
+
+
+@dataclass
+class Job:
+    """A background job.
+
+    Attributes:
+        - id (str): The id of the job.
+        - kind (str): The kind of job, e.g. "predict".
+        - status (JobStatus): The current status of the job.
+        - progress (dict[str, Any]): Progress counters reported by the job,
+            e.g. rooms done and rows written.
+        - error (str | None): The error message, if the job failed.
+        - cancel_requested (bool): Whether the job has been asked to stop.
+    """
+
+    kind: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.PENDING
+    progress: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    cancel_requested: bool = False
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (JobStatus.PENDING, JobStatus.RUNNING)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds the job has been running for, or ran for if it finished."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def update(self, **progress) -> None:
+        """Set progress counters, e.g. `job.update(rooms_total=120)`."""
+        with self._lock:
+            self.progress.update(progress)
+
+    def increment(self, **progress) -> None:
+        """Add to progress counters, e.g. `job.increment(rows_written=9600)`."""
+        with self._lock:
+            for key, value in progress.items():
+                self.progress[key] = self.progress.get(key, 0) + value
+
+    def advance(self, stage: str, n: int = 1) -> None:
+        """Count `n` more items (e.g. rooms) done in a stage of the job.
+
+        This is also where cancellation happens: if the job has been
+        cancelled, `JobCancelled` is raised instead.
+
+        Args:
+            stage (str): The stage of the job, e.g. "fit_predict".
+            n (int, optional): Number of items done. Defaults to 1.
+
+        Raises:
+            JobCancelled: If the job has been cancelled.
+        """
+        self.check_cancelled()
+
+        with self._lock:
+            stages = self.progress.setdefault("stages", {})
+            stages[stage] = stages.get(stage, 0) + n
+            self.progress["stage"] = stage
+
+    def check_cancelled(self) -> None:
+        """Stop the job here if it has been cancelled.
+
+        Raises:
+            JobCancelled: If the job has been cancelled.
+        """
+        if self.cancel_requested:
+            raise JobCancelled(f"{self.kind} job {self.id} was cancelled")
+
+    def cancel(self) -> None:
+        """Ask the job to stop at its next progress report."""
+        if self.is_active:
+            self.cancel_requested = True
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status.value,
+                "progress": dict(self.progress),
+                "elapsed_seconds": round(self.elapsed, 3),
+                "error": self.error,
+                "cancel_requested": self.cancel_requested,
+            }
+
+
+class JobManager:
+    """Starts jobs in background threads and keeps track of them.
+
+    Finished jobs are kept, so their result can be looked up, up to
+    `max_history` jobs.
+    """
+
+    def __init__(self, max_history: int = 100):
+        self.max_history = max_history
+        self._jobs: dict[str, Job] = {}
+        self._lock = Lock()
+
+    def submit(self, kind: str, func: Callable[..., Any], *args, **kwargs) -> Job:
+        """Run `func(job, *args, **kwargs)` as a background job.
+
+        The function receives the job as its first argument, to report
+        progress with `job.update`, `job.increment` and `job.advance`.
+
+        Args:
+            kind (str): The kind of job. Only one job of a kind runs at a time.
+            func (Callable[..., Any]): The function to run.
+
+        Raises:
+            JobAlreadyRunning: If a job of the same kind is running.
+
+        Returns:
+            Job: The submitted job.
+        """
+        with self._lock:
+            if running := self.active(kind):
+                raise JobAlreadyRunning(running)
+
+            job = Job(kind=kind)
+            self._jobs[job.id] = job
+            self._prune()
+
+        Thread(
+            target=self._run, args=(job, func, args, kwargs), name=f"job-{kind}"
+        ).start()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """The job with the given id, if it exists."""
+        return self._jobs.get(job_id)
+
+    def active(self, kind: str) -> Job | None:
+        """The pending or running job of the given kind, if any."""
+        return next(
+            (job for job in self._jobs.values() if job.kind == kind and job.is_active),
+            None,
+        )
+
+    def _run(self, job: Job, func: Callable, args: tuple, kwargs: dict) -> None:
+        job.status, job.started = JobStatus.RUNNING, time.time()
+        logger.info(f"Started {job.kind} job {job.id}")
+        try:
+            func(job, *args, **kwargs)
+            job.status = JobStatus.COMPLETED
+        except JobCancelled:
+            job.status = JobStatus.CANCELLED
+        except Exception as e:
+            logger.exception(f"{job.kind} job {job.id} failed")
+            job.status, job.error = JobStatus.FAILED, str(e)
+        finally:
+            job.finished = time.time()
+            logger.info(
+                f"{job.kind} job {job.id} {job.status.value} in {job.elapsed:.1f}s"
+            )
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond `max_history`."""
+        finished = [job for job in self._jobs.values() if not job.is_active]
+        for job in finished[: max(len(self._jobs) - self.max_history, 0)]:
+            del self._jobs[job.id]
+
+
+jobs = JobManager()
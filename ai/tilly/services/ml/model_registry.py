@@ -5,32 +5,152 @@ This module manages the model registry for machine learning models in the
 Tilly system. It contains utilities for training, predicting, and handling
 models that are specific to each room.
 
-The `ModelRegistry` is a singleton class that holds a dictionary of trained
-models, ensuring only one instance exists across the application.
+The `ModelRegistry` holds a dictionary of trained models. The registry the
+API serves is the global one of `update_registry` and `get_current_registry`:
+a new training builds a registry of its own, and swaps it in once it is
+complete, so jobs scoring with the current registry are never affected.
 
 Modules:
     - update_registry: Function to update the global model registry.
     - get_current_registry: Function to fetch the current model registry.
-    - ModelRegistry: Singleton class to manage room-specific models.
+    - ModelRegistry: Class to manage room-specific models.
 """
 
-from threading import Lock
-from typing import Dict
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from math import isqrt
+from typing import Callable, Dict, Iterable, MutableMapping
+from joblib import Parallel, delayed
 from tqdm import tqdm
 from loguru import logger
+from numpy import ndarray
 from pandas import DataFrame
 
 from tilly.services.ml.transformations import Transformer as T
-from tilly.config import FEATURES
+from tilly.config import (
+    FEATURES,
+    BATCHED_FEATURIZATION,
+    BATCHED_HEURISTICS,
+    MODEL_PARAMS,
+    FIT_EXECUTOR,
+    FIT_CORES,
+    SCORE_EXECUTOR,
+    SCORE_CORES,
+    SCORE_BATCH_ROWS,
+)
 from tilly.services.ml.model import Model
 
+EXECUTORS = ("serial", "process", "thread", "loky")
+
+# Called as progress(stage, n) when n more rooms are done in a stage
+Progress = Callable[[str, int], None]
+
+
+# Parallel fitting helpers
+####################
+
+
+def split_cores(n_rooms: int, executor: str, n_cores: int = 0) -> tuple[int, int]:
+    """Split the available cores between outer workers (rooms fitted
+    concurrently) and inner `n_jobs` (trees fitted concurrently per room).
+
+    - "serial" fits one room at a time on a single core, as before.
+    - "process" and "loky" give each room its own worker, and only hand
+      out spare cores to `n_jobs` when there are fewer rooms than cores.
+    - "thread" leans on sklearn's own threading, since the pandas parts
+      of a room hold the GIL: roughly sqrt(cores) rooms at a time, each
+      with an equal share of the cores as `n_jobs`.
+
+    Args:
+        n_rooms (int): Number of rooms to fit.
+        executor (str): One of EXECUTORS.
+        n_cores (int, optional): Cores available. 0 means all cores.
+
+    Returns:
+        tuple[int, int]: The number of outer workers and the inner `n_jobs`.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor '{executor}', expected one of {EXECUTORS}")
+
+    n_cores = n_cores or os.cpu_count() or 1
+    if executor == "serial" or n_rooms <= 1:
+        return 1, 1 if executor == "serial" else n_cores
+
+    n_workers = min(n_rooms, isqrt(n_cores) if executor == "thread" else n_cores)
+    n_workers = max(n_workers, 1)
+    return n_workers, max(n_cores // n_workers, 1)
+
+
+def fit_predict_room(
+    name: str, timeslots: DataFrame, n_jobs: int = 1
+) -> tuple[str, Model, DataFrame]:
+    """Fit a model on a single room and predict on the same data.
+
+    Defined at module level, so it can be shipped to worker processes.
+
+    Args:
+        name (str): The name of the room.
+        timeslots (DataFrame): The preprocessed room data.
+        n_jobs (int, optional): `n_jobs` for the IsolationForest.
+            Does not change the fitted model. Defaults to 1.
+
+    Returns:
+        tuple[str, Model, DataFrame]: The room name, the fitted model,
+            and the predicted DataFrame.
+    """
+    features = timeslots[FEATURES]  # extract features
+    model = Model(
+        estimated_usage=0.3, model_params={**MODEL_PARAMS, "n_jobs": n_jobs}
+    ).fit(X=features)
+    return name, model, ModelRegistry.score_room(model, timeslots)
+
+
+# Batched scoring helpers
+####################
+
+
+def batch_rooms(
+    rooms: dict[str, DataFrame], batch_rows: int = SCORE_BATCH_ROWS
+) -> list[list[str]]:
+    """Group rooms into batches of about `batch_rows` rows, in order.
+    A room larger than `batch_rows` gets a batch of its own."""
+    batches, rows = [], batch_rows
+    for name, room in rooms.items():
+        if rows + len(room) > batch_rows:
+            batches.append([])
+            rows = 0
+        batches[-1].append(name)
+        rows += len(room)
+    return batches
+
+
+def score_batch(
+    batch: list[tuple[str, Model, DataFrame]]
+) -> list[tuple[str, ndarray, ndarray]]:
+    """Score the feature matrices of a batch of rooms with their models.
+
+    Defined at module level, so it can be shipped to worker processes. Only
+    the scores and predictions are sent back, not the rooms.
+
+    Args:
+        batch (list[tuple[str, Model, DataFrame]]): The name, model and
+            feature matrix of each room.
+
+    Returns:
+        list[tuple[str, ndarray, ndarray]]: The name, scores and predictions
+            of each room.
+    """
+    return [
+        (name, *model.score_and_predict(features)) for name, model, features in batch
+    ]
+
 
 # ModelRegistry Class
 ####################
 
 
 class ModelRegistry:
-    """A singleton class representing the model registry.
+    """A class representing the model registry.
 
     This class is responsible for training, fitting, predicting, and managing
     each model. It holds a dictionary of models that are specific to each room.
@@ -38,6 +158,10 @@ class ModelRegistry:
     Attributes:
         - models (Dict[str, Model]): A dictionary holding room-specific
             machine learning models.
+        - version (str | None): The version the registry was saved as
+            in the model store, if it has been saved.
+        - fingerprints (Dict[str, dict]): The fingerprint of the training
+            data of each room, used to find the rooms to refit.
 
     Methods:
         - train: Train models based on new timeslot data.
@@ -47,76 +171,225 @@ class ModelRegistry:
         - postprocess: Postprocesses the predicted data for each room.
     """
 
-    _instance = None
-    _lock = Lock()
-
-    def __new__(cls):
-        """Ensures that only one instance of the class exists."""
-        with cls._lock:
-            if cls._instance is None:
-                cls._instance = super(ModelRegistry, cls).__new__(cls)
-        return cls._instance
-
     def __init__(self):
         """Initializes an empty model dictionary."""
         self.models: Dict[str, Model] = {}
-
-    def train(self, timeslots: dict[str, DataFrame]) -> None:
+        self.version: str | None = None
+        self.fingerprints: Dict[str, dict] = {}
+
+    def train(
+        self,
+        timeslots: dict[str, DataFrame],
+        progress: Progress | None = None,
+        featurized: bool = False,
+    ) -> None:
         """Train models based on new timeslot data and store them in the registry.
 
         Args:
             timeslots (dict[str, DataFrame]): The timeslots data to train on,
                 per room.
+            progress (Progress, optional): Called as `progress(stage, n)` when
+                `n` more rooms are done in the "preprocess", "fit_predict" or
+                "postprocess" stage. It may raise to stop the training between
+                two rooms. Defaults to None.
+            featurized (bool, optional): Whether the timeslots are already
+                preprocessed, e.g. by `crud.stream_featurized`. Defaults to False.
         """
-        _preprocessed: dict[str, DataFrame] = self.preprocess(timeslots)
-        room_results: dict[str, DataFrame] = self.fit_predict(_preprocessed)
-        _postprocessed: dict[str, DataFrame] = self.postprocess(room_results)
+        if featurized:
+            _preprocessed = timeslots
+            if progress is not None:
+                progress("preprocess", len(timeslots))
+        else:
+            _preprocessed = self.preprocess(timeslots, progress=progress)
+        room_results = self.fit_predict(_preprocessed, progress=progress)
+        _postprocessed = self.postprocess(room_results, progress=progress)
 
         return _postprocessed
 
-    def fit_predict(self, rooms: dict[str, DataFrame]) -> Dict[str, DataFrame]:
+    def select(self, rooms: Iterable[str]) -> MutableMapping[str, Model]:
+        """The models of the given rooms, without loading any lazy models.
+
+        Args:
+            rooms (Iterable[str]): The rooms to select. Rooms without a model
+                are skipped.
+
+        Returns:
+            MutableMapping[str, Model]: The selected models.
+        """
+        if hasattr(self.models, "subset"):
+            return self.models.subset(rooms)
+        return {name: self.models[name] for name in rooms if name in self.models}
+
+    def fit_predict(
+        self,
+        rooms: dict[str, DataFrame],
+        executor: str = FIT_EXECUTOR,
+        n_cores: int = FIT_CORES,
+        progress: Progress | None = None,
+    ) -> Dict[str, DataFrame]:
         """Train and predict on new room data.
 
+        Rooms are independent, so they can be fitted concurrently. With a
+        fixed `random_state` in MODEL_PARAMS, every executor produces the
+        same models and predictions as the serial run.
+
         Args:
             rooms (dict[str, DataFrame]): Room data to fit and predict on.
+            executor (str, optional): "serial", "process", "thread" or
+                "loky". Defaults to FIT_EXECUTOR.
+            n_cores (int, optional): Cores to spread the work over.
+                0 means all cores. Defaults to FIT_CORES.
+            progress (Progress, optional): Called after each fitted room.
+                Defaults to None.
 
         Returns:
             Dict[str, DataFrame]: The predicted DataFrame for each room.
         """
+        rooms = {name: room for name, room in rooms.items() if not room.empty}
+        n_workers, n_jobs = split_cores(len(rooms), executor, n_cores)
+        logger.info(
+            f"Fitting {len(rooms)} rooms | executor = {executor} | "
+            + f"workers = {n_workers} | n_jobs = {n_jobs}"
+        )
 
-        output = {}
+        models, output = {}, {}
         with tqdm(total=len(rooms), desc="Initial") as pbar:
-            for name, timeslots in rooms.items():
+            for name, model, predicted in self._fit_predict_rooms(
+                rooms, executor, n_workers, n_jobs
+            ):
                 pbar.set_postfix_str(f"Running fit_predict | Room: {name}")
                 pbar.update(1)
 
-                if not timeslots.empty:
-                    features = timeslots[FEATURES]  # extract features
-                    model = Model(estimated_usage=0.3).fit(X=features)  # fit model
-                    self.models[name] = model  # add model to registry
-
-                    # make predictions
-                    output[name]: DataFrame = self._predict(name, timeslots)
-
-        return output
+                models[name] = model
+                output[name] = predicted
+                if progress is not None:
+                    progress("fit_predict", 1)
+
+        # add models to registry in the input order of the rooms,
+        # whatever order they finished in
+        self.models.update({name: models[name] for name in rooms})
+        return {name: output[name] for name in rooms}
+
+    def _fit_predict_rooms(
+        self, rooms: dict[str, DataFrame], executor: str, n_workers: int, n_jobs: int
+    ):
+        """Yield (name, model, predictions) for each room, as they finish."""
+        if executor == "serial" or n_workers == 1:
+            for name, timeslots in rooms.items():
+                yield fit_predict_room(name, timeslots, n_jobs)
+
+        elif executor == "loky":
+            yield from Parallel(
+                n_jobs=n_workers, backend="loky", return_as="generator"
+            )(
+                delayed(fit_predict_room)(name, timeslots, n_jobs)
+                for name, timeslots in rooms.items()
+            )
 
-    def predict(self, rooms: dict[str, DataFrame]) -> dict[str, DataFrame]:
+        else:
+            pool = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+            ex = pool(max_workers=n_workers)
+            try:
+                futures = [
+                    ex.submit(fit_predict_room, name, timeslots, n_jobs)
+                    for name, timeslots in rooms.items()
+                ]
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                # drop the rooms not started yet if the caller stopped early
+                ex.shutdown(cancel_futures=True)
+
+    def predict(
+        self, rooms: dict[str, DataFrame], n_cores: int = SCORE_CORES
+    ) -> dict[str, DataFrame]:
         """Make predictions using pre-trained models in the registry.
 
         Args:
             rooms (dict[str, DataFrame]): Room data to predict on.
+            n_cores (int, optional): Cores to score with, see `score_rooms`.
+                0 means all cores. Defaults to SCORE_CORES.
 
         Returns:
             dict[str, DataFrame]: The predicted DataFrame for each room.
         """
         _preprocessed: dict[str, DataFrame] = self.preprocess(rooms)
-        _predictions = {
-            name: self._predict(name, room)
-            for name, room in tqdm(_preprocessed.items())
-            if not room.empty
-        }
+        _predictions = self.score_rooms(
+            {name: room for name, room in _preprocessed.items() if not room.empty},
+            n_cores=n_cores,
+        )
         return self.postprocess(_predictions)
 
+    def score_rooms(
+        self,
+        rooms: dict[str, DataFrame],
+        executor: str = SCORE_EXECUTOR,
+        n_cores: int = SCORE_CORES,
+        batch_rows: int = SCORE_BATCH_ROWS,
+    ) -> dict[str, DataFrame]:
+        """Score many rooms with their models in the registry.
+
+        The feature matrices of the rooms are sent to the workers in batches
+        of about `batch_rows` rows, so each worker makes a single pass over
+        many rooms instead of being handed one room at a time. Each room is
+        scored with one `Model.score_and_predict`. Rooms without a model are
+        handled as in `_predict`.
+
+        With the "process" and "loky" executors, the models of a batch are
+        pickled to the worker along with it.
+
+        Args:
+            rooms (dict[str, DataFrame]): Preprocessed room data to score.
+            executor (str, optional): "serial", "process", "thread" or
+                "loky". Defaults to SCORE_EXECUTOR.
+            n_cores (int, optional): Cores to spread the batches over.
+                0 means all cores. Defaults to SCORE_CORES.
+            batch_rows (int, optional): Rows per batch. Defaults to
+                SCORE_BATCH_ROWS.
+
+        Returns:
+            dict[str, DataFrame]: The predicted DataFrame for each room, in
+                the order of `rooms`.
+        """
+        if executor not in EXECUTORS:
+            raise ValueError(
+                f"Unknown executor '{executor}', expected one of {EXECUTORS}"
+            )
+
+        scored = {name: room for name, room in rooms.items() if name in self.models}
+        batches = [
+            [(name, self.models[name], scored[name][FEATURES]) for name in batch]
+            for batch in batch_rooms(scored, batch_rows)
+        ]
+        n_workers = min(len(batches), n_cores or os.cpu_count() or 1)
+        logger.info(
+            f"Scoring {len(scored)} rooms in {len(batches)} batches | "
+            + f"executor = {executor} | workers = {n_workers}"
+        )
+
+        if executor == "serial" or n_workers <= 1:
+            results = map(score_batch, batches)
+        elif executor == "loky":
+            results = Parallel(n_jobs=n_workers, backend="loky")(
+                delayed(score_batch)(batch) for batch in batches
+            )
+        else:
+            pool = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+            with pool(max_workers=n_workers) as ex:
+                results = list(ex.map(score_batch, batches))
+
+        predictions = {
+            name: scored[name].assign(ANOMALY_SCORE=scores, IN_USE=preds)
+            for result in tqdm(results, total=len(batches))
+            for name, scores, preds in result
+        }
+        return {
+            name: predictions[name]
+            if name in predictions
+            else self._predict(name, room)
+            for name, room in rooms.items()
+        }
+
     def _predict(self, name: str, room: DataFrame) -> DataFrame:
         """
         Make predictions for a specific room using its corresponding
@@ -130,51 +403,105 @@ class ModelRegistry:
             DataFrame: The predicted DataFrame for the room.
         """
 
-        # extract features
-        features = room[FEATURES]
-
         # load model from registry
         if model := self.models.get(name):
-            # extract scores and predictions
-            scores: list[float] = model.score(features)
-            preds: list[int] = model.predict(features)
+            return self.score_room(model, room)
 
-        else:
-            scores, preds = T.handle_missing_model(
-                room_name=name, room=room, models=self.models.keys()
-            )
+        scores, preds = T.handle_missing_model(
+            room_name=name, room=room, models=self.models.keys()
+        )
+        return room.assign(
+            ANOMALY_SCORE=scores,
+            IN_USE=preds,
+        )
+
+    @staticmethod
+    def score_room(model: Model, room: DataFrame) -> DataFrame:
+        """
+        Score a room with the given model.
+
+        Args:
+            model (Model): The fitted model of the room.
+            room (DataFrame): The room data to predict on.
+
+        Returns:
+            DataFrame: The room with ANOMALY_SCORE and IN_USE columns added.
+        """
+        # extract features
+        features = room[FEATURES]
+
+        # extract scores and predictions, in one pass over the forest
+        scores, preds = model.score_and_predict(features)
 
         return room.assign(
             ANOMALY_SCORE=scores,
             IN_USE=preds,
         )
 
-    def preprocess(self, timeslots: dict[str, DataFrame]) -> dict[str, DataFrame]:
+    def preprocess(
+        self,
+        timeslots: dict[str, DataFrame],
+        batched: bool = BATCHED_FEATURIZATION,
+        progress: Progress | None = None,
+    ) -> dict[str, DataFrame]:
         """
         Preprocesses the input timeslot data for each room.
 
         Args:
             timeslots (dict[str, DataFrame]): The timeslot data for each room.
+            batched (bool, optional): Whether to featurize all rooms in one
+                batched pass. Defaults to BATCHED_FEATURIZATION.
+            progress (Progress, optional): Called after each room, or once
+                for all rooms when batched. Defaults to None.
 
         Returns:
             dict[str, DataFrame]: The preprocessed DataFrame for each room.
         """
         logger.info("Preprocessing data...")
-        return {name: room.pipe(T.featurize) for name, room in tqdm(timeslots.items())}
-
-    def postprocess(self, predictions: dict[str, DataFrame]) -> dict[str, DataFrame]:
+        if batched:
+            preprocessed = T.featurize_rooms(timeslots)
+            if progress is not None:
+                progress("preprocess", len(preprocessed))
+            return preprocessed
+
+        preprocessed = {}
+        for name, room in tqdm(timeslots.items()):
+            preprocessed[name] = room.pipe(T.featurize)
+            if progress is not None:
+                progress("preprocess", 1)
+        return preprocessed
+
+    def postprocess(
+        self,
+        predictions: dict[str, DataFrame],
+        batched: bool = BATCHED_HEURISTICS,
+        progress: Progress | None = None,
+    ) -> dict[str, DataFrame]:
         """Postprocesses the prediction results for each room.
 
         Args:
             predictions (dict[str, DataFrame]): The predicted DataFrame for each room.
+            batched (bool, optional): Whether to apply the heuristics to all
+                rooms in one batched pass. Defaults to BATCHED_HEURISTICS.
+            progress (Progress, optional): Called after each room, or once
+                for all rooms when batched. Defaults to None.
 
         Returns:
             dict[str, DataFrame]: The postprocessed DataFrame for each room.
         """
         logger.info("Postprocessing data...")
-        return {
-            name: room.pipe(T.heuristics) for name, room in tqdm(predictions.items())
-        }
+        if batched:
+            postprocessed = T.heuristics_rooms(predictions)
+            if progress is not None:
+                progress("postprocess", len(postprocessed))
+            return postprocessed
+
+        postprocessed = {}
+        for name, room in tqdm(predictions.items()):
+            postprocessed[name] = room.pipe(T.heuristics)
+            if progress is not None:
+                progress("postprocess", 1)
+        return postprocessed
 
 
 # Global Variables
@@ -0,0 +1,348 @@
+"""
+Model Store Module
+
+This module persists the model registry to disk, so that trained models
+survive restarts and deploys of the API. Every training run is saved as a
+new, versioned artifact:
+
+    MODEL_STORE_DIR/
+        LATEST                      # name of the newest version
+        <version>/
+            manifest.json           # room name -> model file, and metadata
+            models/<hash>.joblib    # one file per room model
+
+Models are written uncompressed with joblib, and loaded lazily: on startup
+only the manifest is read, and each room model is read the first time it
+is used.
+
+Only the newest MODEL_STORE_KEEP versions are kept, so a worker process may
+still serve a version that another worker pruned after saving a new one.
+The manifest records the version each room model was trained in, so a model
+of a pruned version that was carried over unchanged into the LATEST version
+is loaded from there instead (see `LazyModels`). Models that were refitted
+since can not be served any more, and raise a `PrunedModelError`.
+
+Modules:
+    - LazyModels: Mapping of room names to models, loaded on first access.
+    - save_registry: Save a model registry as a new version.
+    - load_registry: Load the latest (or a given) version of the registry.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from collections.abc import MutableMapping
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import joblib
+from loguru import logger
+
+from tilly.config import (
+    FEATURES,
+    GIT_METADATA,
+    MODEL_PARAMS,
+    MODEL_STORE_DIR,
+    MODEL_STORE_KEEP,
+)
+from tilly.services.ml.model import Model
+from tilly.services.ml.model_registry import ModelRegistry
+
+MANIFEST = "manifest.json"
+LATEST = "LATEST"
+
+
+class PrunedModelError(FileNotFoundError):
+    """The model of a room was pruned from the store, and the LATEST version
+    holds a different model for it. The registry has to be loaded again."""
+
+
+class LazyModels(MutableMapping):
+    """A dictionary of room models backed by a stored registry version.
+
+    Reading a room loads its model from disk and keeps it. If the version
+    was pruned in the meantime, e.g. by another worker saving a newer one,
+    the model is loaded from the LATEST version of the store instead, but
+    only if it is the same model, ie. it was trained in the same version.
+    Models that are set or replaced live in memory only, until the registry
+    is saved again.
+
+    Attributes:
+        - root (Path): The directory of the registry version.
+        - files (dict[str, str]): Model file of each room, relative to root.
+        - trained (dict[str, str]): The version each room model was
+            trained in, which is older than root for carried over models.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        files: dict[str, str],
+        mmap_mode: str = "r",
+        preloaded: dict[str, Model] | None = None,
+        trained: dict[str, str] | None = None,
+    ):
+        self.root = root
+        self.files = dict(files)
+        self.mmap_mode = mmap_mode
+        self.trained = dict(trained or {})
+        self._loaded: dict[str, Model] = dict(preloaded or {})
+
+    def __getitem__(self, name: str) -> Model:
+        if name not in self._loaded:
+            if name not in self.files:
+                raise KeyError(name)
+            try:
+                model = joblib.load(
+                    self.root / self.files[name], mmap_mode=self.mmap_mode
+                )
+            except FileNotFoundError:
+                model = self._load_latest(name)
+            self._loaded[name] = model
+        return self._loaded[name]
+
+    def _load_latest(self, name: str) -> Model:
+        """Load a room model from the LATEST version of the store, for when
+        the version of this registry was pruned.
+
+        Raises:
+            PrunedModelError: If the LATEST version does not hold the same
+                model, trained in the same version, for the room.
+        """
+        manifest = load_manifest(self.root.parent)
+        trained = self.trained.get(name)
+        if (
+            name not in manifest.get("rooms", {})
+            or trained is None
+            or manifest.get("trained", {}).get(name) != trained
+        ):
+            raise PrunedModelError(
+                f"Model version {self.root.name} was pruned, and the latest "
+                + f"version {manifest.get('version')} has no model of room "
+                + f"{name} from version {trained} - reload the registry"
+            )
+        logger.warning(
+            f"Model version {self.root.name} was pruned - loading {name}, "
+            + f"trained in {trained}, from the latest version {manifest['version']}"
+        )
+        return joblib.load(
+            self.root.parent / manifest["version"] / manifest["rooms"][name],
+            mmap_mode=self.mmap_mode,
+        )
+
+    def __setitem__(self, name: str, model: Model) -> None:
+        self.files.pop(name, None)
+        self.trained.pop(name, None)
+        self._loaded[name] = model
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        self.files.pop(name, None)
+        self.trained.pop(name, None)
+        self._loaded.pop(name, None)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.files
+        yield from (name for name in self._loaded if name not in self.files)
+
+    def __len__(self) -> int:
+        return len(self.files.keys() | self._loaded.keys())
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.files or name in self._loaded
+
+    def subset(self, names: Iterable[str]) -> "LazyModels":
+        """A LazyModels with only the given rooms, without loading any."""
+        names = [name for name in names if name in self]
+        return LazyModels(
+            self.root,
+            {name: self.files[name] for name in names if name in self.files},
+            mmap_mode=self.mmap_mode,
+            preloaded={n: self._loaded[n] for n in names if n in self._loaded},
+            trained={n: self.trained[n] for n in names if n in self.trained},
+        )
+
+    def stored_file(self, name: str) -> Path | None:
+        """The file a room model was loaded from, if it is unchanged and
+        its version was not pruned."""
+        if name in self.files and (self.root / self.files[name]).exists():
+            return self.root / self.files[name]
+        return None
+
+
+def model_filename(name: str) -> str:
+    """File name of a room model. Room names are hashed, since they may
+    contain characters that are not safe in file names."""
+    return f"models/{hashlib.sha1(name.encode()).hexdigest()[:16]}.joblib"
+
+
+def save_registry(
+    registry: ModelRegistry, root: Path = MODEL_STORE_DIR, **metadata
+) -> Path:
+    """Save a model registry to disk as a new version.
+
+    The version is first written to a temporary directory and then renamed,
+    and LATEST is only updated once the version is complete, so a crash
+    halfway never leaves a broken registry behind. Models that were loaded
+    from a previous version, and not changed since, are hard-linked instead
+    of written again, and keep the version they were trained in. Only the
+    newest MODEL_STORE_KEEP versions are kept.
+
+    Args:
+        registry (ModelRegistry): The registry to save.
+        root (Path, optional): The model store directory.
+            Defaults to MODEL_STORE_DIR.
+        **metadata: Extra entries to store in the manifest.
+
+    Returns:
+        Path: The directory of the saved version.
+    """
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    tmp_dir = root / f".{version}.tmp"
+    (tmp_dir / "models").mkdir(parents=True)
+
+    files, in_memory, trained = {}, {}, {}
+    for name, model in _iter_unloaded(registry.models):
+        files[name] = model_filename(name)
+        trained[name] = _trained_version(registry.models, name) or version
+        if isinstance(model, Path):
+            _link_or_copy(model, tmp_dir / files[name])
+        else:
+            joblib.dump(model, tmp_dir / files[name])
+            in_memory[name] = model
+
+    manifest = {
+        "version": version,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "git": GIT_METADATA,
+        "model_params": MODEL_PARAMS,
+        "features": FEATURES,
+        **metadata,
+        "rooms": files,
+        "trained": trained,
+        "fingerprints": registry.fingerprints,
+    }
+    (tmp_dir / MANIFEST).write_text(json.dumps(manifest, indent=2, default=str))
+
+    tmp_dir.rename(root / version)
+    _write_atomic(root / LATEST, version)
+
+    # point the registry at the new version, so that older versions
+    # can be pruned without breaking models that are not loaded yet
+    registry.models = LazyModels(
+        root / version, files, preloaded=in_memory, trained=trained
+    )
+    registry.version = version
+
+    _prune_versions(root, keep=MODEL_STORE_KEEP)
+    logger.info(f"Saved {len(files)} models to {root / version}")
+    return root / version
+
+
+def load_manifest(root: Path = MODEL_STORE_DIR, version: str | None = None) -> dict:
+    """Read the manifest of a stored registry version.
+
+    Args:
+        root (Path, optional): The model store directory.
+            Defaults to MODEL_STORE_DIR.
+        version (str, optional): The version to read. Defaults to the latest.
+
+    Returns:
+        dict: The manifest, or an empty dict if nothing has been stored.
+    """
+    if version is None:
+        if not (root / LATEST).exists():
+            return {}
+        version = (root / LATEST).read_text().strip()
+
+    manifest_path = root / version / MANIFEST
+    if not manifest_path.exists():
+        logger.warning(f"No manifest found for model version {version}")
+        return {}
+    return json.loads(manifest_path.read_text())
+
+
+def load_registry(
+    root: Path = MODEL_STORE_DIR, version: str | None = None
+) -> ModelRegistry | None:
+    """Load a stored model registry.
+
+    Only the manifest is read here; the room models are loaded lazily,
+    the first time they are used.
+
+    Args:
+        root (Path, optional): The model store directory.
+            Defaults to MODEL_STORE_DIR.
+        version (str, optional): The version to load. Defaults to the latest.
+
+    Returns:
+        ModelRegistry | None: The registry, or None if nothing has been stored.
+    """
+    manifest = load_manifest(root, version)
+    if not manifest:
+        return None
+
+    registry = ModelRegistry()
+    registry.models = LazyModels(
+        root / manifest["version"],
+        manifest["rooms"],
+        trained=manifest.get("trained", {}),
+    )
+    registry.version = manifest["version"]
+    registry.fingerprints = manifest.get("fingerprints", {})
+
+    logger.info(
+        f"Loaded model registry {registry.version} "
+        + f"with {len(registry.models)} models"
+    )
+    return registry
+
+
+def _iter_unloaded(models):
+    """Yield (name, model) for each room, with the stored file in place of
+    the model for lazily loaded models that have not changed."""
+    for name in models:
+        stored = models.stored_file(name) if isinstance(models, LazyModels) else None
+        yield name, stored if stored is not None else models[name]
+
+
+def _trained_version(models, name: str) -> str | None:
+    """The version a room model was trained in, if it is a stored model
+    that was not changed since it was loaded."""
+    if isinstance(models, LazyModels) and name in models.files:
+        return models.trained.get(name)
+    return None
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
+
+
+def _prune_versions(root: Path, keep: int) -> None:
+    """Delete all but the newest `keep` versions, and the temporary
+    directories of saves older than the versions kept, which were
+    interrupted before they were renamed."""
+    versions = sorted(
+        p for p in root.iterdir() if p.is_dir() and not p.name.startswith(".")
+    )
+    kept = versions[-keep:] if keep > 0 else versions
+    for old in versions[: len(versions) - len(kept)]:
+        shutil.rmtree(old, ignore_errors=True)
+
+    oldest_kept = kept[0].name if kept else ""
+    for tmp_dir in root.glob(".*.tmp"):
+        if tmp_dir.is_dir() and tmp_dir.name[1:-4] < oldest_kept:
+            logger.info(f"Removing interrupted model version {tmp_dir.name}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
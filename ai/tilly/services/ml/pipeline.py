@@ -0,0 +1,189 @@
+"""
+Pipeline Module
+
+This module contains a small, bounded, three-stage pipeline used to overlap
+the I/O and CPU bound parts of a flow, such as scoring:
+
+    fetcher  --(queue)-->  scorer pool  --(queue)-->  writer
+
+- The fetcher pulls batches from a source iterator (e.g. `crud.stream_data`).
+- A pool of scorer threads transforms each batch (e.g. predicts on it).
+- The writer consumes the transformed batches (e.g. pushes them to Snowflake).
+
+The queues between the stages are bounded, so a slow stage applies
+backpressure to the ones before it, and peak memory is bounded by the number
+of batches in flight rather than the size of the data. Since the stages run
+concurrently, the total wall time approaches that of the slowest stage,
+rather than the sum of all three.
+
+Modules:
+    - run_pipeline: Run a source, a transform and a sink as a pipeline.
+"""
+
+import time
+from dataclasses import dataclass, field
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Iterable
+
+from loguru import logger
+
+from tilly.config import PIPELINE_QUEUE_SIZE, PIPELINE_SCORERS
+
+_DONE = object()  # sentinel marking the end of a queue
+
+
+@dataclass
+class PipelineStats:
+    """Counters and busy time (in seconds) of each stage of a pipeline run."""
+
+    batches: int = 0
+    fetch_time: float = 0.0
+    score_time: float = 0.0
+    write_time: float = 0.0
+    wall_time: float = 0.0
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            setattr(self, f"{stage}_time", getattr(self, f"{stage}_time") + seconds)
+
+
+def run_pipeline(
+    source: Iterable[Any],
+    transform: Callable[[Any], Any],
+    sink: Callable[[Any], None],
+    n_scorers: int = PIPELINE_SCORERS,
+    max_queued: int = PIPELINE_QUEUE_SIZE,
+) -> PipelineStats:
+    """Run a source, a transform and a sink as a bounded, concurrent pipeline.
+
+    Batches are transformed by `n_scorers` threads, and may therefore reach
+    the sink in a different order than they left the source. If any stage
+    raises, all stages are stopped and the first error is raised again here.
+    A source that is a generator is closed when the fetcher stops, also
+    when it stops early, so its cleanup (e.g. of a result stream) runs.
+
+    Args:
+        source (Iterable[Any]): The batches to process.
+        transform (Callable[[Any], Any]): Applied to each batch.
+        sink (Callable[[Any], None]): Called with each transformed batch.
+        n_scorers (int, optional): Number of transform threads.
+            Defaults to PIPELINE_SCORERS.
+        max_queued (int, optional): Maximum number of batches waiting between
+            two stages. Defaults to PIPELINE_QUEUE_SIZE.
+
+    Returns:
+        PipelineStats: The number of batches, and the time spent in each stage.
+
+    The source and the sink run in different threads, so they must not share
+    a Snowpark session.
+
+    Examples:
+        ```python
+        with session_scope() as read_session, session_scope() as write_session:
+            stats = run_pipeline(
+                crud.stream_data(read_session, table_name),
+                transform=model_registry.predict,
+                sink=lambda scored: crud.push_data(scored, table_name, write_session),
+            )
+        ```
+    """
+    n_scorers = max(n_scorers, 1)
+    to_score, to_write = Queue(maxsize=max_queued), Queue(maxsize=max_queued)
+    stop, errors = Event(), []
+    stats = PipelineStats()
+
+    def put(queue: Queue, item: Any) -> None:
+        """Put an item on a queue, giving up if the pipeline is stopped."""
+        while not stop.is_set():
+            try:
+                return queue.put(item, timeout=0.1)
+            except Full:
+                continue
+
+    def get(queue: Queue) -> Any:
+        """Get an item from a queue, giving up if the pipeline is stopped."""
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return _DONE
+
+    def stage(func: Callable) -> Callable:
+        """Stop the whole pipeline if a stage fails."""
+
+        def wrapper():
+            try:
+                func()
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        return wrapper
+
+    @stage
+    def fetch():
+        batches = None
+        try:
+            batches = iter(source)
+            while not stop.is_set():
+                start = time.perf_counter()
+                batch = next(batches, _DONE)
+                stats.add("fetch", time.perf_counter() - start)
+                if batch is _DONE:
+                    break
+                put(to_score, batch)
+        finally:
+            for _ in range(n_scorers):
+                put(to_score, _DONE)
+            # in this thread, since a generator can only be closed by the
+            # thread that runs it
+            if hasattr(batches, "close"):
+                batches.close()
+
+    @stage
+    def score():
+        try:
+            while (batch := get(to_score)) is not _DONE:
+                start = time.perf_counter()
+                result = transform(batch)
+                stats.add("score", time.perf_counter() - start)
+                put(to_write, result)
+        finally:
+            put(to_write, _DONE)
+
+    @stage
+    def write():
+        remaining_scorers = n_scorers
+        while remaining_scorers:
+            if (result := get(to_write)) is _DONE:
+                remaining_scorers -= 1
+                continue
+            start = time.perf_counter()
+            sink(result)
+            stats.add("write", time.perf_counter() - start)
+            stats.batches += 1
+
+    start = time.perf_counter()
+    threads = [Thread(target=fetch, name="pipeline-fetch")]
+    threads += [
+        Thread(target=score, name=f"pipeline-score-{i}") for i in range(n_scorers)
+    ]
+    threads += [Thread(target=write, name="pipeline-write")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.wall_time = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+
+    logger.info(
+        f"Pipeline completed | {stats.batches} batches | "
+        + f"wall {stats.wall_time:.1f}s | fetch {stats.fetch_time:.1f}s | "
+        + f"score {stats.score_time:.1f}s | write {stats.write_time:.1f}s"
+    )
+    return stats
@@ -1,35 +1,136 @@
+from typing import Callable, Iterable
 from pandas import DataFrame
 from loguru import logger
 from tilly.services.ml import update_registry, ModelRegistry
+from tilly.services.ml.model_registry import Progress
+from tilly.services.ml.model_store import save_registry
 
 
-def train_models(training_data: dict[str, DataFrame]) -> list[dict[str, DataFrame]]:
+def normalize_fingerprint(fingerprint: dict | None) -> dict | None:
+    """A fingerprint with the types of `crud.retrieve_fingerprints`: the row
+    count and hash as int, and the latest timeslot as str. Manifests of older
+    versions stored the row count and hash as str."""
+    if fingerprint is None:
+        return None
+    return {
+        "rows": int(fingerprint["rows"]),
+        "last_timeslot": str(fingerprint["last_timeslot"]),
+        "hash": int(fingerprint["hash"]),
+    }
+
+
+def rooms_to_refit(
+    fingerprints: dict[str, dict], previous: ModelRegistry | None
+) -> list[str]:
+    """Finds the rooms whose training data changed since the previous training.
+
+    A room is refitted if it is new, or if its fingerprint (row count, latest
+    timeslot and hash of its rows) differs from the one stored in the previous
+    registry. Without a previous registry, all rooms are refitted.
+
+    Args:
+        fingerprints (dict[str, dict]): The current fingerprint of each room.
+        previous (ModelRegistry | None): The registry of the previous training.
+
+    Returns:
+        list[str]: The rooms to refit.
+    """
+    if previous is None:
+        return list(fingerprints)
+
+    return [
+        name
+        for name, fingerprint in fingerprints.items()
+        if normalize_fingerprint(previous.fingerprints.get(name))
+        != normalize_fingerprint(fingerprint)
+    ]
+
+
+def train_models(
+    training_data: dict[str, DataFrame] | Iterable[dict[str, DataFrame]],
+    fingerprints: dict[str, dict] | None = None,
+    previous: ModelRegistry | None = None,
+    on_results: Callable[[dict[str, DataFrame]], None] | None = None,
+    progress: Progress | None = None,
+    featurized: bool = False,
+) -> dict[str, DataFrame]:
     """Trains new models based on the given training data and updates the global
     model registry.
 
     This function performs the following steps:
     1. Create a new instance of ModelRegistry.
-    2. Train the models using the training data.
+    2. Train the models using the training data, one batch of rooms at a time.
     3. Update the global model registry with the newly trained models.
+    4. Save the registry to the model store, so it survives restarts.
+
+    The training data can be a single dict of rooms, or an iterable of such
+    batches (see `crud.stream_data`). If `on_results` is given, the results
+    of each batch are passed to it instead of being collected, so the results
+    of all rooms are never held in memory at once.
+
+    For incremental training, `previous` is the registry of the last training.
+    The models of rooms that are still in the data source (`fingerprints`), but
+    not in `training_data`, are carried over from it as they are.
+
+    The new registry is a separate object, and only replaces the global
+    registry once it is fully trained, so jobs scoring with the current
+    registry keep their models, and a training that fails or is cancelled
+    (by `progress` raising) leaves the current registry as it was.
 
     Args:
-        training_data (dict[str, DataFrame]): A dictionary containing the training data
-            for each room, keyed by room name.
+        training_data (dict[str, DataFrame] | Iterable[dict[str, DataFrame]]):
+            The training data for each room, keyed by room name, or batches
+            of it.
+        fingerprints (dict[str, dict], optional): The fingerprint of the data of
+            every room in the data source. Stored in the registry, to find the
+            rooms to refit next time. Defaults to None.
+        previous (ModelRegistry, optional): The registry to carry unchanged
+            models over from. Defaults to None.
+        on_results (Callable, optional): Called with the results of each batch.
+            Defaults to None.
+        progress (Progress, optional): Passed on to `ModelRegistry.train`, to
+            report the rooms done per stage. Defaults to None.
+        featurized (bool, optional): Whether the training data is already
+            preprocessed (see `crud.stream_featurized`). Defaults to False.
 
     Returns:
-        list[dict[str, DataFrame]]: A list of dictionaries, each containing the
-        predicted DataFrame and anomaly scores for each room.
+        dict[str, DataFrame]: The predicted DataFrame and anomaly scores for
+        each room, or an empty dict if `on_results` is given.
 
     """
+    fingerprints = fingerprints or {}
+    batches = [training_data] if isinstance(training_data, dict) else training_data
+
+    # Rooms of the source without a fingerprint match are refitted
+    carried_over = {}
+    if previous is not None:
+        refit = set(rooms_to_refit(fingerprints, previous))
+        carried_over = previous.select(
+            name for name in fingerprints if name not in refit
+        )
+        logger.info(f"Incremental training | carrying over {len(carried_over)} models")
+
     # Create a new model registry
     model_registry = ModelRegistry()
+    model_registry.models = carried_over
+    model_registry.fingerprints = fingerprints
+
+    # Train models batch by batch, and receive the results
+    results: dict[str, DataFrame] = {}
+    for batch in batches:
+        batch_results = model_registry.train(
+            batch, progress=progress, featurized=featurized
+        )
+        if on_results is not None:
+            on_results(batch_results)
+        else:
+            results.update(batch_results)
 
-    # Train models and receive the results
-    results: dict[str, tuple[list[float], list[int]]] = model_registry.train(
-        training_data
-    )
+    # Persist the registry as a new version in the model store, which points
+    # its models at the stored files, before it is served
+    save_registry(model_registry)
 
-    # Update the global model registry
+    # Swap the new registry in as the global one, once it is complete and saved
     update_registry(model_registry)
 
     logger.info("Training flow completed")
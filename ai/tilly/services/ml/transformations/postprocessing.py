@@ -37,6 +37,11 @@ class Postprocessor:
         The method also updates the "ANOMALY_SCORE" based on the modified
           "IN_USE" values.
 
+    heuristics_rooms(rooms: dict[str, pd.DataFrame])
+        -> dict[str, pd.DataFrame]:
+        Applies the same heuristic rules to many rooms at once, in a single
+          vectorized pass over their concatenated columns.
+
     handle_missing_model(room_name: str, room: pd.DataFrame,
         models: list[str]) -> tuple[list[np.nan], list[np.nan]]:
         Returns null values for anomaly scores and predictions if the
@@ -119,42 +124,71 @@ class Postprocessor:
         >>> Postprocessor.heuristics(df)
         """
 
-        def apply_night_time_filter(df):
-            """Filters out false positives during midnight to 6 AM."""
-            hour = df["DATETIME"].dt.hour
-            mask = (hour >= 0) & (hour < 6) & (df["ANOMALY_SCORE"] <= 0.7)
-            df.loc[mask, "IN_USE"] = 0
-            return df
-
-        def apply_stand_alone_instances_filter(df):
-            """Removes isolated instances of "IN_USE" being 1."""
-            prev_IN_USE = df["IN_USE"].shift(1, fill_value=0)
-            next_IN_USE = df["IN_USE"].shift(-1, fill_value=0)
-            mask = (prev_IN_USE == 0) & (df["IN_USE"] == 1) & (next_IN_USE == 0)
-            df.loc[mask, "IN_USE"] = 0
-            return df
-
-        def apply_low_co2_filter(df):
-            """Sets "IN_USE" to 0 if CO2 levels are low."""
-            mask = df["CO2"] <= 325
-            df.loc[mask, "IN_USE"] = 0
-            return df
-
-        def update_anomaly_score(df):
-            """Updates the anomaly score based on the modified
-            "IN_USE" values."""
-            mask = ((df["IN_USE"] == 1) & (df["ANOMALY_SCORE"] < 0.5)) | (
-                (df["IN_USE"] == 0) & (df["ANOMALY_SCORE"] > 0.5)
+        return cls.heuristics_rooms({"room": room})["room"]
+
+    def heuristics_rooms(rooms: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+        """
+        Apply the heuristic rules of `heuristics` to many rooms at once.
+
+        The columns used by the rules are concatenated across all rooms, the
+        rules are applied to the concatenated arrays in one vectorized pass,
+        and the results are written back to each room. The stand-alone filter
+        compares each timeslot with its neighbours in the same room only, so
+        the results are the same as applying `heuristics` room by room.
+
+        Like `heuristics`, the "IN_USE" and "ANOMALY_SCORE" columns of the
+        rooms are modified in place.
+
+        Args:
+            rooms (dict[str, pd.DataFrame]): The predicted DataFrame for each
+                room, with the columns required by `heuristics`.
+
+        Returns:
+            dict[str, pd.DataFrame]: The modified DataFrame for each room.
+        """
+        if not rooms:
+            return {}
+
+        frames = list(rooms.values())
+        offsets = np.cumsum([0] + [len(room) for room in frames])
+
+        def concat(column: str) -> np.ndarray:
+            return pd.concat(
+                [room[column] for room in frames], ignore_index=True
+            ).to_numpy()
+
+        hour = pd.concat(
+            [room["DATETIME"] for room in frames], ignore_index=True
+        ).dt.hour.to_numpy()
+        scores = concat("ANOMALY_SCORE").astype(float)
+        in_use = concat("IN_USE").astype(float)
+        co2 = concat("CO2")
+
+        # Night time filter: no use from midnight to 6 AM, unless very anomalous
+        in_use[(hour < 6) & (scores <= 0.7)] = 0
+
+        # Stand-alone filter: neighbours outside the room count as not in use
+        starts, ends = offsets[:-1], offsets[1:]
+        non_empty = ends > starts
+        prev_in_use = np.concatenate([[0.0], in_use[:-1]])
+        next_in_use = np.concatenate([in_use[1:], [0.0]])
+        prev_in_use[starts[non_empty]] = 0
+        next_in_use[ends[non_empty] - 1] = 0
+        in_use[(prev_in_use == 0) & (in_use == 1) & (next_in_use == 0)] = 0
+
+        # Low CO2 filter
+        in_use[co2 <= 325] = 0
+
+        # Flip the anomaly scores that disagree with the modified predictions
+        flip = ((in_use == 1) & (scores < 0.5)) | ((in_use == 0) & (scores > 0.5))
+        scores[flip] = 1 - scores[flip]
+
+        for room, start, end in zip(frames, starts, ends):
+            room["IN_USE"] = in_use[start:end].astype(room["IN_USE"].dtype)
+            room["ANOMALY_SCORE"] = scores[start:end].astype(
+                room["ANOMALY_SCORE"].dtype
             )
-            df.loc[mask, "ANOMALY_SCORE"] = 1 - df.loc[mask, "ANOMALY_SCORE"]
-            return df
-
-        return (
-            room.pipe(apply_night_time_filter)
-            .pipe(apply_stand_alone_instances_filter)
-            .pipe(apply_low_co2_filter)
-            .pipe(update_anomaly_score)
-        )
+        return rooms
 
     def handle_missing_model(
         room_name: str, room: pd.DataFrame, models: list[str]
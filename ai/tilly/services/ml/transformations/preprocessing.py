@@ -1,15 +1,38 @@
 import pandas as pd
 import numpy as np
+from scipy.linalg import solve_banded
 from scipy.ndimage import gaussian_filter1d
 from loguru import logger
 
+from pandas.api.indexers import BaseIndexer
 from tilly.utils import log_pipeline
 
 
+class _BlockWindowIndexer(BaseIndexer):
+    """Trailing windows of `window_size` rows that never reach back past
+    the start of their block, for rolling calculations on many
+    time-contiguous blocks in one pass."""
+
+    def get_window_bounds(
+        self, num_values=0, min_periods=None, center=None, closed=None, step=None
+    ):
+        end = np.arange(1, num_values + 1, dtype=np.int64)
+        block_starts = Preprocessor._block_starts(self.block_starts, num_values)
+        lengths = np.diff(np.append(block_starts, num_values))
+        start = np.maximum(end - self.window_size, np.repeat(block_starts, lengths))
+        return start, end
+
+
 class Preprocessor:
     """A class that contains all the preprocessing logic for the
     model input"""
 
+    # Parameters of the row filters and time features of `featurize`, shared
+    # with their Snowpark counterparts in `pushdown`
+    CO2_BOUNDS = (1, 8000)
+    MIN_DAY_RATIO = 0.25
+    NIGHT_START, NIGHT_END = 22, 6
+
     @classmethod
     def estimate_usage(
         cls, data: pd.DataFrame, usage_coeff=2.1, usage_min=0.1, usage_max=0.4
@@ -41,6 +64,11 @@ class Preprocessor:
     @classmethod
     @log_pipeline
     def merge_dt(cls, df, date, time, name, sep=" "):
+        """Add the timestamp of the `date` and `time` columns as `name`.
+        If the DataFrame already has it, e.g. when it was built at load time
+        (see `tilly.database.data.schema`), it is kept as it is."""
+        if name in df.columns:
+            return df
         return df.assign(
             **{
                 name: lambda d: pd.to_datetime(
@@ -51,25 +79,119 @@ class Preprocessor:
 
     @classmethod
     @log_pipeline
-    def add_missing_timeslots(cls, df: pd.DataFrame, freq: str = "15T") -> pd.DataFrame:
+    def add_missing_timeslots(
+        cls, df: pd.DataFrame, freq: str = "15T", by: str | None = None
+    ) -> pd.DataFrame:
+        """Adds the rows that are missing from the DataFrame, so that it
+        holds every timeslot between its first and last timestamp.
+
+        Each row is placed directly at its slot in the timeslot grid,
+        `(DATETIME - start) // freq`, and the DataFrame is reindexed onto
+        the grid in one go, leaving the missing slots empty. This gives the
+        same output as merging with a DataFrame of all the timeslots (see
+        `_merge_missing_timeslots`), without the cost of the merge. Rows
+        that are not on the grid are dropped, as the merge would. If a
+        timeslot occurs more than once, or a timestamp is missing, the merge
+        is used instead.
+
+        If `by` is given, the DataFrame may hold several rooms, and a
+        timeslot grid is built for each value of `by` between its own
+        first and last timestamp."""
+
+        static_cols = ["ID", "KOMMUNE", "SKOLE", "SKOLE_ID"]
+        merge_cols = ["DATETIME"] + static_cols
+        if df.empty or df["DATETIME"].isna().any():
+            return cls._merge_missing_timeslots(df, freq=freq, by=by)
+
+        step = pd.Timedelta(freq).value
+        datetimes = df["DATETIME"].to_numpy("datetime64[ns]").view("i8")
+
+        # room of each row, and the first row of each room
+        if by is None:
+            codes = np.zeros(len(df), dtype=np.int64)
+            first_rows = df.head(1)
+        else:
+            groups = df.groupby(by, sort=False, observed=True)
+            codes = groups.ngroup().to_numpy()
+            first_rows = groups.head(1)
+        room_datetimes = pd.Series(datetimes).groupby(codes)
+        starts = room_datetimes.min().to_numpy()
+        ends = room_datetimes.max().to_numpy()
+        counts = (ends - starts) // step + 1
+        room_offsets = counts.cumsum() - counts
+
+        # only rows on the grid of their room, and with the static values
+        # of the room, find a slot - the rest would not match in a merge
+        since_start = datetimes - starts[codes]
+        keep = since_start % step == 0
+        for col in (col for col in static_cols if col != by):
+            values = df[col].to_numpy()
+            room_values = first_rows[col].to_numpy()[codes]
+            differs = np.flatnonzero(values != room_values)
+            keep[differs] &= pd.isna(values[differs]) & pd.isna(room_values[differs])
+
+        slots = room_offsets[codes[keep]] + since_start[keep] // step
+        if np.bincount(slots, minlength=1).max() > 1:
+            return cls._merge_missing_timeslots(df, freq=freq, by=by)
+
+        # row of the DataFrame at each slot of the grid, or -1 if missing
+        indexer = np.full(counts.sum(), -1, dtype=np.int64)
+        indexer[slots] = np.flatnonzero(keep)
+
+        # offset of each slot within its own room: 0, 1, .., n_room - 1
+        slot_rooms = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(room_offsets, counts)
+        grid = first_rows[static_cols].iloc[slot_rooms].reset_index(drop=True)
+        timeslots = (starts[slot_rooms] + offsets * step).view("datetime64[ns]")
+        grid.insert(0, "DATETIME", timeslots)
+
+        values = df.drop(columns=merge_cols).reset_index(drop=True).reindex(indexer)
+        return pd.concat([grid, values.reset_index(drop=True)], axis=1)
+
+    @classmethod
+    def _merge_missing_timeslots(
+        cls, df: pd.DataFrame, freq: str = "15T", by: str | None = None
+    ) -> pd.DataFrame:
         """Adds the rows that are missing from the DataFrame, by merging
-        it with a DataFrame containing all the timeslots."""
+        it with a DataFrame containing all the timeslots.
+
+        Used by `add_missing_timeslots` when a timeslot occurs more than
+        once in a room."""
+
+        static_cols = ["ID", "KOMMUNE", "SKOLE", "SKOLE_ID"]
+        merge_cols = ["DATETIME"] + static_cols
+
+        if by is None:
+            static_values = df.head(1)[static_cols].squeeze().to_dict()
+            return (
+                pd.DataFrame(
+                    {
+                        "DATETIME": pd.date_range(
+                            start=df["DATETIME"].min(),
+                            end=df["DATETIME"].max(),
+                            freq=freq,
+                        )
+                    }
+                )
+                .assign(**static_values)
+                .merge(df, on=merge_cols, how="left")
+            )
+
+        groups = df.groupby(by, sort=False, observed=True)
+        starts = groups["DATETIME"].min()
+        step = pd.Timedelta(freq)
+        counts = ((groups["DATETIME"].max() - starts) // step + 1).to_numpy()
+
+        # offset of each slot within its own room: 0, 1, .., n_room - 1
+        offsets = np.arange(counts.sum()) - np.repeat(counts.cumsum() - counts, counts)
+        timeslots = np.repeat(starts.to_numpy(), counts) + offsets * step
+        grid = groups[static_cols].head(1).set_index(by, drop=False)
 
-        static_values = (
-            df.head(1)[["ID", "KOMMUNE", "SKOLE", "SKOLE_ID"]].squeeze().to_dict()
-        )
         return (
-            pd.DataFrame(
-                {
-                    "DATETIME": pd.date_range(
-                        start=df["DATETIME"].min(), end=df["DATETIME"].max(), freq=freq
-                    )
-                }
-            )
-            .assign(**static_values)
-            .merge(
-                df, on=["DATETIME", "ID", "KOMMUNE", "SKOLE", "SKOLE_ID"], how="left"
-            )
+            grid.loc[np.repeat(starts.index.to_numpy(), counts)]
+            .reset_index(drop=True)
+            .assign(DATETIME=timeslots)[merge_cols]
+            .merge(df, on=merge_cols, how="left")
         )
 
     @classmethod
@@ -82,48 +204,211 @@ class Preprocessor:
         limit: int = 3,
         direction: str = "forward",
         method: str = "cubic",
+        by: str | None = None,
         **kwargs,
     ) -> pd.DataFrame:
         """Interpolate missing values in a dataframe, but only for
         islands of missing values, ie. rows where there
         are no more than `limit` consecutive missing values
-        in the `target_col` column."""
-
-        try:
-            return df.assign(
-                CO2=lambda d: d[target_col].interpolate(
-                    method=method,
-                    limit=limit,
-                    limit_direction=direction,
-                    **kwargs,
-                )
+        in the `target_col` column.
+
+        If `by` is given, each group is interpolated on its own, so that
+        values never leak between rooms. The groups must be contiguous.
+        Forward cubic and linear interpolation, as used by `featurize`, are
+        done for all groups at once (see `_interpolate_groups`); other
+        options are passed on to `Series.interpolate`, group by group."""
+
+        if method in ("cubic", "linear") and direction == "forward" and not kwargs:
+            values = df[target_col].to_numpy(dtype=float)
+            group_starts = np.flatnonzero(
+                np.asarray(cls._group_changes(df, by), dtype=bool)
             )
-        except ValueError:
-            logger.warning(
-                f"[{df.iloc[0]['SKOLE_ID']}] "
-                + "Interpolation failed, falling back to linear"
+            return df.assign(
+                **{
+                    target_col: cls._interpolate_groups(
+                        values,
+                        cls._block_starts(group_starts, len(df)),
+                        limit=limit,
+                        cubic=method == "cubic",
+                    )
+                }
             )
+
+        if by is not None:
             return df.assign(
-                CO2=lambda d: d[target_col].interpolate(
-                    method="linear",
-                    limit=limit,
-                    limit_direction=direction,
-                    **kwargs,
+                **{
+                    target_col: df.groupby(
+                        by, sort=False, observed=True, group_keys=False
+                    )[target_col].transform(
+                        lambda col: col.interpolate(
+                            method=method,
+                            limit=limit,
+                            limit_direction=direction,
+                            **kwargs,
+                        )
+                    )
+                }
+            )
+        return df.assign(
+            **{
+                target_col: df[target_col].interpolate(
+                    method=method, limit=limit, limit_direction=direction, **kwargs
                 )
+            }
+        )
+
+    @classmethod
+    def _interpolate_groups(
+        cls, values: np.ndarray, group_starts: np.ndarray, limit: int, cubic: bool
+    ) -> np.ndarray:
+        """Interpolate the missing values of contiguous groups of rows, like
+        `Series.interpolate(method, limit=limit, limit_direction="forward")`
+        on each group, with the rows of a group at positions 0, 1, .. n - 1.
+
+        Only the first `limit` missing values after a valid value of the same
+        group are filled. With `cubic`, the values are read from the
+        not-a-knot cubic spline through the valid values of the group, which
+        is what scipy fits for pandas. The splines of all groups are solved
+        as one block-diagonal banded system. Groups with less than 4 valid
+        values can not have a cubic spline, so they are interpolated
+        linearly instead, as pandas is made to do by `featurize`. Missing
+        values after the last valid value of a group are left missing by
+        the spline, and take the last valid value when linear."""
+        values = values.astype(float)
+        n_rows = len(values)
+        if n_rows == 0:
+            return values
+        rows = np.arange(n_rows)
+        lengths = np.diff(np.append(group_starts, n_rows))
+        groups = np.repeat(np.arange(len(group_starts)), lengths)
+        row_starts = group_starts[groups]
+
+        valid = ~np.isnan(values)
+        n_valid = np.add.reduceat(valid.astype(int), group_starts)
+        # the last valid row at or before each row
+        previous = np.maximum.accumulate(np.where(valid, rows, -1))
+        fill = ~valid & (previous >= row_starts) & (rows - previous <= limit)
+        if not fill.any():
+            return values
+
+        knot = np.cumsum(valid) - 1  # the valid value at or before each row
+        knot_rows = np.flatnonzero(valid)
+        knot_groups = groups[knot_rows]
+        # whether the next valid value after a knot is in the same group
+        has_next = np.append(knot_groups[1:] == knot_groups[:-1], False)
+
+        splined = cubic & (n_valid >= 4)
+        linear = fill & ~splined[groups]
+        if linear.any():
+            logger.debug(
+                f"Interpolating {len(np.unique(groups[linear]))} groups linearly"
+            )
+            j = knot[linear]
+            nxt = np.minimum(j + 1, len(knot_rows) - 1)
+            x0, y0 = knot_rows[j], values[knot_rows[j]]
+            x1, y1 = knot_rows[nxt], values[knot_rows[nxt]]
+            slope = (y1 - y0) / np.where(has_next[j], x1 - x0, 1)
+            values[linear] = np.where(has_next[j], slope * (rows[linear] - x0) + y0, y0)
+
+        spline = fill & splined[groups]
+        if spline.any():
+            slopes = cls._spline_slopes(
+                (knot_rows - row_starts[knot_rows]).astype(float),
+                values[knot_rows],
+                splined[knot_groups],
+                has_next,
             )
+            j = knot[spline]
+            inside = has_next[j]  # no extrapolation past the last value
+            j, at = j[inside], np.flatnonzero(spline)[inside]
+            dx = (knot_rows[j + 1] - knot_rows[j]).astype(float)
+            y0 = values[knot_rows[j]]
+            slope = (values[knot_rows[j + 1]] - y0) / dx
+            t = (slopes[j] + slopes[j + 1] - 2 * slope) / dx
+            c0, c1 = t / dx, (slope - slopes[j]) / dx - t
+            h = (at - knot_rows[j]).astype(float)
+            values[at] = ((c0 * h + c1) * h + slopes[j]) * h + y0
+        return values
+
+    @classmethod
+    def _spline_slopes(
+        cls, x: np.ndarray, y: np.ndarray, used: np.ndarray, has_next: np.ndarray
+    ) -> np.ndarray:
+        """The slopes at the knots of the not-a-knot cubic splines through
+        the knots (x, y) of many groups, with the equations of
+        `scipy.interpolate.CubicSpline`. Every group is a block of the
+        tridiagonal system, so they are all solved with one banded solve.
+        Knots of groups that are not `used` get a slope of 0."""
+        n = len(x)
+        # the distance and slope to the next knot, 0 at the last of a group
+        dx = np.zeros(n)
+        dx[:-1] = np.where(has_next[:-1], x[1:] - x[:-1], 0.0)
+        dy = np.zeros(n)
+        dy[:-1] = np.where(has_next[:-1], y[1:] - y[:-1], 0.0)
+        slope = np.divide(dy, dx, out=np.zeros(n), where=dx != 0)
+
+        def shifted(a: np.ndarray, k: int) -> np.ndarray:
+            """a[i + k], 0 outside of the array."""
+            out = np.zeros(n)
+            if k >= 0:
+                out[: n - k] = a[k:]
+            else:
+                out[-k:] = a[: n + k]
+            return out
+
+        first = np.append(True, ~has_next[:-1])
+        last = ~has_next
+        inner = ~first & ~last
+
+        ab = np.zeros((3, n))  # super-diagonal, diagonal, sub-diagonal
+        b = np.zeros(n)
+        dx_1, dx_2 = shifted(dx, -1), shifted(dx, -2)
+        slope_1, slope_2 = shifted(slope, -1), shifted(slope, -2)
+
+        # interior knots
+        ab[1] = np.where(inner, 2 * (dx_1 + dx), 1.0)
+        b = np.where(inner, 3 * (dx * slope_1 + dx_1 * slope), 0.0)
+        upper = np.where(inner, dx_1, 0.0)
+        lower = np.where(inner, dx, 0.0)
+
+        # not-a-knot at the first knot of a group
+        d = shifted(dx, 1) + dx
+        dx1, slope1 = shifted(dx, 1), shifted(slope, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            start = ((dx + 2 * d) * dx1 * slope + dx**2 * slope1) / d
+            ab[1] = np.where(first, dx1, ab[1])
+            upper = np.where(first, d, upper)
+            b = np.where(first, start, b)
+
+            # not-a-knot at the last knot of a group
+            d = dx_1 + dx_2
+            end = (dx_1**2 * slope_2 + (2 * d + dx_1) * dx_2 * slope_1) / d
+            ab[1] = np.where(last, dx_2, ab[1])
+            lower = np.where(last, d, lower)
+            b = np.where(last, end, b)
+
+        # groups that are not splined are an identity block
+        ab[1] = np.where(used, ab[1], 1.0)
+        b = np.where(used, b, 0.0)
+        ab[0, 1:] = np.where(used[:-1], upper[:-1], 0.0)
+        ab[2, :-1] = np.where(used[1:], lower[1:], 0.0)
+        return solve_banded((1, 1), ab, b)
 
     @classmethod
     @log_pipeline
     def remove_stagnate_intervals(
-        cls, df, target_col: str = "CO2", threshold=4
+        cls, df, target_col: str = "CO2", threshold=4, by: str | None = None
     ) -> pd.DataFrame:
         """Remove intervals where the CO2 value is the
-        same for consecutive rows within time-contiguous blocks"""
+        same for consecutive rows within time-contiguous blocks.
+        If `by` is given, a new block is also started whenever
+        the value of `by` changes."""
         return (
             df.assign(
                 time_diff=lambda d: d["DATETIME"].diff(),
                 new_block=lambda d: (d["time_diff"] > pd.Timedelta(minutes=15))
-                | (d[target_col] != d[target_col].shift(1)),
+                | (d[target_col] != d[target_col].shift(1))
+                | cls._group_changes(d, by),
                 block_id=lambda d: d["new_block"].cumsum(),
             )
             .assign(
@@ -167,7 +452,9 @@ class Preprocessor:
 
     @classmethod
     @log_pipeline
-    def day_filter(cls, df: pd.DataFrame, *, min_ratio: float = 0.25) -> pd.DataFrame:
+    def day_filter(
+        cls, df: pd.DataFrame, *, min_ratio: float = 0.25, by: str | None = None
+    ) -> pd.DataFrame:
         """Filter out days with too few data points
         (days with less than min_ratio of the data points).
         This is done to avoid overfitting on days with too
@@ -181,35 +468,66 @@ class Preprocessor:
             df (pd.DataFrame): DataFrame to filter
             min_ratio (float, optional): Minimum ratio of data points
                 required for a day. Defaults to 0.25.
+            by (str, optional): Column to count days within, for DataFrames
+                holding several rooms. Defaults to None.
 
         Returns:
             df (pd.DataFrame): Filtered DataFrame
         """
         min_data_points_required = int(min_ratio * (4 * 24))
-        return df.groupby("DATE").filter(lambda x: len(x) >= min_data_points_required)
+        if by is None:
+            return df.groupby("DATE", observed=True).filter(
+                lambda x: len(x) >= min_data_points_required
+            )
+
+        # rows without a DATE are not part of any day, and are dropped
+        # just like groupby("DATE").filter does
+        day_sizes = df.groupby([by, "DATE"], sort=False, observed=True)[
+            "DATE"
+        ].transform("size")
+        return df[day_sizes.ge(min_data_points_required).to_numpy()]
 
     @classmethod
+    @log_pipeline
     def calculate_kinematic_quantities(
-        cls, df, metric, *, window, prefix=None
+        cls, df, metric, *, window, prefix=None, blocks: np.ndarray | None = None
     ) -> pd.DataFrame:
         """Add rolling velocity, acceleration, and jerk for a metric.
         The rolling quantities are calculated using the gradient of the
-        metric and the given window size. Null values are filled with zeros."""
+        metric and the given window size. Null values are filled with zeros.
+
+        If `blocks` (the first row of each time-contiguous block) is given,
+        the rolling mean and the differences never reach across two blocks,
+        as if they were calculated on each block on its own."""
 
         if prefix is None:
             prefix = metric
 
-        # Calculate the rolling window mean for the metric
-        rolling_metric = df[metric].rolling(window=window).mean()
+        block_starts = cls._block_starts(blocks, len(df))
+
+        # Calculate the rolling window mean for the metric, within each block
+        rolling_metric = (
+            df[metric]
+            .rolling(
+                _BlockWindowIndexer(window_size=window, block_starts=blocks),
+                min_periods=window,
+            )
+            .mean()
+            .to_numpy()
+        )
 
         # First order derivative (velocity)
-        df[f"{prefix}_velocity"] = rolling_metric.diff()
+        df[f"{prefix}_velocity"] = cls._block_diff(rolling_metric, block_starts)
 
         # Second order derivative (acceleration)
-        df[f"{prefix}_acceleration"] = df[f"{prefix}_velocity"].diff()
+        df[f"{prefix}_acceleration"] = cls._block_diff(
+            df[f"{prefix}_velocity"].to_numpy(), block_starts
+        )
 
         # Third order derivative (jerk)
-        df[f"{prefix}_jerk"] = df[f"{prefix}_acceleration"].diff()
+        df[f"{prefix}_jerk"] = cls._block_diff(
+            df[f"{prefix}_acceleration"].to_numpy(), block_starts
+        )
 
         # Log of the metric
         df[f"{prefix}_log"] = np.log(df[metric].fillna(1) + 1)
@@ -221,27 +539,90 @@ class Preprocessor:
         return df
 
     @classmethod
-    def gaussian_smooth(cls, df, metric, *, std_dev=2):
-        """Apply a gaussian filter to a given metric"""
-        df[f"{metric}_smoothed"] = gaussian_filter1d(df[metric], sigma=std_dev)
+    @log_pipeline
+    def gaussian_smooth(
+        cls, df, metric, *, std_dev=2, blocks: np.ndarray | None = None
+    ) -> pd.DataFrame:
+        """Apply a gaussian filter to a given metric.
+
+        If `blocks` (the first row of each time-contiguous block) is given,
+        each block is filtered on its own, with the same kernel and "reflect"
+        boundary handling as `gaussian_filter1d` (truncated at 4 standard
+        deviations), but in one pass over the whole column."""
+        if blocks is None:
+            df[f"{metric}_smoothed"] = gaussian_filter1d(df[metric], sigma=std_dev)
+            return df
+
+        values = df[metric].to_numpy(dtype=float)
+        block_starts = cls._block_starts(blocks, len(df))
+        lengths = np.diff(np.append(block_starts, len(df)))
+        row_starts = np.repeat(block_starts, lengths)
+        row_lengths = np.repeat(lengths, lengths)
+        positions = np.arange(len(df)) - row_starts
+
+        def neighbour(offset: int) -> np.ndarray:
+            """Values `offset` rows away, reflected at the block edges."""
+            reflected = (positions + offset) % (2 * row_lengths)
+            reflected = np.where(
+                reflected >= row_lengths, 2 * row_lengths - 1 - reflected, reflected
+            )
+            return values[row_starts + reflected]
+
+        # the kernel of gaussian_filter1d, summed in the same order
+        radius = int(4.0 * std_dev + 0.5)
+        x = np.arange(-radius, radius + 1)
+        weights = np.exp(-0.5 / (std_dev * std_dev) * x**2)
+        weights = weights / weights.sum()
+
+        smoothed = values * weights[radius]
+        for offset in range(radius, 0, -1):
+            smoothed += (neighbour(-offset) + neighbour(offset)) * weights[
+                radius - offset
+            ]
+
+        df[f"{metric}_smoothed"] = smoothed
         return df
 
     @classmethod
     @log_pipeline
-    def apply_time_group_funcs(cls, df, funcs) -> pd.DataFrame:
+    def apply_time_group_funcs(cls, df, funcs, by: str | None = None) -> pd.DataFrame:
         """Apply a list of functions to each time-contiguous
-        block of data in the DataFrame"""
+        block of data in the DataFrame. If `by` is given, blocks
+        never span two values of `by`.
+
+        The functions are called once, on the whole DataFrame, with the
+        first row of each block as the `blocks` keyword argument, and must
+        keep their calculations within the blocks."""
 
-        # Calculate all the needed columns in one go
-        df["time_diff"] = df["DATETIME"].diff()
-        df["new_block"] = df["time_diff"] > pd.Timedelta(minutes=15)
-        df["block_id"] = df["new_block"].cumsum()
+        df = df.reset_index(drop=True)
+        new_block = (df["DATETIME"].diff() > pd.Timedelta(minutes=15)) | (
+            cls._group_changes(df, by)
+        )
+        blocks = cls._block_starts(np.flatnonzero(new_block.to_numpy()), len(df))
 
         for func, kwargs in funcs:
-            df = df.groupby("block_id").apply(func, **kwargs).reset_index(drop=True)
-        df.drop(columns=["block_id", "new_block", "time_diff"], inplace=True)
+            df = func(df, blocks=blocks, **kwargs)
         return df
 
+    @classmethod
+    def _block_starts(cls, blocks: np.ndarray | None, n_rows: int) -> np.ndarray:
+        """The first row of each block, always including the first row.
+        Without `blocks`, all rows are one block."""
+        if blocks is None or n_rows == 0:
+            return np.zeros(min(n_rows, 1), dtype=np.int64)
+        blocks = np.asarray(blocks, dtype=np.int64)
+        if len(blocks) and blocks[0] == 0:
+            return blocks
+        return np.concatenate([[0], blocks])
+
+    @classmethod
+    def _block_diff(cls, values: np.ndarray, block_starts: np.ndarray) -> np.ndarray:
+        """Like `Series.diff`, but NaN at the first row of every block."""
+        diff = np.empty_like(values, dtype=float)
+        diff[1:] = values[1:] - values[:-1]
+        diff[block_starts] = np.nan
+        return diff
+
     @classmethod
     @log_pipeline
     def add_time_features(cls, df, *, night_start=23, night_end=6):
@@ -253,27 +634,107 @@ class Preprocessor:
             ).astype(int),
         )
 
+    @classmethod
+    def _group_changes(cls, df: pd.DataFrame, by: str | None) -> pd.Series | bool:
+        """Mask of the rows where the value of `by` differs from
+        the previous row. Always False if `by` is None."""
+        if by is None:
+            return False
+        return df[by].ne(df[by].shift(1))
+
     @classmethod
     @log_pipeline
-    def featurize(cls, df: pd.DataFrame) -> pd.DataFrame:
-        """Run the full preprocessing flow on a DataFrame"""
+    def featurize(cls, df: pd.DataFrame, by: str | None = None) -> pd.DataFrame:
+        """Run the full preprocessing flow on a DataFrame.
+
+        If `by` is given, the DataFrame may hold several rooms, identified
+        by the `by` column, and every step is applied per room.
+
+        The flow alternates between steps that need the rows of a room in
+        order (`fill_timeslots`, `add_kinematic_features`) and steps that
+        are plain row filters and column expressions, which is where
+        `pushdown.featurize_table` splits it between pandas and Snowflake."""
         return (
             df.pipe(cls.merge_dt, date="DATE", time="TIME", name="DATETIME")
-            .pipe(cls.add_missing_timeslots)
-            .pipe(cls.interpolate_missing_islands, target_col="CO2", limit=4)
-            .pipe(cls.remove_stagnate_intervals, target_col="CO2", threshold=5)
-            .dropna(subset=["CO2"])
-            .pipe(cls.drop_outliers, bounds={"CO2": (1, 8000)})
-            .pipe(cls.day_filter, min_ratio=0.25)
+            .pipe(cls.fill_timeslots, by=by)
+            .pipe(cls.filter_timeslots, by=by)
+            .pipe(cls.add_kinematic_features, by=by)
             .pipe(
-                cls.apply_time_group_funcs,
-                funcs=[
-                    (cls.gaussian_smooth, dict(metric="CO2", std_dev=2)),
-                    (
-                        cls.calculate_kinematic_quantities,
-                        dict(metric="CO2_smoothed", window=4, prefix="CO2"),
-                    ),
-                ],
+                cls.add_time_features,
+                night_start=cls.NIGHT_START,
+                night_end=cls.NIGHT_END,
             )
-            .pipe(cls.add_time_features, night_start=22, night_end=6)
         )
+
+    @classmethod
+    def fill_timeslots(cls, df: pd.DataFrame, by: str | None = None) -> pd.DataFrame:
+        """Add the missing timeslots, interpolate short gaps in the CO2 and
+        remove the intervals where the sensor is stuck."""
+        return (
+            df.pipe(cls.add_missing_timeslots, by=by)
+            .pipe(cls.interpolate_missing_islands, target_col="CO2", limit=4, by=by)
+            .pipe(cls.remove_stagnate_intervals, target_col="CO2", threshold=5, by=by)
+        )
+
+    @classmethod
+    def filter_timeslots(cls, df: pd.DataFrame, by: str | None = None) -> pd.DataFrame:
+        """Drop the rows without a valid CO2 value, and the days with too
+        few rows left."""
+        return (
+            df.dropna(subset=["CO2"])
+            .pipe(cls.drop_outliers, bounds={"CO2": cls.CO2_BOUNDS})
+            .pipe(cls.day_filter, min_ratio=cls.MIN_DAY_RATIO, by=by)
+        )
+
+    @classmethod
+    def add_kinematic_features(
+        cls, df: pd.DataFrame, by: str | None = None
+    ) -> pd.DataFrame:
+        """Smooth the CO2 within each time-contiguous block, and add its
+        velocity, acceleration, jerk and log."""
+        return cls.apply_time_group_funcs(
+            df,
+            funcs=[
+                (cls.gaussian_smooth, dict(metric="CO2", std_dev=2)),
+                (
+                    cls.calculate_kinematic_quantities,
+                    dict(metric="CO2_smoothed", window=4, prefix="CO2"),
+                ),
+            ],
+            by=by,
+        )
+
+    @classmethod
+    def featurize_rooms(
+        cls, rooms: dict[str, pd.DataFrame], by: str = "SKOLE_ID"
+    ) -> dict[str, pd.DataFrame]:
+        """Run the full preprocessing flow on many rooms at once.
+
+        The rooms are concatenated into a single DataFrame and featurized
+        in one pass with grouped operations, which avoids the per-room
+        pandas overhead of calling `featurize` in a loop. The output is
+        split back into rooms, and is the same as `featurize` per room.
+        Rooms without any rows left after preprocessing are returned
+        as empty DataFrames.
+
+        Args:
+            rooms (dict[str, pd.DataFrame]): The timeslots for each room.
+            by (str, optional): Column identifying the room of each row.
+                Defaults to "SKOLE_ID".
+
+        Returns:
+            dict[str, pd.DataFrame]: The preprocessed DataFrame for each room.
+        """
+        if not rooms:
+            return {}
+
+        featurized = cls.featurize(pd.concat(rooms.values(), ignore_index=True), by=by)
+        grouped = dict(list(featurized.groupby(by, sort=False, observed=True)))
+
+        empty = featurized.iloc[:0]
+        return {
+            name: grouped.get(room[by].iat[0], empty).reset_index(drop=True)
+            if not room.empty
+            else empty
+            for name, room in rooms.items()
+        }
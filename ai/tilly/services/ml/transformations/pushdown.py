@@ -0,0 +1,285 @@
+"""
+Featurization Pushdown Module
+
+This module runs the preprocessing flow of `Preprocessor.featurize` inside
+Snowflake, so that only the featurized and filtered rows of a table are
+transferred, instead of every raw 15-minute row. The flow is split in the
+same phases as `featurize`:
+
+1. `merge_dt`: a Snowpark column expression.
+2. `fill_timeslots`: a vectorized UDTF over the rows of each room, since it
+   needs all rows of the room in order, and scipy for the interpolation.
+3. `filter_timeslots`: Snowpark filters, with a window count of the rows of
+   each day for `day_filter`.
+4. `add_kinematic_features`: a vectorized UDTF over the rows of each room.
+5. `add_time_features`: a Snowpark column expression.
+
+The UDTFs run the pandas code of the `Preprocessor` on each room, so the
+output is the same as `Preprocessor.featurize_rooms` on the same rows. Only
+the preprocessing module is uploaded with the UDTFs (see `_package_zip`), so
+they need pandas, numpy, scipy and loguru, and none of the settings, models
+or API of the tilly package.
+
+The plan has not been run against Snowflake yet, which is why
+FEATURIZE_PUSHDOWN is off by default.
+
+`featurize_local` runs the same plan on a pandas DataFrame: the UDTF handlers
+are called on each room the way Snowflake calls them, and the Snowpark steps
+are mirrored in pandas. It is the stand-in to test the split without
+Snowflake.
+
+Modules:
+    - featurize_table: Featurize a Snowpark DataFrame in Snowflake.
+    - featurize_local: Run the same plan on a pandas DataFrame.
+    - room_handler: The handler class of a per-room UDTF.
+"""
+
+import zipfile
+from functools import lru_cache
+from pathlib import Path
+from tempfile import mkdtemp
+
+import pandas as pd
+from snowflake.snowpark import DataFrame, Window
+from snowflake.snowpark import functions as F
+from snowflake.snowpark.types import (
+    DataType,
+    DoubleType,
+    IntegerType,
+    StructField,
+    StructType,
+    TimestampType,
+)
+
+from tilly.services.ml.transformations.preprocessing import Preprocessor
+
+PACKAGE_DIR = Path(__file__).resolve().parents[3]
+
+# Columns put first by `add_missing_timeslots`, in this order
+STATIC_COLUMNS = ["DATETIME", "ID", "KOMMUNE", "SKOLE", "SKOLE_ID"]
+# Columns added by `add_kinematic_features`, in this order
+KINEMATIC_COLUMNS = [
+    "CO2_smoothed",
+    "CO2_velocity",
+    "CO2_acceleration",
+    "CO2_jerk",
+    "CO2_log",
+]
+
+# Packages of the Snowflake Anaconda channel needed by the preprocessing module
+UDTF_PACKAGES = ["pandas", "numpy", "scipy", "loguru"]
+
+# The module uploaded with the UDTFs, relative to the package directory
+UDTF_MODULE = "tilly/services/ml/transformations/preprocessing.py"
+# Stand-in for `tilly.utils`, whose logger needs the settings of the API.
+# Timing and metrics of the preprocessing steps are not collected in the UDTFs
+UDTF_UTILS = "def log_pipeline(function):\n    return function\n"
+
+
+def fill_columns(columns: list[str]) -> list[str]:
+    """The columns of a room after `fill_timeslots`."""
+    return STATIC_COLUMNS + [col for col in columns if col not in STATIC_COLUMNS]
+
+
+def room_handler(stage: str, columns: list[str], output_columns: list[str]) -> type:
+    """
+    The Handler of a Vectorized UDTF Running a Phase of `featurize` per Room.
+
+    The handler receives the rows of one room, with the columns in the order
+    of `columns`, and returns the result of `Preprocessor.<stage>` on them,
+    with the columns in the order of `output_columns`.
+
+    The class is created here rather than at module level, so that it is
+    pickled by value, and only imports the preprocessing module once it runs
+    in Snowflake.
+
+    Args:
+        stage (str): The Preprocessor phase, e.g. "fill_timeslots".
+        columns (list[str]): The input columns.
+        output_columns (list[str]): The output columns.
+
+    Returns:
+        type: The handler class.
+    """
+
+    class RoomHandler:
+        def end_partition(self, df: pd.DataFrame):
+            from tilly.services.ml.transformations.preprocessing import Preprocessor
+
+            room = df.set_axis(columns, axis="columns")
+            room = room.sort_values("DATETIME", kind="stable", ignore_index=True)
+            yield getattr(Preprocessor, stage)(room)[output_columns]
+
+    RoomHandler.end_partition._sf_vectorized_input = pd.DataFrame
+    return RoomHandler
+
+
+def featurize_table(table: DataFrame, by: str = "SKOLE_ID") -> DataFrame:
+    """
+    Featurize a Table in Snowflake.
+
+    Builds the query of the preprocessing flow on a Snowpark DataFrame of raw
+    timeslots, such as `crud.stream_featurized` does for a table. Nothing is
+    computed until the result is collected.
+
+    Args:
+        table (DataFrame): The raw timeslots, with a `by` column.
+        by (str, optional): Column identifying the room of each row.
+            Defaults to "SKOLE_ID".
+
+    Returns:
+        DataFrame: The featurized timeslots, ordered by room and time, with
+            the columns of `Preprocessor.featurize`.
+
+    Examples:
+        ```python
+        table = session.table('"TrainingTimeslots"').with_column(
+            "SKOLE_ID", crud.room_key()
+        )
+        for chunk in featurize_table(table).to_pandas_batches():
+            ...
+        ```
+    """
+    rows = table.with_column(
+        "DATETIME", F.timestamp_ntz_from_parts(_col("DATE"), _col("TIME"))
+    )
+    types = {_unquote(field.name): field.datatype for field in rows.schema.fields}
+    types["DATETIME"] = TimestampType()
+
+    # missing timeslots, interpolation and stagnant intervals, per room
+    filled_types = {col: types[col] for col in fill_columns(list(types))}
+    rows = _per_room(rows, "fill_timeslots", types, filled_types, by)
+
+    # dropna, drop_outliers and day_filter
+    lo, hi = Preprocessor.CO2_BOUNDS
+    min_rows = int(Preprocessor.MIN_DAY_RATIO * (4 * 24))
+    co2, date = _col("CO2"), _col("DATE")
+    rows = (
+        rows.filter(co2.is_not_null() & ~F.equal_nan(co2) & co2.between(lo, hi))
+        .filter(date.is_not_null())
+        .with_column(
+            '"DAY_ROWS"', F.count(F.lit(1)).over(Window.partition_by(_col(by), date))
+        )
+        .filter(_col("DAY_ROWS") >= min_rows)
+        .drop('"DAY_ROWS"')
+    )
+
+    # smoothing and kinematic quantities, per room
+    featurized_types = {
+        **filled_types,
+        **dict.fromkeys(KINEMATIC_COLUMNS, DoubleType()),
+    }
+    rows = _per_room(rows, "add_kinematic_features", filled_types, featurized_types, by)
+
+    # add_time_features
+    hour = F.hour(_col("DATETIME"))
+    is_night = (hour >= Preprocessor.NIGHT_START) & (hour <= Preprocessor.NIGHT_END)
+    return rows.with_column('"is_night"', is_night.cast(IntegerType())).sort(
+        _col(by), _col("DATETIME")
+    )
+
+
+def featurize_local(df: pd.DataFrame, by: str = "SKOLE_ID") -> pd.DataFrame:
+    """
+    Run the Plan of `featurize_table` on a pandas DataFrame.
+
+    The UDTF handlers are called on the rows of each room, with the columns
+    numbered as Snowflake passes them, and the Snowpark steps are done with
+    the equivalent pandas operations. The output is the same as
+    `Preprocessor.featurize(df, by=by)`, in the order of `featurize_table`.
+
+    Args:
+        df (pd.DataFrame): The raw timeslots, with a `by` column.
+        by (str, optional): Column identifying the room of each row.
+            Defaults to "SKOLE_ID".
+
+    Returns:
+        pd.DataFrame: The featurized timeslots, ordered by room and time.
+    """
+    rows = Preprocessor.merge_dt(df, date="DATE", time="TIME", name="DATETIME")
+    columns = list(rows.columns)
+    rows = _per_room_local(rows, "fill_timeslots", columns, fill_columns(columns), by)
+
+    lo, hi = Preprocessor.CO2_BOUNDS
+    min_rows = int(Preprocessor.MIN_DAY_RATIO * (4 * 24))
+    rows = rows[rows["CO2"].between(lo, hi) & rows["DATE"].notna()]
+    day_rows = rows.groupby([by, "DATE"])["DATE"].transform("size")
+    rows = rows[day_rows.ge(min_rows).to_numpy()]
+
+    columns = list(rows.columns)
+    rows = _per_room_local(
+        rows, "add_kinematic_features", columns, columns + KINEMATIC_COLUMNS, by
+    )
+
+    hour = rows["DATETIME"].dt.hour
+    is_night = (hour >= Preprocessor.NIGHT_START) & (hour <= Preprocessor.NIGHT_END)
+    return rows.assign(is_night=is_night.astype(int))
+
+
+def _per_room(
+    rows: DataFrame,
+    stage: str,
+    types: dict[str, DataType],
+    output_types: dict[str, DataType],
+    by: str,
+) -> DataFrame:
+    """Run a Preprocessor phase on each room, as a temporary vectorized UDTF."""
+    columns, output_columns = list(types), list(output_types)
+    udtf = rows.session.udtf.register(
+        room_handler(stage, columns, output_columns),
+        output_schema=StructType(
+            [StructField(_quote(col), output_types[col]) for col in output_columns]
+        ),
+        input_types=list(types.values()),
+        packages=UDTF_PACKAGES,
+        imports=[str(_package_zip())],
+    )
+    return rows.select(
+        udtf(*[_col(col) for col in columns]).over(
+            partition_by=_col(by), order_by=_col("DATETIME")
+        )
+    )
+
+
+def _per_room_local(
+    rows: pd.DataFrame, stage: str, columns: list[str], output_columns: list, by: str
+) -> pd.DataFrame:
+    """Call the UDTF handler of a phase on each room, like Snowflake does."""
+    handler = room_handler(stage, columns, output_columns)()
+    rooms = [
+        result
+        for _, room in rows[columns].groupby(by, sort=True)
+        for result in handler.end_partition(room.set_axis(range(len(columns)), axis=1))
+    ]
+    if not rooms:
+        return pd.DataFrame(columns=output_columns)
+    return pd.concat(rooms, ignore_index=True)
+
+
+@lru_cache(maxsize=None)
+def _package_zip() -> Path:
+    """A zip of the preprocessing module, to import in the UDTFs.
+
+    The module keeps its place in the tilly package, but the packages around
+    it are empty, so importing it does not import the rest of tilly, and
+    `tilly.utils` is replaced by UDTF_UTILS."""
+    path = Path(mkdtemp()) / "tilly.zip"
+    module = Path(UDTF_MODULE)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for package in reversed(module.parents[:-1]):
+            archive.writestr(str(package / "__init__.py"), "")
+        archive.writestr("tilly/utils/__init__.py", UDTF_UTILS)
+        archive.write(PACKAGE_DIR.parent / module, str(module))
+    return path
+
+
+def _quote(name: str) -> str:
+    return f'"{name}"'
+
+
+def _unquote(name: str) -> str:
+    return name[1:-1] if name.startswith('"') else name
+
+
+def _col(name: str):
+    return F.col(_quote(name))
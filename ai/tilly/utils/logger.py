@@ -10,7 +10,8 @@ Main Components:
     - `log_pipeline` function: A decorator for logging various details about 
         functions. It wraps around any callable and logs its execution time, 
         the shape of its output (assuming it returns a Pandas DataFrame), and
-        the function name.
+        the function name. When `METRICS` is on, it also reports every call
+        to `tilly.utils.metrics.metrics`.
     - `log_size` function: A Pandas pipe function that logs the size of the
         DataFrame and the number of unique values in a specified column.
 
@@ -27,7 +28,8 @@ Usage:
         ```
 
 The `log_pipeline` function uses the `DEBUG` setting from `tilly.config` 
-to decide whether to display verbose logs or not.
+to decide whether to display verbose logs or not, and the `METRICS` setting
+to decide whether to collect metrics.
 
 Example:
     >>> from tilly.logging_utils import log_pipeline, log_size
@@ -46,7 +48,8 @@ from typing import Callable
 from functools import wraps
 import pandas as pd
 
-from tilly.config import DEBUG
+from tilly.config import DEBUG, METRICS
+from tilly.utils.metrics import metrics, rss_bytes
 
 
 # setting for stdout and file logging
@@ -62,15 +65,23 @@ logger.addHandler(stdout_handler)
 
 
 # pipeline logger
-def log_pipeline(function: Callable, verbose=DEBUG) -> Callable:
+def log_pipeline(function: Callable, verbose=DEBUG, collect=METRICS) -> Callable:
     @wraps(function)
     def wrapper(*args, **kwargs):
-        if not verbose:
+        if not (verbose or collect):
             return function(*args, **kwargs)
 
+        rss = rss_bytes() if collect else 0
         start_time = time.perf_counter()
         result = function(*args, **kwargs)
         time_taken = time.perf_counter() - start_time
+        if collect:
+            metrics.observe_call(
+                function.__name__, args, kwargs, result, time_taken, rss
+            )
+        if not verbose:
+            return result
+
         logger.debug(
             f"{function.__name__} completed | "
             + f"shape = {result.shape:} | "
@@ -0,0 +1,240 @@
+"""
+This script contains the pipeline metrics of the Tilly application: timings,
+row counts and memory deltas of every preprocessing stage, aggregated in
+memory and rendered in the Prometheus text format at `/metrics`.
+
+Main Components:
+    - `PipelineMetrics`: Thread-safe, in-memory aggregation of stage calls:
+        - a histogram of the duration of each stage,
+        - the rows going in and out of each stage,
+        - the change in resident memory (RSS) of the process during each stage,
+        - the slowest calls of each stage, with the room they ran on.
+    - `metrics`: The global `PipelineMetrics` of the application, which
+        `log_pipeline` reports to when `METRICS` is on.
+
+The instrumentation is cheap enough to leave on in production: each stage
+call costs two clock reads, two reads of `/proc/self/statm` and a lock.
+With `METRICS` off, `log_pipeline` does not time anything at all.
+
+Rooms are not a label of the histograms, since thousands of rooms would
+make thousands of series. Instead, the `top_n` slowest calls of each stage
+are kept, labelled with their room. Calls on several rooms at once (with
+`by`) are labelled "batch".
+
+Example:
+    >>> from tilly.utils.metrics import metrics
+    >>> metrics.observe("featurize", 0.42, rows_in=960, rows_out=912, room="A_1")
+    >>> print(metrics.render())
+"""
+
+import os
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from threading import Lock
+
+import pandas as pd
+
+# upper bounds of the duration buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """The resident memory of the process, or 0 where it is not available."""
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def describe(args: tuple, kwargs: dict) -> tuple[pd.DataFrame | None, str | None]:
+    """The input DataFrame of a stage call, and the room it runs on.
+
+    The room is the SKOLE_ID of the DataFrame, or "batch" if it holds
+    several rooms (when `by` is given, or its first and last rows differ)."""
+    df = next(
+        (a for a in (*args, *kwargs.values()) if isinstance(a, pd.DataFrame)), None
+    )
+    if df is None or df.empty or "SKOLE_ID" not in df.columns:
+        return df, None
+    first, last = df["SKOLE_ID"].iat[0], df["SKOLE_ID"].iat[-1]
+    if kwargs.get("by") is not None or first != last:
+        return df, "batch"
+    return df, str(first)
+
+
+@dataclass
+class StageStats:
+    """The aggregated calls of a single stage."""
+
+    buckets: list[int] = field(default_factory=lambda: [0] * len(DURATION_BUCKETS))
+    count: int = 0
+    seconds: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    memory_delta: int = 0
+    max_memory_delta: int = 0
+    slowest: list[tuple[float, str]] = field(default_factory=list)
+
+
+class PipelineMetrics:
+    """In-memory metrics of the pipeline stages.
+
+    Attributes:
+        - top_n (int): Number of slowest calls to keep per stage.
+    """
+
+    def __init__(self, top_n: int = 10):
+        self.top_n = top_n
+        self.started = time.time()
+        self._stages: dict[str, StageStats] = {}
+        self._lock = Lock()
+
+    def observe(
+        self,
+        stage: str,
+        seconds: float,
+        rows_in: int | None = None,
+        rows_out: int | None = None,
+        memory_delta: int = 0,
+        room: str | None = None,
+    ) -> None:
+        """Record a call of a stage.
+
+        Args:
+            stage (str): The name of the stage, e.g. "add_missing_timeslots".
+            seconds (float): The duration of the call.
+            rows_in (int, optional): Rows of the input DataFrame.
+            rows_out (int, optional): Rows of the output DataFrame.
+            memory_delta (int, optional): Change in resident memory, in bytes.
+            room (str, optional): The room the stage ran on, if known.
+        """
+        with self._lock:
+            stats = self._stages.setdefault(stage, StageStats())
+            bucket = bisect_left(DURATION_BUCKETS, seconds)
+            if bucket < len(DURATION_BUCKETS):
+                stats.buckets[bucket] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            stats.rows_in += rows_in or 0
+            stats.rows_out += rows_out or 0
+            stats.memory_delta += memory_delta
+            stats.max_memory_delta = max(stats.max_memory_delta, memory_delta)
+
+            if room is not None:
+                self._update_slowest(stats, seconds, room)
+
+    def _update_slowest(self, stats: StageStats, seconds: float, room: str) -> None:
+        """Keep the `top_n` slowest calls of a stage, one per room."""
+        previous = next((s for s, r in stats.slowest if r == room), None)
+        if previous is not None and previous >= seconds:
+            return
+        if previous is None and len(stats.slowest) >= self.top_n:
+            if seconds <= stats.slowest[-1][0]:
+                return
+        slowest = [(s, r) for s, r in stats.slowest if r != room]
+        slowest.append((seconds, room))
+        stats.slowest = sorted(slowest, reverse=True)[: self.top_n]
+
+    def observe_call(
+        self, stage: str, args: tuple, kwargs: dict, result, seconds: float, rss: int
+    ) -> None:
+        """Record a stage call from its arguments and result, as done by
+        `log_pipeline`. `rss` is the resident memory before the call."""
+        df, room = describe(args, kwargs)
+        self.observe(
+            stage,
+            seconds,
+            rows_in=len(df) if df is not None else None,
+            rows_out=len(result) if isinstance(result, pd.DataFrame) else None,
+            memory_delta=rss_bytes() - rss if rss else 0,
+            room=room,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self.started = time.time()
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            stages = sorted(self._stages.items())
+            lines = [
+                "# HELP tilly_stage_duration_seconds Duration of pipeline stages.",
+                "# TYPE tilly_stage_duration_seconds histogram",
+            ]
+            for stage, stats in stages:
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(
+                        f'tilly_stage_duration_seconds_bucket{{stage="{stage}",'
+                        + f'le="{bound}"}} {cumulative}'
+                    )
+                lines += [
+                    f'tilly_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}}'
+                    + f" {stats.count}",
+                    f'tilly_stage_duration_seconds_sum{{stage="{stage}"}} '
+                    + f"{stats.seconds:.6f}",
+                    f'tilly_stage_duration_seconds_count{{stage="{stage}"}} '
+                    + f"{stats.count}",
+                ]
+
+            for name, help_text, attr, kind in (
+                ("rows_in_total", "Rows into pipeline stages.", "rows_in", "counter"),
+                (
+                    "rows_out_total",
+                    "Rows out of pipeline stages.",
+                    "rows_out",
+                    "counter",
+                ),
+                (
+                    "memory_delta_bytes",
+                    "Net change in resident memory during pipeline stages.",
+                    "memory_delta",
+                    "gauge",
+                ),
+                (
+                    "max_memory_delta_bytes",
+                    "Largest change in resident memory during a pipeline stage.",
+                    "max_memory_delta",
+                    "gauge",
+                ),
+            ):
+                lines += [
+                    f"# HELP tilly_stage_{name} {help_text}",
+                    f"# TYPE tilly_stage_{name} {kind}",
+                ]
+                lines += [
+                    f'tilly_stage_{name}{{stage="{stage}"}} {getattr(stats, attr)}'
+                    for stage, stats in stages
+                ]
+
+            lines += [
+                "# HELP tilly_stage_slowest_seconds Slowest calls of pipeline stages.",
+                "# TYPE tilly_stage_slowest_seconds gauge",
+            ]
+            for stage, stats in stages:
+                lines += [
+                    f'tilly_stage_slowest_seconds{{stage="{stage}",'
+                    + f'room="{_escape(room)}"}} {seconds:.6f}'
+                    for seconds, room in stats.slowest
+                ]
+
+            lines += [
+                "# HELP tilly_metrics_start_time_seconds Start of the metrics.",
+                "# TYPE tilly_metrics_start_time_seconds gauge",
+                f"tilly_metrics_start_time_seconds {self.started:.3f}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = PipelineMetrics()